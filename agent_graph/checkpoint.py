@@ -0,0 +1,360 @@
+import atexit
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import zlib
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.types import TASKS, ChannelProtocol
+from termcolor import colored
+from config.settings import checkpoint_settings
+from utils.helper_functions import log_function_call
+from utils.tracing import trace_event
+
+# Serialized values at least this big are zlib compressed. The type stored next to them gets this suffix.
+COMPRESSED_SUFFIX = "+zlib"
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+        Durable checkpoint store for the compiled graph, kept in SQLite and keyed by thread id.
+
+        With a checkpointer, LangGraph saves the state after every step of a run. A run that fails part way
+        (e.g. the scraper crashes or Serper times out) can then be resumed by invoking the workflow again with
+        None as the input and the same thread id: the steps that already finished - and the writes of nodes that
+        succeeded in the failed step - are loaded instead of being run again, so their LLM calls are not paid twice.
+
+        The state (HumanMessage lists included) is serialized with the graph's serializer and zlib compressed.
+        Writes are batched: put() and put_writes() only queue the rows and a background thread commits them in one
+        transaction every flush_interval seconds or once batch_size rows are waiting, so saving a checkpoint adds
+        almost nothing to each step. Reads flush the queue first, and so does close() (also run at exit). Rows whose
+        commit fails stay queued and are tried again on the next flush.
+
+        Only the newest keep_per_thread checkpoints of each thread are kept, and threads that have not been written
+        to for max_age_days are deleted when the store is opened, so the file does not grow without bound.
+
+        Modelled on langgraph's MemorySaver.
+
+        Args:
+            path (str): The SQLite file.
+            batch_size (int, optional): Queued rows that trigger an immediate flush. Defaults to 50.
+            flush_interval (float, optional): Longest time (seconds) a row waits in the queue. Defaults to 0.5.
+            compress_min_bytes (int, optional): Values at least this big are compressed. Defaults to 512.
+            keep_per_thread (int, optional): Newest checkpoints kept for each thread. None keeps them all. Defaults to 20.
+            max_age_days (float, optional): Days after its last checkpoint that a thread is deleted. None keeps them. Defaults to 30.
+            serde (SerializerProtocol, optional): Serializer. Defaults to langgraph's JsonPlusSerializer.
+    """
+    @log_function_call
+    def __init__(self, path: str, batch_size: int = 50, flush_interval: float = 0.5, compress_min_bytes: int = 512,
+                 keep_per_thread: Optional[int] = 20, max_age_days: Optional[float] = 30,
+                 *, serde: Optional[SerializerProtocol] = None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress_min_bytes = compress_min_bytes
+        # Resuming needs the parent of the latest checkpoint too
+        self.keep_per_thread = max(2, keep_per_thread) if keep_per_thread is not None else None
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._wake = threading.Event()
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # Commits are already batched, so fsync on every one is not needed - WAL keeps the file consistent
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS checkpoints (
+                                            thread_id TEXT NOT NULL,
+                                            checkpoint_ns TEXT NOT NULL DEFAULT '',
+                                            checkpoint_id TEXT NOT NULL,
+                                            parent_checkpoint_id TEXT,
+                                            checkpoint_type TEXT NOT NULL,
+                                            checkpoint BLOB NOT NULL,
+                                            metadata_type TEXT NOT NULL,
+                                            metadata BLOB NOT NULL,
+                                            created_at REAL NOT NULL DEFAULT 0,
+                                            PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))""")
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(checkpoints)")]
+            if "created_at" not in columns:
+                # Stores made before checkpoints were pruned - their rows count as written now
+                self._connection.execute("ALTER TABLE checkpoints ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+                self._connection.execute("UPDATE checkpoints SET created_at = ?", (time.time(),))
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS writes (
+                                            thread_id TEXT NOT NULL,
+                                            checkpoint_ns TEXT NOT NULL DEFAULT '',
+                                            checkpoint_id TEXT NOT NULL,
+                                            task_id TEXT NOT NULL,
+                                            idx INTEGER NOT NULL,
+                                            channel TEXT NOT NULL,
+                                            value_type TEXT NOT NULL,
+                                            value BLOB NOT NULL,
+                                            PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))""")
+            if self.max_age_days is not None:
+                self._delete_old_threads(time.time() - self.max_age_days * 86400)
+
+        self._writer = threading.Thread(target=self._write_behind, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+
+    def __enter__(self) -> "SQLiteCheckpointSaver":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "SQLiteCheckpointSaver":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    ############################# Serialization ####################################
+
+    def _dumps(self, value: Any) -> Tuple[str, bytes]:
+        value_type, data = self.serde.dumps_typed(value)
+        if len(data) >= self.compress_min_bytes:
+            return value_type + COMPRESSED_SUFFIX, zlib.compress(data, 6)
+        return value_type, data
+
+    def _loads(self, value_type: str, data: bytes) -> Any:
+        if value_type.endswith(COMPRESSED_SUFFIX):
+            value_type, data = value_type[:-len(COMPRESSED_SUFFIX)], zlib.decompress(data)
+        return self.serde.loads_typed((value_type, data))
+
+    ############################# Write-behind queue ####################################
+
+    def _queue(self, rows: List[Tuple[str, tuple]]):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The checkpoint store has been closed")
+            self._pending.extend(rows)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _write_behind(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # e.g. the disk is full or another process has the database locked. The rows are still queued,
+                # so keep going and try them again on the next flush.
+                print(colored(f"Saving checkpoints to {self.path} failed, will retry: {e!r}", "red"))
+                trace_event("checkpoint_flush_failed", path=self.path, error=repr(e), queued=len(self._pending))
+
+    def flush(self):
+        """
+            Commits every queued checkpoint and write in a single transaction, then prunes the threads written to.
+            If the commit fails the rows are put back at the front of the queue and the error is raised.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            try:
+                with self._connection:
+                    for sql, params in rows:
+                        self._connection.execute(sql, params)
+                    if self.keep_per_thread is not None:
+                        self._prune({params[:2] for sql, params in rows if sql.startswith("INSERT OR REPLACE INTO checkpoints")})
+            except Exception:
+                self._pending = rows + self._pending
+                raise
+
+    def _prune(self, threads: set):
+        # Must be called with the lock held, inside the flush transaction. Keeps the newest keep_per_thread
+        # checkpoints of each (thread id, namespace) and the writes that belong to them.
+        for thread_id, checkpoint_ns in threads:
+            kept = """SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                      ORDER BY checkpoint_id DESC LIMIT ?"""
+            self._connection.execute(f"""DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                                         AND checkpoint_id NOT IN ({kept})""",
+                                     (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_per_thread))
+            self._connection.execute("""DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN
+                                        (SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)""",
+                                     (thread_id, checkpoint_ns, thread_id, checkpoint_ns))
+
+    def _delete_old_threads(self, cutoff: float):
+        # Must be called inside a transaction
+        self._connection.execute("""DELETE FROM checkpoints WHERE thread_id IN
+                                    (SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(created_at) < ?)""", (cutoff,))
+        self._connection.execute("DELETE FROM writes WHERE thread_id NOT IN (SELECT DISTINCT thread_id FROM checkpoints)")
+
+    def close(self):
+        """
+            Flushes the queue and stops the background writer.
+        """
+        if self._closed:
+            return
+        self.flush()
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+
+    ############################# BaseCheckpointSaver ####################################
+
+    def _checkpoint_tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        # Must be called with the lock held
+        checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        writes = self._connection.execute("""SELECT task_id, channel, value_type, value FROM writes
+                                             WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                                             ORDER BY task_id, idx""", (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        sends = []
+        if parent_checkpoint_id:
+            sends = self._connection.execute("""SELECT value_type, value FROM writes
+                                                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ?
+                                                ORDER BY task_id, idx""", (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS)).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**self._loads(checkpoint_type, checkpoint),
+                        "pending_sends": [self._loads(value_type, value) for value_type, value in sends]},
+            metadata=self._loads(metadata_type, metadata),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                            "checkpoint_id": parent_checkpoint_id}} if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, self._loads(value_type, value)) for task_id, channel, value_type, value in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+            Gets the checkpoint given by config["configurable"]["checkpoint_id"], or the latest one for the thread.
+        """
+        self.flush()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        select = """SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata
+                    FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"""
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._connection.execute(select + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self._connection.execute(select + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+            return self._checkpoint_tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """
+            Lists checkpoints, newest first, optionally for one thread / namespace and filtered by metadata.
+        """
+        self.flush()
+        conditions, params = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_checkpoint_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            rows = self._connection.execute(f"""SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+                                                       checkpoint_type, checkpoint, metadata_type, metadata
+                                                FROM checkpoints {where} ORDER BY checkpoint_id DESC""", params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self._loads(row[6], row[7])
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                checkpoint_tuple = self._checkpoint_tuple(row[0], row[1], row[2:])
+            yield checkpoint_tuple
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """
+            Queues a checkpoint to be saved and returns the config that points at it.
+        """
+        checkpoint = checkpoint.copy()
+        checkpoint.pop("pending_sends")  # type: ignore[misc]
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        self._queue([("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                       *self._dumps(checkpoint), *self._dumps(metadata), time.time()))])
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        """
+            Queues the writes a node made, so a node that finished is not run again when its step is resumed.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        self._queue([("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                      (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+                       *self._dumps(value)))
+                     for idx, (channel, value) in enumerate(writes)])
+
+    # Queueing is only an in-memory append, so the async versions do it on the event loop rather than in a thread
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        for checkpoint_tuple in self.list(config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        return self.put_writes(config, writes, task_id)
+
+    def get_next_version(self, current: Optional[str], channel: ChannelProtocol) -> str:
+        # Same string versions as MemorySaver
+        if current is None:
+            current_version = 0
+        elif isinstance(current, int):
+            current_version = current
+        else:
+            current_version = int(current.split(".")[0])
+        return f"{current_version + 1:032}.{random.random():016}"
+
+_checkpointer: Optional[SQLiteCheckpointSaver] = None
+_checkpointer_lock = threading.Lock()
+
+def get_checkpointer() -> Optional[SQLiteCheckpointSaver]:
+    """
+        Gets the process-wide checkpoint store, or None if it is disabled in checkpoint_settings.
+    """
+    global _checkpointer
+    if not checkpoint_settings["enabled"]:
+        return None
+    if _checkpointer is None:
+        with _checkpointer_lock:
+            if _checkpointer is None:
+                _checkpointer = SQLiteCheckpointSaver(path=checkpoint_settings["path"],
+                                                      batch_size=checkpoint_settings["batch_size"],
+                                                      flush_interval=checkpoint_settings["flush_interval"],
+                                                      compress_min_bytes=checkpoint_settings["compress_min_bytes"],
+                                                      keep_per_thread=checkpoint_settings["keep_per_thread"],
+                                                      max_age_days=checkpoint_settings["max_age_days"])
+                # Anything still queued is written before the process exits
+                atexit.register(_checkpointer.close)
+    return _checkpointer
@@ -1,15 +1,29 @@
 from agents.agents import SearchPlannerAgent, ResultSelectorAgent, EndNodeAgent
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph
 from prompts.prompts import search_planner_prompt_template, result_selector_prompt_template
+from retrieval.retriever import aretrieve_evidence, retrieve_evidence, route_after_retrieval
 from states.state import AgentGraphState, get_agent_graph_state
-from tools.google_serper import get_google_serper
-from tools.website_scraper import scrape_website
+from tools.google_serper import aget_google_serper, get_google_serper
+from tools.website_scraper import ascrape_websites, scrape_websites
 from utils.helper_functions import log_function_call
-from models_config import models
-from typing import Dict, Union
+from utils.metrics import instrument_node
+from utils.tracing import traced
+from models_config import models_config as models
+from typing import Callable, Dict, Union
+
+def instrumented_node(name: str, func: Callable, afunc: Callable) -> RunnableLambda:
+    """
+        Wraps the sync and async versions of a node in one runnable. workflow.stream/invoke call the first and
+        workflow.astream/ainvoke the second, so many questions can share one event loop. Each call is recorded
+        as an "info" level tracing span named after the node, and its latency, I/O wait, tokens, HTTP bytes
+        and cost are added to the metrics collector (see utils/metrics.py).
+    """
+    return RunnableLambda(instrument_node(name, traced(func, level="info", name=name)),
+                          afunc=instrument_node(name, traced(afunc, level="info", name=name)))
 
 @log_function_call
-def create_graph(models: Dict[str, Dict[str, Union[str, None]]], stop=None, model_endpoint=None, temperature=0):
+def create_graph(models: Dict[str, Dict[str, Union[str, None]]], stop=None, model_endpoint=None, temperature=0, stream=False):
     """
         Creates the workflow of LLM agents.
 
@@ -18,6 +32,7 @@ def create_graph(models: Dict[str, Dict[str, Union[str, None]]], stop=None, mode
         stop (str, optional): Condition (word/character) that decides when the agent should stop generating a response.
         model_endpoint (str, optional): Local model endpoint if not using cloud agent.
         temperature (float, optional): Model temperature i.e. level of model creativity.
+        stream (bool, optional): Stream LLM tokens to the run's callbacks as they arrive (see utils/streaming.py).
 
     Returns:
         StateGraph: A graph representing the workflow of LLM agents.
@@ -34,25 +49,48 @@ def create_graph(models: Dict[str, Dict[str, Union[str, None]]], stop=None, mode
         return SearchPlannerAgent(state=state, 
                                    model=models.models["openai"]["model"], 
                                    server=models.models["openai"]["server"], 
-                                   temperature=temperature, stop=stop)
+                                   temperature=temperature, stop=stop, stream=stream,
+                                   node="search_planner")
     
+    def search_planner_inputs(state):
+        return dict(research_question=state["research_question"], 
+                    feedback=lambda: get_agent_graph_state(state=state, state_key="reviewer_response"), 
+                    prompt=search_planner_prompt_template)
+
     def get_search_planner_invoke(state):
-        return search_planner_agent(state).invoke(
-            research_question=state["research_question"], 
-            feedback=lambda: get_agent_graph_state(state=state, state_key="reviewer_response"), 
-            prompt=search_planner_prompt_template
-        )
+        return search_planner_agent(state).invoke(**search_planner_inputs(state))
 
-    graph.add_node("search_planner", get_search_planner_invoke)
+    async def get_search_planner_ainvoke(state):
+        return await search_planner_agent(state).ainvoke(**search_planner_inputs(state))
+
+    # Each node has a sync and an async version (see instrumented_node).
+    graph.add_node("search_planner", instrumented_node("search_planner", get_search_planner_invoke, get_search_planner_ainvoke))
 
     ############################# Set and execute search tool node ####################################
     # Add the web search tool node. This node performs a web search, based on instructions from the planner node (previous node).
     # Uses the Google Serper tool and only uses the last response from the planner.
-    graph.add_node("web_search_tool",
-        lambda state: get_google_serper(state=state, 
-                                        get_plan=lambda: get_agent_graph_state(state=state, 
-                                                                               state_key="search_planner_response", 
-                                                                               retrieve_all=False)))
+    def latest_plan(state):
+        return lambda: get_agent_graph_state(state=state, 
+                                             state_key="search_planner_response", 
+                                             retrieve_all=False)
+
+    async def web_search_ainvoke(state):
+        return await aget_google_serper(state=state, get_plan=latest_plan(state))
+
+    graph.add_node("web_search_tool", instrumented_node("web_search_tool",
+                                                        lambda state: get_google_serper(state=state, get_plan=latest_plan(state)),
+                                                        web_search_ainvoke))
+
+    ############################# Set and execute retrieval node ####################################
+    # Add the retrieval node. This node searches the local corpus of previously scraped pages for the research question
+    # and the planner's search term. If it finds enough close matches, they become the scraper_response and the web
+    # search, result selection and scraping are skipped (see retrieval/retriever.py).
+    async def retrieval_ainvoke(state):
+        return await aretrieve_evidence(state=state, get_plan=latest_plan(state))
+
+    graph.add_node("retrieval_tool", instrumented_node("retrieval_tool",
+                                                       lambda state: retrieve_evidence(state=state, get_plan=latest_plan(state)),
+                                                       retrieval_ainvoke))
 
     ############################# Set and execute result selector node ####################################
     # Add the result selector agent node. This node selects relevant search results based on the
@@ -62,33 +100,45 @@ def create_graph(models: Dict[str, Dict[str, Union[str, None]]], stop=None, mode
                                    model=models.models["openai"]["model"], 
                                    server=models.models["openai"]["server"], 
                                    temperature=temperature, 
-                                   stop=stop)
+                                   stop=stop,
+                                   stream=stream,
+                                   node="result_selector")
+
+    def result_selector_inputs(state):
+        return dict(research_question=state["research_question"], 
+                    feedback=lambda: get_agent_graph_state(state=state, 
+                                                           state_key="reviewer_response", 
+                                                           retrieve_all=True), 
+                    web_search_result=lambda: get_agent_graph_state(state=state, 
+                                                                    state_key="web_search_response", 
+                                                                    retrieve_all=False),
+                    previous_selections=lambda: get_agent_graph_state(state=state, 
+                                                                      state_key="result_selector_response", 
+                                                                      retrieve_all=True),
+                    prompt=result_selector_prompt_template)
     
     def result_selector_agent_invoke(state):
-        return result_selector_agent.invoke(research_question=state["research_question"], 
-                                                            feedback=lambda: get_agent_graph_state(state=state, 
-                                                                                                 state_key="reviewer_response", 
-                                                                                                 retrieve_all=True), 
-                                                            web_search_result=lambda: get_agent_graph_state(state=state, 
-                                                                                                            state_key="web_search_response", 
-                                                                                                            retrieve_all=False),
-
-                                                            previous_selections=lambda: get_agent_graph_state(state=state, 
-                                                                                                              state_key="result_selector_response", 
-                                                                                                              retrieve_all=True),
-                
-                                                            prompt=result_selector_prompt_template)
-    
+        return result_selector_agent(state).invoke(**result_selector_inputs(state))
 
-    graph.add_node("result_selector_agent", result_selector_agent_invoke)
+    async def result_selector_agent_ainvoke(state):
+        return await result_selector_agent(state).ainvoke(**result_selector_inputs(state))
+
+    graph.add_node("result_selector_agent", instrumented_node("result_selector_agent", result_selector_agent_invoke, result_selector_agent_ainvoke))
 
     ############################# Set and execute scraper tool node ####################################
-    # Add the scraper tool node. This node scrapes the selected website that was chosen by the result selector node.
-    graph.add_node("scraper_tool", lambda state: scrape_website(state=state, 
-                                                                selected_website=lambda: get_agent_graph_state(
-                                                                state=state, 
-                                                                state_key="result_selector_response", 
-                                                                retrieve_all=True)))
+    # Add the scraper tool node. This node scrapes the selected websites that were chosen by the result selector node.
+    # The pages are scraped in parallel and each one adds its own entry to scraper_response.
+    def selected_websites(state):
+        return lambda: get_agent_graph_state(state=state, 
+                                             state_key="result_selector_response", 
+                                             retrieve_all=True)
+
+    async def scraper_ainvoke(state):
+        return await ascrape_websites(state=state, selected_website=selected_websites(state))
+
+    graph.add_node("scraper_tool", instrumented_node("scraper_tool",
+                                                     lambda state: scrape_websites(state=state, selected_website=selected_websites(state)),
+                                                     scraper_ainvoke))
 
     # Add the reviewer node. This node reviews the scraped data and decides whether it answers the user's query.
     # graph.add_node("reviewer", lambda graph_state: ReviewerAgent(
@@ -102,7 +152,8 @@ def create_graph(models: Dict[str, Dict[str, Union[str, None]]], stop=None, mode
 
     # Define graph edges
     graph.set_entry_point("search_planner")
-    graph.add_edge("search_planner", "web_search_tool")
+    graph.add_edge("search_planner", "retrieval_tool")
+    graph.add_conditional_edges("retrieval_tool", route_after_retrieval, {"web_search_tool": "web_search_tool", "end": "end"})
     graph.add_edge("web_search_tool", "result_selector_agent")
     graph.add_edge("result_selector_agent", "scraper_tool")
     graph.add_edge("scraper_tool", "end")
@@ -110,15 +161,17 @@ def create_graph(models: Dict[str, Dict[str, Union[str, None]]], stop=None, mode
     return graph
 
 @log_function_call
-def compile_graph(graph):
+def compile_graph(graph, checkpointer=None):
     """
     Compiles the state graph into a `CompiledGraph` object.
 
     Args:
         graph (StateGraph): A class that defines the state of the agents.
+        checkpointer (BaseCheckpointSaver, optional): Saves the state after every step so failed runs can be
+            resumed (see agent_graph/checkpoint.py). Runs then need a "thread_id" in config["configurable"].
 
     Returns:
         "CompiledStateGraph": 
     """
-    workflow = graph.compile()
+    workflow = graph.compile(checkpointer=checkpointer)
     return workflow
\ No newline at end of file
@@ -1,16 +1,41 @@
 from langchain_core.messages import HumanMessage
-from models.models import OpenAI_LLM
+from models.llm_cache import get_llm_cache, make_cache_key
+from models.models import get_chat_client
+from models.router import get_model_router
+from prompts.prompt_builder import PromptBuilder
 from prompts.prompts import reviewer_prompt_template, reporter_presenter_prompt_template, writer_prompt_template
+import httpx
+import openai
 import requests
 from states.state import AgentGraphState
 from termcolor import colored
+import time
 from typing import Callable, Optional, Any, List
-from utils.helper_functions import get_current_utc_datetime
 from utils.helper_functions import log_function_call
+from utils.http_clients import async_http_request, async_http_stream, http_request
+from utils.metrics import record_io, record_tokens
+from utils.rate_limiter import acall_with_rate_limit, call_with_rate_limit, get_rate_limiter
+from utils.single_flight import get_single_flight
+from utils.streaming import aemit_token, emit_token, parse_stream_chunk, stream_chunk_token
+
+# What an LLM call can fail with. With routing enabled any agent can end up calling a local server (through requests,
+# or httpx when async) or OpenAI (through its SDK), whatever model/server it was created with.
+LLM_CALL_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError, openai.OpenAIError, KeyError)
+
+def llm_error_response(error: Exception) -> set:
+    """
+        Turns an error in LLM_CALL_ERRORS into the response the agents put in the state instead of the LLM's.
+    """
+    if isinstance(error, (requests.exceptions.HTTPError, httpx.HTTPStatusError, openai.APIStatusError)):
+        return {f"HTTP error occurred: {error}"}
+    if isinstance(error, KeyError):
+        return {f"Key error occurred: {error}"}
+    return {f"Request error occurred: {error}"}
 
 class Agent():
     @log_function_call
-    def __init__(self, state: AgentGraphState, model: str=None, server: str=None, temperature: float=0, stop: str=None):
+    def __init__(self, state: AgentGraphState, model: str=None, server: str=None, temperature: float=0, stop: str=None,
+                 use_cache: bool=True, stream: bool=False, node: str=None):
         """
         The base class for other agents.
 
@@ -20,28 +45,261 @@ class Agent():
             server (str): The endpoint of the model's API
             temperature (float, optional): Model temperature i.e. level of model creativity.
             stop (str, optional): Condition (word/character) that decides when the agent should stop generating a response.
+            use_cache (bool, optional): Reuse cached responses for identical temperature 0 calls. Defaults to True.
+            stream (bool, optional): Stream the LLM response and push each token to the run's callbacks as it arrives. Defaults to False.
+            node (str, optional): The graph node the agent runs in. When given (and routing is enabled), the model router picks
+                the endpoint for each call from the node's policy and model/server are only the starting values.
         """
         self.state = state
         self.model = model
         self.server = server
         self.temperature = temperature
         self.stop = stop
+        self.use_cache = use_cache
+        self.stream = stream
+        self.node = node
+        # The endpoint that answered the last call. With routing it can differ from model/server, which are left as given.
+        self.endpoint = {"model": model, "server": server}
 
     @log_function_call
-    def get_llm(self, json_model: bool =True):
+    def get_llm(self, json_model: bool =True, endpoint: dict=None):
         """
             Using the specified LLM model, return an LLM instance. Temporarily works with openai for now.
+            The instance is borrowed from the shared client registry (see models/models.py), so it is
+            only built the first time this configuration is used.
 
             Args:
-                model (str): LLM model to get instance for.
                 json_model (bool, optional): Indicates whether model response should be in JSON or not. Defaults to True.
+                endpoint (dict, optional): The "model" and "server" to use. Defaults to the agent's own model and server.
 
             Returns:
                 ChatOpenAI: Instance of the specified model.
         """
-        openai_llm = OpenAI_LLM(temperature=self.temperature, model=self.model, server=self.server)
-        return openai_llm.get_openai_json() if json_model else openai_llm.get_openai()
+        endpoint = endpoint or {"model": self.model, "server": self.server}
+        return get_chat_client(endpoint["model"], endpoint["server"], self.temperature, json_model, self.stop)
     
+    @log_function_call
+    def get_completion(self, messages: List[dict], json_model: bool=True) -> str:
+        """
+            Sends the messages to the agent's LLM and returns the content of its response. If the agent
+            belongs to a node and routing is enabled, the model router chooses the endpoint and fails over
+            to the next one in the node's policy if the call fails (see models/router.py).
+
+            Args:
+                messages (List[dict]): The messages to send to the LLM.
+                json_model (bool, optional): Indicates whether model response should be in JSON or not. Defaults to True.
+
+            Returns:
+                str: The content of the LLM response.
+        """
+        router = get_model_router() if self.node is not None else None
+        if router is None:
+            return self._cached_completion(messages, json_model, {"model": self.model, "server": self.server})
+
+        def attempt(name: str, endpoint: dict) -> str:
+            return self._cached_completion(messages, json_model, endpoint)
+
+        return router.call(self.node, attempt)
+
+    @log_function_call
+    async def aget_completion(self, messages: List[dict], json_model: bool=True) -> str:
+        """
+            Async version of get_completion. Uses the shared async HTTP client for local endpoints and
+            ChatOpenAI.ainvoke for OpenAI, so many agents can wait on their LLM at the same time on one event loop.
+        """
+        router = get_model_router() if self.node is not None else None
+        if router is None:
+            return await self._acached_completion(messages, json_model, {"model": self.model, "server": self.server})
+
+        async def attempt(name: str, endpoint: dict) -> str:
+            return await self._acached_completion(messages, json_model, endpoint)
+
+        return await router.acall(self.node, attempt)
+
+    def _cached_completion(self, messages: List[dict], json_model: bool, endpoint: dict) -> str:
+        # Calls with temperature 0 are deterministic, so identical calls that are in flight at the same time share one
+        # request, and their responses are served from the LLM cache when the same messages have been sent to the
+        # same model before (unless use_cache is False).
+        self.endpoint = endpoint
+        if self.temperature != 0:
+            return self._request_completion(messages, json_model, endpoint)
+
+        key = self._cache_key(messages, json_model, endpoint)
+        content, shared = get_single_flight("llm").do(key, self._lookup_or_request, key, messages, json_model, endpoint)
+        if shared and self.stream:
+            # A shared answer is sent as one token so streaming consumers still see it
+            emit_token(self.__class__.__name__, content)
+        return content
+
+    async def _acached_completion(self, messages: List[dict], json_model: bool, endpoint: dict) -> str:
+        self.endpoint = endpoint
+        if self.temperature != 0:
+            return await self._arequest_completion(messages, json_model, endpoint)
+
+        key = self._cache_key(messages, json_model, endpoint)
+        content, shared = await get_single_flight("llm").ado(key, self._alookup_or_request, key, messages, json_model, endpoint)
+        if shared and self.stream:
+            await aemit_token(self.__class__.__name__, content)
+        return content
+
+    def _lookup_or_request(self, key: str, messages: List[dict], json_model: bool, endpoint: dict) -> str:
+        llm_cache = get_llm_cache() if self.use_cache else None
+        if llm_cache is None:
+            return self._request_completion(messages, json_model, endpoint)
+
+        content = llm_cache.get(key)
+        if content is None:
+            content = self._request_completion(messages, json_model, endpoint)
+            llm_cache.put(key, content)
+        elif self.stream:
+            # A cached answer is sent as one token so streaming consumers still see it
+            emit_token(self.__class__.__name__, content)
+        return content
+
+    async def _alookup_or_request(self, key: str, messages: List[dict], json_model: bool, endpoint: dict) -> str:
+        llm_cache = get_llm_cache() if self.use_cache else None
+        if llm_cache is None:
+            return await self._arequest_completion(messages, json_model, endpoint)
+
+        content = llm_cache.get(key)
+        if content is None:
+            content = await self._arequest_completion(messages, json_model, endpoint)
+            llm_cache.put(key, content)
+        elif self.stream:
+            await aemit_token(self.__class__.__name__, content)
+        return content
+
+    def _cache_key(self, messages: List[dict], json_model: bool, endpoint: dict) -> str:
+        response_format = ("json" if endpoint["server"] is not None else {"type": "json_object"}) if json_model else None
+        return make_cache_key(endpoint["model"], endpoint["server"], self.temperature, response_format, messages, self.stop)
+
+    def _local_payload(self, messages: List[dict], json_model: bool, model: str) -> dict:
+        # https://github.com/ollama/ollama/blob/main/docs/api.md
+        payload = {"model": model, "stream": self.stream, "temperature": self.temperature, "messages": messages}
+        if self.stream:
+            # Ask for the token usage block in the final chunk
+            payload["stream_options"] = {"include_usage": True}
+        if json_model:
+            payload["format"] = "json"
+        if self.stop is not None:
+            payload["stop"] = self.stop
+        return payload
+
+    def _request_completion(self, messages: List[dict], json_model: bool, endpoint: dict) -> str:
+        ############## Way model is called depends on if using a local model or not #####
+        if endpoint["server"] is not None:
+            # Send request to local LLM endpoint
+            http_response = http_request(
+                "POST",
+                endpoint["server"],
+                headers={"Content-Type": "application/json"}, 
+                json=self._local_payload(messages, json_model, endpoint["model"]),
+                stream=self.stream
+                )
+            http_response.raise_for_status()
+            if self.stream:
+                return self._read_stream(http_response.iter_lines(), endpoint["model"])
+            request_response_json = http_response.json()
+            self._record_usage(request_response_json.get("usage"), endpoint["model"])
+            return request_response_json['choices'][0]['message']['content']
+
+        # get the LLM - as a temp measure only uses openai at the moment
+        llm = self.get_llm(json_model, endpoint)
+
+        # call the LLM with the prompt and context. When streaming, ChatOpenAI passes each token
+        # to the run's callbacks (on_llm_new_token) as it arrives.
+        streamed = False
+        def complete():
+            nonlocal streamed
+            if not self.stream:
+                return llm.invoke(messages)
+            llm_response = None
+            for chunk in llm.stream(messages):
+                streamed = True
+                llm_response = chunk if llm_response is None else llm_response + chunk
+            return llm_response
+
+        # OpenAI calls share the "openai" token bucket and rate limited calls are retried after a backoff, unless
+        # the stream failed after some of its tokens had already been passed on
+        started = time.perf_counter()
+        llm_response = call_with_rate_limit(get_rate_limiter("openai"), complete, can_retry=lambda: not streamed)
+        record_io(time.perf_counter() - started)
+        self._record_usage(llm_response.usage_metadata, endpoint["model"])
+        return llm_response.content
+
+    async def _arequest_completion(self, messages: List[dict], json_model: bool, endpoint: dict) -> str:
+        if endpoint["server"] is not None:
+            if self.stream:
+                async with async_http_stream("POST",
+                                             endpoint["server"],
+                                             headers={"Content-Type": "application/json"},
+                                             json=self._local_payload(messages, json_model, endpoint["model"])) as http_response:
+                    http_response.raise_for_status()
+                    return await self._aread_stream(http_response.aiter_lines(), endpoint["model"])
+
+            http_response = await async_http_request(
+                "POST",
+                endpoint["server"],
+                headers={"Content-Type": "application/json"},
+                json=self._local_payload(messages, json_model, endpoint["model"])
+                )
+            http_response.raise_for_status()
+            request_response_json = http_response.json()
+            self._record_usage(request_response_json.get("usage"), endpoint["model"])
+            return request_response_json['choices'][0]['message']['content']
+
+        llm = self.get_llm(json_model, endpoint)
+        streamed = False
+        async def complete():
+            nonlocal streamed
+            if not self.stream:
+                return await llm.ainvoke(messages)
+            llm_response = None
+            async for chunk in llm.astream(messages):
+                streamed = True
+                llm_response = chunk if llm_response is None else llm_response + chunk
+            return llm_response
+
+        started = time.perf_counter()
+        llm_response = await acall_with_rate_limit(get_rate_limiter("openai"), complete, can_retry=lambda: not streamed)
+        record_io(time.perf_counter() - started)
+        self._record_usage(llm_response.usage_metadata, endpoint["model"])
+        return llm_response.content
+
+    def _read_stream(self, lines, model: str) -> str:
+        # Collects the tokens of a streamed local completion, pushing each one out as it arrives
+        tokens = []
+        for line in lines:
+            chunk = parse_stream_chunk(line)
+            if chunk is None:
+                continue
+            token = stream_chunk_token(chunk)
+            if token:
+                tokens.append(token)
+                emit_token(self.__class__.__name__, token)
+            self._record_usage(chunk.get("usage"), model)
+        return "".join(tokens)
+
+    async def _aread_stream(self, lines, model: str) -> str:
+        tokens = []
+        async for line in lines:
+            chunk = parse_stream_chunk(line)
+            if chunk is None:
+                continue
+            token = stream_chunk_token(chunk)
+            if token:
+                tokens.append(token)
+                await aemit_token(self.__class__.__name__, token)
+            self._record_usage(chunk.get("usage"), model)
+        return "".join(tokens)
+
+    def _record_usage(self, usage: Optional[dict], model: str):
+        # Local servers report OpenAI style "usage" blocks, ChatOpenAI reports usage_metadata
+        if usage:
+            record_tokens(model,
+                          usage.get("prompt_tokens", usage.get("input_tokens", 0)),
+                          usage.get("completion_tokens", usage.get("output_tokens", 0)))
+
     @log_function_call
     def update_state(self, key: str, value: str | list[str | dict]):
         """
@@ -60,6 +318,41 @@ class SearchPlannerAgent(Agent):
     Args:
         Agent (class): Base class for all agents.
     """
+    @log_function_call
+    def build_messages(self, research_question: str, prompt: str=None, feedback: Callable[[], Any]=None) -> List[dict]:
+        """
+            Formats the planner prompt and sets up the messages that are going to be sent to the LLM.
+        """
+        # get the current state of the reviewer agent
+        feedback_value = feedback() if callable(feedback) else feedback #TODO - Should be a callable should modify this expression
+
+        # The static instructions go first and the feedback and date last (see prompts/prompt_builder.py)
+        return (PromptBuilder("search_planner", prompt)
+                .add_section("feedback", "Feedback:", feedback_value, keep="tail")
+                .build(research_question))
+
+    @log_function_call
+    def set_response(self, content: str):
+        """
+            Updates the state with the LLM's search plan.
+        """
+        # Formatted according to the endpoint that answered, which with routing is not always self.server
+        if self.endpoint["server"] is not None:
+            index = content.find('"search_term')
+
+            if index != -1:
+                if not content.endswith('}'):
+                    content += '}'
+
+                response_formatted = HumanMessage(content=content)
+                self.state["search_planner_response"] = response_formatted
+                return self.state
+            
+        ############## local endpoint or not, set the state and return ##################    
+        # update the state with the response
+        self.state["search_planner_response"] = content
+        return self.state
+
     @log_function_call
     def invoke(self, research_question: str, prompt: str=None, feedback: Callable[[], Any]=None):
         """
@@ -73,65 +366,29 @@ class SearchPlannerAgent(Agent):
             Returns:
                 AgentGraphState | dict[str, Any]: State updated with LLM response.
         """
-        # get the current state of the reviewer agent
-        feedback_value = feedback() if callable(feedback) else feedback #TODO - Should be a callable should modify this expression
+        messages = self.build_messages(research_question, prompt, feedback)
 
-        # format the the agent's prompt
-        searcher_prompt = prompt.format(
-            feedback=feedback_value, 
-            datetime=get_current_utc_datetime)
-        # setup the messages that are going to be sent to the LLM
-        messages = [
-            {"role": "system", "content": searcher_prompt},
-            {"role": "user", "content": f"research_question: {research_question}"}
-        ]
-
-        if self.server is not None:
-            # https://github.com/ollama/ollama/blob/main/docs/api.md
-            payload = {"model": self.model, "format": "json", "stream": False, "temperature": 0, "messages": messages}
-            try:
-                # Send request to local LLM endpoint
-                http_response = requests.post(
-                    self.server,
-                    headers={"Content-Type": "application/json"}, 
-                    json=payload
-                    )
-                
-                request_response_json = http_response.json()
-                content: str = request_response_json['choices'][0]['message']['content']
-                index = content.find('"search_term"')
-
-                if index != -1:
-                    if not content.endswith('}'):
-                        content += '}'
-
-                    response_formatted = HumanMessage(content=content)
-                    self.state["search_planner_response"] = response_formatted
-                    return self.state
-                
-                ############## local endpoint or not, set the state and return ##################    
-                self.state["search_planner_response"] = content
-                return self.state
-                         
-            except requests.exceptions.HTTPError as http_err:
-                return {f"HTTP error occurred: {http_err}"}
-            except requests.exceptions.RequestException as req_err:
-                return {f"Request error occurred: {req_err}"}
-            except KeyError as key_err:
-                return {f"Key error occurred: {key_err}"}
-        else:
-            # get the LLM - as a temp measure only uses openai at the moment
-            llm = self.get_llm(self.model)
-
-            # call the LLM with the prompt and context
-            llm_response = llm.invoke(messages)
-
-            # get the response
-            response = llm_response.content
-            ############## local endpoint or not, set the state and return ##################    
-            # update the state with the response
-            self.state["search_planner_response"] = response
-            return self.state   
+        # call the LLM with the prompt and context and get the response
+        try:
+            content: str = self.get_completion(messages)
+        except LLM_CALL_ERRORS as e:
+            return llm_error_response(e)
+
+        return self.set_response(content)
+
+    @log_function_call
+    async def ainvoke(self, research_question: str, prompt: str=None, feedback: Callable[[], Any]=None):
+        """
+            Async version of invoke.
+        """
+        messages = self.build_messages(research_question, prompt, feedback)
+
+        try:
+            content: str = await self.aget_completion(messages)
+        except LLM_CALL_ERRORS as e:
+            return llm_error_response(e)
+
+        return self.set_response(content)
 
 class ResultSelectorAgent(Agent):
     """
@@ -139,6 +396,36 @@ class ResultSelectorAgent(Agent):
     Args:
         Agent (class): Base class for all agents.
     """
+    @log_function_call
+    def build_messages(self, research_question: str, web_search_result: Callable[[], Any]=None, 
+                       prompt: str=None, previous_selections: Callable[[], List[Any]]=None, 
+                       feedback: Callable[[], Any]=None) -> List[dict]:
+        """
+            Formats the result selector prompt and sets up the messages that are going to be sent to the LLM.
+        """
+        # Get the latest state of the reviewer
+        reviewer_advice = feedback() if callable(feedback) else feedback
+        web_results = web_search_result() if callable(web_search_result) else web_search_result
+        selections = previous_selections() if callable(previous_selections) else previous_selections
+
+        # Need: last result from web_search (Serper), previous selector responses, reviewer last feedback, date.
+        # Each is trimmed to its token budget and they all come after the static instructions, so the start of
+        # the prompt is the same on every call and can be served from the provider's prompt cache.
+        return (PromptBuilder("result_selector", prompt)
+                .add_section("web_search_result", "Here is the search engine results page:", web_results)
+                .add_section("previous_selections", "Here are your previous selections:", selections, keep="tail")
+                .add_section("feedback", "Feedback:", reviewer_advice, keep="tail")
+                .build(research_question))
+
+    @log_function_call
+    def set_response(self, content: str):
+        """
+            Updates the state with the LLM's selection.
+        """
+        self.update_state("result_selector_response", content)
+        print(colored(f"result_selector_response: {content}", 'green'))
+        return self.state
+
     @log_function_call
     def invoke(self, research_question: str, web_search_result: Callable[[], Any]=None, 
                prompt: str=None, previous_selections: Callable[[], List[Any]]=None, 
@@ -156,62 +443,31 @@ class ResultSelectorAgent(Agent):
             Returns:
                 AgentGraphState | dict[str, Any]: State updated with LLM response.
         """
-        # Get the latest state of the reviewer
-        reviewer_advice = feedback() if callable(feedback) else feedback
-        web_results = web_search_result() if callable(web_search_result) else web_search_result
-        selections = previous_selections() if callable(previous_selections) else previous_selections
-
-        # Format this agent's prompt. Need: last result from web_search (Serper), 
-        # reviewer last feedback, previous selector responses, date
-        result_selector_prompt = prompt.format(
-            web_search_result=web_results, 
-            feedback=reviewer_advice, 
-            previous_selections=selections,
-            datetime=get_current_utc_datetime()
-        )
-
-        # Setup the messgaes that are going to be sent to the LLM
-        messages = [{'role': 'system', 'content': result_selector_prompt},
-                    {'role': 'user', 'content': f'research_question: {research_question}'}]
+        messages = self.build_messages(research_question, web_search_result, prompt, previous_selections, feedback)
         
-        ############## Way model is called depends on if using a local model or not #####
-        if self.server is not None:
-            payload = {"model": self.model, "format": "json", "stream": False, "temperature": 0, "messages": messages}
-
-            try:
-                http_response = requests.post(
-                    self.server, 
-                    headers={"Content-Type": "application/json"}, 
-                    json=payload
-                    )
-                
-                request_response_json = http_response.json()
-                content = request_response_json['choices'][0]['message']['content']
-
-                # Update the state with the response
-                self.update_state("result_selector_response", content)
-                print(colored(f"result_selector_response: {content}", 'green'))               
-            except requests.exceptions.HTTPError as http_err:
-                return {f"HTTP error occurred: {http_err}"}
-            except requests.exceptions.RequestException as req_err:
-                return {f"Request error occurred: {req_err}"}
-            except KeyError as key_err:
-                return {f"Key error occurred: {key_err}"}
-        else: 
-            # Get the LLM instance
-            llm = self.get_llm()
-
-            # Call the LLM with prompt and context
-            llm_response = llm.invoke(messages)
-
-            # Get the content of the response
-            content = llm_response.content
-
-            # Update the state with the response
-            self.update_state("result_selector_response", content)
-            print(colored(f"result_selector_response: {content}", 'green'))
-
-        return self.state    
+        # Call the LLM with prompt and context and get the content of the response
+        try:
+            content = self.get_completion(messages)
+        except LLM_CALL_ERRORS as e:
+            return llm_error_response(e)
+
+        return self.set_response(content)
+
+    @log_function_call
+    async def ainvoke(self, research_question: str, web_search_result: Callable[[], Any]=None, 
+                      prompt: str=None, previous_selections: Callable[[], List[Any]]=None, 
+                      feedback: Callable[[], Any]=None):
+        """
+            Async version of invoke.
+        """
+        messages = self.build_messages(research_question, web_search_result, prompt, previous_selections, feedback)
+
+        try:
+            content = await self.aget_completion(messages)
+        except LLM_CALL_ERRORS as e:
+            return llm_error_response(e)
+
+        return self.set_response(content)
 
 # Results reviewer agent
 class ReviewerAgent(Agent):
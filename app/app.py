@@ -1,20 +1,55 @@
+import argparse
+import asyncio
+from agent_graph.checkpoint import get_checkpointer
 from agent_graph.graph import create_graph, compile_graph
-from models_config import models
+from app.batch import read_questions, run_batch
+from models_config import models_config as models
 from models.models import Llama_LLM, OpenAI_LLM
 from termcolor import colored
+from tools.prefetch import prefetch_run
+from utils.metrics import metrics
+from utils.streaming import TokenPrinter
+from utils.tracing import flush_trace, trace_run
+import uuid
 
-def generate_graph_workflow():
+def generate_graph_workflow(stream: bool = False, checkpointer=None):
     """
     Generates a agentic graph workflow.
 
+    Args:
+        stream (bool, optional): Stream LLM tokens to the run's callbacks as they are generated.
+        checkpointer (BaseCheckpointSaver, optional): Checkpoint store used to resume failed runs e.g. get_checkpointer().
+
     Returns:
         CompiledStateGraph
     """
     # Create an agent workflow 
-    graph = create_graph(models)
+    graph = create_graph(models, stream=stream)
 
     # Compile the graph
-    return compile_graph(graph)
+    return compile_graph(graph, checkpointer=checkpointer)
+
+def stream_workflow(workflow, workflow_input, run_config: dict, label: str):
+    """
+        Streams one run of the workflow to the console. If the run fails, the checkpoints written so far
+        are flushed so it can be resumed from the last step that finished.
+    """
+    # The stream method is particularly useful for long-running processes
+    # or workflows where you want to see intermediate results without waiting
+    #  for the entire process to complete. See https://python.langchain.com/v0.2/docs/how_to/streaming/
+    # and https://python.langchain.com/v0.2/docs/concepts/
+    try:
+        with trace_run(label), prefetch_run():
+            for event in workflow.stream(workflow_input, run_config):
+                print(colored(f"\nState Dictionary: {event}\n", "green"))
+    except Exception:
+        thread_id = run_config.get("configurable", {}).get("thread_id")
+        if thread_id is not None:
+            workflow.checkpointer.flush()
+            print(colored(f"\nRun failed. Resume it with: python -m app.app --resume {thread_id}\n", "red"))
+        raise
+    finally:
+        flush_trace()
 
 if __name__ == "__main__":
     """
@@ -26,12 +61,47 @@ if __name__ == "__main__":
         TODO: Not clear. This workflow will have a reviewer step and so does that mean
         that an iteration could go on endlessly?
     """
-    workflow = generate_graph_workflow()
+    parser = argparse.ArgumentParser(description="Generate evidence based reports for MSK research questions.")
+    parser.add_argument("--batch", metavar="QUESTIONS_JSONL", help="Run every research question in a JSONL file instead of the built-in question.")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file that batch results are written to.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of questions run at the same time in batch mode.")
+    parser.add_argument("--stream", action="store_true", help="Print the agents' LLM output token by token as it is generated. Not available with --batch.")
+    parser.add_argument("--metrics", metavar="PATH", help="Write per-node latency, token, byte and cost metrics to this file after each run or batch.")
+    parser.add_argument("--metrics-format", choices=("json", "prometheus"), default="json", help="Format of the --metrics file.")
+    parser.add_argument("--thread-id", help="Checkpoint the run under this thread id (a new one is made for each run by default).")
+    parser.add_argument("--resume", metavar="THREAD_ID", help="Resume a failed run from its last checkpoint. Steps that already finished are not run again.")
+    args = parser.parse_args()
+    if args.stream and args.batch:
+        # The questions of a batch run at the same time, so their tokens would be interleaved
+        parser.error("--stream cannot be used with --batch")
+
+    checkpointer = get_checkpointer()
+    workflow = generate_graph_workflow(stream=args.stream, checkpointer=checkpointer)
+    callbacks = [TokenPrinter()] if args.stream else []
+    iterations = 10
+
+    if args.resume:
+        if checkpointer is None:
+            raise SystemExit("Checkpointing is disabled in checkpoint_settings, so there is nothing to resume.")
+        run_config = {"recursion_limit": iterations, "callbacks": callbacks, "configurable": {"thread_id": args.resume}}
+        if not workflow.get_state(run_config).next:
+            raise SystemExit(f"Thread {args.resume} has no unfinished steps to resume.")
+        # A None input continues the thread from its latest checkpoint instead of starting a new run
+        stream_workflow(workflow, None, run_config, f"resume {args.resume}")
+        if args.metrics:
+            metrics.dump(args.metrics, args.metrics_format)
+        raise SystemExit(0)
+
+    if args.batch:
+        # Batch mode - every question shares the one compiled workflow and runs on one event loop
+        asyncio.run(run_batch(workflow, read_questions(args.batch), args.output, concurrency=args.concurrency))
+        if args.metrics:
+            metrics.dump(args.metrics, args.metrics_format)
+        raise SystemExit(0)
 
     # For development purposes only. The  user input will be taken from a UI field.
     questions = ["Provide a summary of what the best exercises are for low back pain. Take these summaries from at least 5 evidence based papers."]
     user_question: str = questions[0]    
-    iterations = 10
 
     while True:
         if user_question.lower() == "exit":
@@ -39,10 +109,11 @@ if __name__ == "__main__":
 
         initial_input = {"research_question": user_question}
 
-        # The stream method is particularly useful for long-running processes
-        # or workflows where you want to see intermediate results without waiting
-        #  for the entire process to complete. See https://python.langchain.com/v0.2/docs/how_to/streaming/
-        # and https://python.langchain.com/v0.2/docs/concepts/
-        for event in workflow.stream(initial_input, {"recursion_limit": iterations}):
-            print(colored(f"\nState Dictionary: {event}\n", "green"))
+        # With --stream, TokenPrinter shows each agent's response as it is generated rather than after its node has finished
+        run_config = {"recursion_limit": iterations, "callbacks": callbacks}
+        if checkpointer is not None:
+            run_config["configurable"] = {"thread_id": args.thread_id or uuid.uuid4().hex}
+        stream_workflow(workflow, initial_input, run_config, user_question[:40])
+        if args.metrics:
+            metrics.dump(args.metrics, args.metrics_format)
         
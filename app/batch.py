@@ -0,0 +1,134 @@
+import asyncio
+import json
+import math
+import time
+from typing import Any, Dict, List
+import uuid
+from langchain_core.messages import BaseMessage
+from termcolor import colored
+from tools.prefetch import prefetch_run
+from utils.tracing import trace_run
+
+def read_questions(path: str) -> List[Dict[str, str]]:
+    """
+        Reads research questions from a JSONL file. Each line needs a "research_question" (or "question")
+        key. Lines in the backlog format ("request_id", "title", "body") are also accepted, with the body
+        used as the question.
+
+        Args:
+            path (str): The JSONL file.
+
+        Returns:
+            List[Dict[str, str]]: One {"id", "research_question"} dictionary per line.
+    """
+    questions = []
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = record.get("research_question") or record.get("question") or record.get("body") or record.get("title")
+            if not question:
+                raise ValueError(f"{path}:{line_number} does not contain a research question")
+            question_id = record.get("id") or record.get("request_id") or str(line_number)
+            questions.append({"id": str(question_id), "research_question": question})
+    return questions
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+        Gets a percentile of the values using linear interpolation between the closest ranks.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * percent / 100
+    lower, upper = math.floor(rank), math.ceil(rank)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def _to_json(value: Any) -> Any:
+    # The state holds lists of HumanMessage objects - only their content is written out
+    if isinstance(value, BaseMessage):
+        return value.content
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    return value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+
+async def run_batch(workflow, questions: List[Dict[str, str]], output_path: str, concurrency: int = 4,
+                    recursion_limit: int = 10) -> Dict[str, float]:
+    """
+        Runs every question through one compiled workflow, with at most `concurrency` questions in flight
+        at once. Each result is appended to the output JSONL file as soon as it finishes.
+
+        Args:
+            workflow (CompiledStateGraph): The workflow from generate_graph_workflow().
+            questions (List[Dict[str, str]]): The questions from read_questions().
+            output_path (str): JSONL file the results are written to.
+            concurrency (int, optional): Maximum number of questions run at the same time. Defaults to 4.
+            recursion_limit (int, optional): The recursion limit for each run. Defaults to 10.
+                If the workflow has a checkpointer each run gets its own thread id, which is written
+                to the output so a failed run can be resumed with app.py --resume.
+
+        Returns:
+            Dict[str, float]: Throughput summary (see summarize_batch).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_id = uuid.uuid4().hex[:8]
+    latencies: List[float] = []
+    failures = 0
+
+    async def run_question(question: Dict[str, str], output_file):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            record = {**question}
+            config = {"recursion_limit": recursion_limit}
+            if workflow.checkpointer is not None:
+                record["thread_id"] = f"batch-{batch_id}-{question['id']}"
+                config["configurable"] = {"thread_id": record["thread_id"]}
+            try:
+                with trace_run(question["id"]), prefetch_run():
+                    final_state = await workflow.ainvoke({"research_question": question["research_question"]}, config)
+                record["state"] = _to_json(final_state)
+            except Exception as e:
+                failures += 1
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["latency_seconds"] = round(time.perf_counter() - start, 3)
+            latencies.append(record["latency_seconds"])
+
+            # Writes happen on the event loop thread, so lines from different runs are never interleaved
+            output_file.write(json.dumps(record) + "\n")
+            output_file.flush()
+            colour = "red" if "error" in record else "green"
+            print(colored(f"[{len(latencies)}/{len(questions)}] {question['id']} finished in {record['latency_seconds']}s", colour))
+
+    batch_start = time.perf_counter()
+    with open(output_path, "a") as output_file:
+        await asyncio.gather(*(run_question(question, output_file) for question in questions))
+
+    return summarize_batch(latencies, time.perf_counter() - batch_start, failures)
+
+def summarize_batch(latencies: List[float], elapsed_seconds: float, failures: int = 0) -> Dict[str, float]:
+    """
+        Works out the latency percentiles and throughput of a batch and prints them.
+
+        Args:
+            latencies (List[float]): Latency of each run in seconds.
+            elapsed_seconds (float): Wall-clock time of the whole batch.
+            failures (int, optional): Number of runs that raised an error.
+
+        Returns:
+            Dict[str, float]: The summary.
+    """
+    summary = {
+        "questions": len(latencies),
+        "failures": failures,
+        "elapsed_seconds": round(elapsed_seconds, 3),
+        "p50_seconds": round(percentile(latencies, 50), 3),
+        "p95_seconds": round(percentile(latencies, 95), 3),
+        "max_seconds": round(max(latencies, default=0.0), 3),
+        "questions_per_minute": round(len(latencies) / elapsed_seconds * 60, 2) if elapsed_seconds > 0 else 0.0,
+    }
+    print(colored(f"\nBatch summary: {json.dumps(summary, indent=2)}\n", "cyan"))
+    return summary
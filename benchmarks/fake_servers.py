@@ -0,0 +1,210 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# Local stand-ins for Google Serper, an OpenAI-compatible LLM endpoint and the websites that get scraped,
+# so the workflow can be benchmarked on a plain Linux box without API keys or network access.
+
+WORDS = ("lumbar spine pain exercise therapy randomized controlled trial patients outcome disability motor control "
+         "stabilisation core strength pilates yoga walking aerobic resistance training physiotherapy chronic acute "
+         "non-specific intervention group control follow-up weeks months analysis significant improvement function "
+         "quality life evidence systematic review meta-analysis cohort participants baseline reduction intensity").split()
+
+def generate_article_html(page_id: int, target_bytes: int = 150_000) -> bytes:
+    """
+        Generates a page shaped like a PubMed Central article: a large head full of styles and scripts,
+        navigation, an abstract, body sections, a reference list and a footer.
+    """
+    rng = random.Random(page_id)
+
+    def sentence(length: int = 18) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+    head = ["<!DOCTYPE html><html lang='en'><head><meta charset='utf-8'>",
+            f"<title>Exercise therapy for low back pain: trial {page_id}</title>",
+            "<style>" + "".join(f".c{i}{{margin:{i}px;padding:{i % 7}px;color:#{i:06x}}}" for i in range(800)) + "</style>",
+            "<script>" + "".join(f"window.cfg{i}={{id:{i},on:true}};" for i in range(600)) + "</script></head><body>",
+            "<header><nav><ul>" + "".join(f"<li><a href='/nav/{i}'>Menu item {i}</a></li>" for i in range(80)) + "</ul></nav></header>",
+            "<main><article>",
+            f"<h1>Exercise therapy for low back pain: trial {page_id}</h1>",
+            "<section><h2>Abstract</h2>" + "".join(f"<p>{sentence()}</p>" for _ in range(6)) + "</section>"]
+    body = []
+    section = 0
+    size = sum(len(part) for part in head)
+    while size < target_bytes * 0.85:
+        section += 1
+        part = f"<section><h2>Section {section}</h2>" + "".join(f"<p>{sentence(rng.randint(12, 30))}</p>" for _ in range(10)) + "</section>"
+        body.append(part)
+        size += len(part)
+    tail = ["<section><h2>References</h2><ol>" + "".join(f"<li>{sentence(10)} doi:10.1000/{page_id}.{i}</li>" for i in range(60)) + "</ol></section>",
+            "</article></main><footer>" + "".join(f"<a href='/footer/{i}'>Footer link {i}</a>" for i in range(40)) + "</footer></body></html>"]
+    return "".join(head + body + tail).encode("utf-8")
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    servers: "FakeServers" = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: bytes, content_type: str = "application/json", status: int = 200, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+class _SerperHandler(_Handler):
+    def do_POST(self):
+        query = self._read_json().get("q", "")
+        time.sleep(self.servers.search_latency)
+        # Different searches return different (but overlapping) pages so the page cache can be exercised
+        offset = sum(map(ord, query)) % self.servers.page_count
+        organic = [{"title": f"Exercise therapy for low back pain: trial {page}",
+                    "link": f"{self.servers.site_url}/pmc/articles/PMC{page}/",
+                    "snippet": f"Randomized trial {page} of exercise for {query}.",
+                    "position": position + 1}
+                   for position, page in enumerate((offset + i) % self.servers.page_count for i in range(10))]
+        self._send(json.dumps({"searchParameters": {"q": query}, "organic": organic}).encode("utf-8"))
+
+class _LLMHandler(_Handler):
+    def do_POST(self):
+        request = self._read_json()
+        messages = request.get("messages", [])
+        prompt = "\n".join(message["content"] for message in messages)
+        content = self._answer(prompt)
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+
+        # Time to first token, then the rest of the completion at the configured token rate
+        time.sleep(self.servers.llm_latency)
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                self._write_chunk(self._sse({"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                                             "model": request.get("model"),
+                                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}))
+                time.sleep(1 / self.servers.tokens_per_second)
+            self._write_chunk(self._sse({"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                                         "model": request.get("model"), "choices": [],
+                                         "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                                                   "total_tokens": prompt_tokens + len(tokens)}}))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+            return
+
+        time.sleep(len(tokens) / self.servers.tokens_per_second)
+        self._send(json.dumps({
+            "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)},
+        }).encode("utf-8"))
+
+    @staticmethod
+    def _sse(data: dict) -> bytes:
+        return f"data: {json.dumps(data)}\n\n".encode("utf-8")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _answer(prompt: str) -> str:
+        if "You are a planner" in prompt:
+            return json.dumps({"search_term": "exercise therapy low back pain",
+                               "search_terms": ["motor control exercise chronic low back pain", "low back pain exercise systematic review"],
+                               "overall_strategy": "Search for randomized controlled trials and systematic reviews.",
+                               "additional_information": "'chronic low back pain', 'motor control exercise'"})
+        # The result selector picks the first five links it was shown. The results can reach the prompt with their
+        # newlines escaped, so a backslash also ends a link.
+        links = re.findall(r"Link: ([^\s\\]+)", prompt)[:5]
+        return json.dumps({"selected_page_url": links,
+                           "title": "Exercise therapy for low back pain",
+                           "reason_for_selection": "The titles show randomized trials of exercise for low back pain."})
+
+class _SiteHandler(_Handler):
+    def do_GET(self):
+        match = re.search(r"PMC(\d+)", self.path)
+        page = int(match.group(1)) if match else 0
+        time.sleep(self.servers.page_latency)
+        body = self.servers.page(page)
+        etag = f'"{page}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(body, "text/html; charset=utf-8", headers={"ETag": etag})
+
+class FakeServers():
+    """
+        Starts the Serper, LLM and website stand-ins on free local ports in background threads.
+
+        Args:
+            llm_latency (float): Seconds before the LLM sends its first token.
+            tokens_per_second (float): LLM completion speed.
+            search_latency (float): Seconds Serper takes to answer.
+            page_latency (float): Seconds a website takes to start sending a page.
+            page_bytes (int): Approximate size of each generated article page.
+            page_count (int): Number of distinct article pages on the site farm.
+    """
+    def __init__(self, llm_latency: float = 0.5, tokens_per_second: float = 100, search_latency: float = 0.2,
+                 page_latency: float = 0.3, page_bytes: int = 150_000, page_count: int = 50):
+        self.llm_latency = llm_latency
+        self.tokens_per_second = tokens_per_second
+        self.search_latency = search_latency
+        self.page_latency = page_latency
+        self.page_bytes = page_bytes
+        self.page_count = page_count
+        self._pages = {}
+        self._pages_lock = threading.Lock()
+        self._servers = []
+
+    def page(self, page_id: int) -> bytes:
+        with self._pages_lock:
+            if page_id not in self._pages:
+                self._pages[page_id] = generate_article_html(page_id, self.page_bytes)
+            return self._pages[page_id]
+
+    def _start(self, handler_class) -> str:
+        handler = type(handler_class.__name__, (handler_class,), {"servers": self})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def start(self) -> "FakeServers":
+        # Generate the pages up front so page generation is not timed as part of the first runs
+        for page_id in range(self.page_count):
+            self.page(page_id)
+        self.serper_url = self._start(_SerperHandler) + "/search"
+        self.llm_base_url = self._start(_LLMHandler) + "/v1"
+        self.llm_url = self.llm_base_url + "/chat/completions"
+        self.site_url = self._start(_SiteHandler)
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers.clear()
+
+    def __enter__(self) -> "FakeServers":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+from typing import Dict, List
+from app.app import generate_graph_workflow
+from app.batch import run_batch
+from benchmarks.fake_servers import FakeServers
+from config.settings import llm_cache_settings, page_cache_settings, politeness_settings, prefetch_settings, retrieval_settings, router_settings, search_cache_settings, serper_settings
+from models_config import models_config
+from termcolor import colored
+from tools.prefetch import get_prefetcher
+from utils.metrics import metrics
+
+'''
+Offline benchmark for the create_graph workflow. Serper, the LLM endpoint and the scraped websites are replaced by
+local stand-ins (see benchmarks/fake_servers.py), so the numbers only depend on this code and can be compared
+between commits to catch regressions. Example:
+
+    python -m benchmarks.run_benchmark --questions 32 --concurrency 1 4 16 --report benchmark.json
+'''
+
+def configure_workflow(servers: FakeServers, llm_path: str, use_caches: bool, use_prefetch: bool = True):
+    """
+        Points the tools and models_config at the fake servers.
+
+        Args:
+            servers (FakeServers): The running stand-ins.
+            llm_path (str): "local" to call the LLM through the local server code path, "openai" to go through ChatOpenAI.
+            use_caches (bool): Keep the search, page and LLM caches on. They are off by default so every run does the full work.
+            use_prefetch (bool): Download the top search results while the result selector runs (see tools/prefetch.py).
+    """
+    os.environ["SERPER_API_KEY"] = "benchmark"
+    serper_settings["url"] = servers.serper_url
+    # Every call goes to the one fake LLM, so the model router is left out of the measurements
+    router_settings["enabled"] = False
+    # Every page is on the one fake website, which would otherwise be scraped at the polite rate of a single host
+    politeness_settings["enabled"] = False
+    # The fake pages must not end up in the project's local corpus, and every run should do the full web search
+    retrieval_settings["enabled"] = False
+    prefetch_settings["enabled"] = use_prefetch
+
+    if llm_path == "openai":
+        os.environ["OPENAI_API_KEY"] = "benchmark"
+        os.environ["OPENAI_API_BASE"] = servers.llm_base_url
+        models_config.models["openai"] = {"server": None, "model": "benchmark-model"}
+    else:
+        models_config.models["openai"] = {"server": servers.llm_url, "model": "benchmark-model"}
+
+    if not use_caches:
+        search_cache_settings["enabled"] = False
+        page_cache_settings["enabled"] = False
+        llm_cache_settings["backend"] = None
+
+def run_level(workflow, questions: List[Dict[str, str]], concurrency: int, output_path: str, verbose: bool) -> dict:
+    """
+        Runs every question at one concurrency level and returns the end-to-end and per-node results.
+    """
+    metrics.reset()
+    prefetcher = get_prefetcher()
+    if prefetcher is not None:
+        prefetcher.reset_stats()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        summary = asyncio.run(run_batch(workflow, questions, output_path, concurrency=concurrency))
+
+    nodes = {node: {"mean_seconds": round(totals["wall_seconds"] / totals["executions"], 3),
+                    "mean_io_seconds": round(totals["io_seconds"] / totals["executions"], 3),
+                    "executions": totals["executions"],
+                    "coalesced_requests": totals["coalesced_requests"]}
+             for node, totals in metrics.totals.items()}
+    return {"concurrency": concurrency, **summary, "nodes": nodes, "prefetch": prefetcher.stats() if prefetcher is not None else None}
+
+def print_report(results: List[dict]):
+    print(colored(f"\n{'concurrency':>11} {'questions/min':>14} {'p50 s':>8} {'p95 s':>8} {'failures':>9}", "cyan"))
+    for result in results:
+        print(f"{result['concurrency']:>11} {result['questions_per_minute']:>14} {result['p50_seconds']:>8} "
+              f"{result['p95_seconds']:>8} {result['failures']:>9}")
+
+    for result in results:
+        print(colored(f"\nPer-node latency at concurrency {result['concurrency']}", "cyan"))
+        for node, stats in result["nodes"].items():
+            print(f"  {node:<24} mean {stats['mean_seconds']:>7}s   I/O {stats['mean_io_seconds']:>7}s   x{stats['executions']}"
+                  f"   coalesced {stats['coalesced_requests']}")
+        prefetch = result["prefetch"]
+        if prefetch is not None:
+            print(f"  prefetch hit rate {prefetch['hit_rate']:.0%} ({prefetch['hits']} of {prefetch['hits'] + prefetch['misses']} selected pages)"
+                  f"   wasted {prefetch['wasted']} pages, {prefetch['wasted_bytes']} bytes")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent workflow against local stand-ins for Serper, the LLM and websites.")
+    parser.add_argument("--questions", type=int, default=16, help="Number of research questions run at each concurrency level.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels to measure.")
+    parser.add_argument("--llm-path", choices=("local", "openai"), default="local", help="Call the fake LLM through the local server code path or through ChatOpenAI.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before the fake LLM sends its first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=100, help="Completion speed of the fake LLM.")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="Seconds the fake Serper takes to answer.")
+    parser.add_argument("--page-latency", type=float, default=0.3, help="Seconds the fake websites take to start sending a page.")
+    parser.add_argument("--page-bytes", type=int, default=150_000, help="Approximate size of each fake article page.")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the search, page and LLM caches switched on.")
+    parser.add_argument("--no-prefetch", action="store_true", help="Do not download the top search results before the result selector has chosen.")
+    parser.add_argument("--report", metavar="PATH", help="Also write the results to this JSON file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the workflow's console output.")
+    args = parser.parse_args()
+
+    questions = [{"id": f"q{i}", "research_question": f"What are the best exercises for low back pain? (benchmark question {i})"}
+                 for i in range(args.questions)]
+
+    with FakeServers(llm_latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                     search_latency=args.search_latency, page_latency=args.page_latency,
+                     page_bytes=args.page_bytes) as servers, tempfile.TemporaryDirectory() as output_dir:
+        configure_workflow(servers, args.llm_path, args.with_caches, not args.no_prefetch)
+        workflow = generate_graph_workflow()
+        results = [run_level(workflow, questions, concurrency, os.path.join(output_dir, f"results_{concurrency}.jsonl"), args.verbose)
+                   for concurrency in args.concurrency]
+
+    print_report(results)
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(results, file, indent=2)
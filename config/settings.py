@@ -0,0 +1,225 @@
+# Runtime settings for the tools and agents. API keys are not kept here - they live in config/config.yaml.
+import os
+
+scraper_settings = {
+    "max_sources": 5,           # Maximum number of selected pages scraped in one pass
+    "max_workers": 5,           # Number of pages scraped at the same time
+    "timeout": 15,              # Seconds allowed for each URL before it is reported as timed out
+    "max_content_chars": 8000,  # Characters of page text kept per source - parsing stops once this is reached
+    "parser_backend": "auto",   # "lxml", "html.parser" or "auto" (lxml when it is installed)
+    "max_download_bytes": 2 * 1024 * 1024,  # Bytes of a page (or PDF) read before the download is cut off
+    "connect_timeout": 5,       # Seconds to connect to a site, and to wait for each chunk of the body
+    "read_timeout": 10,
+    "chunk_size": 16 * 1024,    # Bytes read from the socket (and handed to the extractor) at a time
+    "content_types": ("text/html", "application/xhtml+xml", "text/plain", "application/pdf"),  # Anything else is not downloaded
+}
+
+# Per-host politeness for the scraper (see tools/politeness.py). Hosts listed in "hosts" override the defaults.
+politeness_settings = {
+    "enabled": True,
+    "max_connections_per_host": 2,      # Requests open to one host at once - others queue for a slot
+    "min_delay": 0.5,                   # Seconds between the starts of requests to one host
+    "max_delay": 30,                    # Upper bound of the delay, however often a host throttles us
+    "recovery_factor": 0.8,             # The delay is multiplied by this after each request that was not throttled
+    "throttle_statuses": [403, 429, 503],   # Responses that double a host's delay
+    "respect_robots": True,
+    "robots_ttl": 24 * 60 * 60,         # Seconds a host's robots.txt is kept before it is fetched again
+    "robots_timeout": 5,
+    "hosts": {
+        "www.ncbi.nlm.nih.gov": {"max_connections": 3, "min_delay": 0.34},     # NCBI asks for at most 3 requests a second
+        "pmc.ncbi.nlm.nih.gov": {"max_connections": 3, "min_delay": 0.34},
+    },
+}
+
+# Google Serper. The URL can be pointed at a stand-in server e.g. by the offline benchmarks.
+serper_settings = {
+    "url": os.environ.get("SERPER_URL", "https://google.serper.dev/search"),
+    "max_queries": 4,               # Search terms from one plan that are searched at the same time
+    "rrf_k": 60,                    # Reciprocal rank fusion constant - larger values give lower ranks more say
+    "max_results": 10,              # Merged results shown to the result selector
+}
+
+# Near-duplicate search results are clustered and only one of each cluster is shown to the result selector (see tools/result_dedup.py)
+dedup_settings = {
+    "enabled": True,
+    "max_hamming_distance": 3,      # SimHash bits (of 64) two titles, or titles and snippets, may differ by and still be duplicates
+    "min_words": 4,                 # Shorter texts are not compared - "Low back pain" says nothing about the page
+    "title_site_names": ("PubMed", "PMC", "NCBI", "Europe PMC", "ResearchGate", "Semantic Scholar", "Google Scholar", "Cochrane Library",
+                         "Wiley Online Library", "ScienceDirect", "SpringerLink", "Taylor & Francis Online", "BMJ", "The BMJ",
+                         "JAMA Network", "The Lancet", "Frontiers", "MDPI", "PLOS ONE", "SAGE Journals", "Physiopedia"),    # removed from the end of titles
+    "tracking_params": ("fbclid", "gclid", "msclkid", "ref", "referrer", "source", "via"),  # as well as utm_*
+    # The copy of a paper that is kept - open full text first, ResearchGate (which blocks scrapers) never by choice
+    "preferred_hosts": ["pmc.ncbi.nlm.nih.gov", "www.ncbi.nlm.nih.gov", "europepmc.org", "pubmed.ncbi.nlm.nih.gov",
+                        "doi.org", "www.cochranelibrary.com", "bmjopen.bmj.com", "www.bmj.com"],
+}
+
+# The top search results are downloaded while the result selector is choosing which to scrape (see tools/prefetch.py)
+prefetch_settings = {
+    "enabled": True,
+    "top_k": 3,                     # Top search results downloaded while the result selector is still choosing
+    "max_workers": 8,               # Prefetch threads shared by every run in the process (sync graph only)
+}
+
+# Shared HTTP clients (see utils/http_clients.py). Hosts that are not listed use the "default" settings and share one pool.
+http_settings = {
+    "default": {
+        "pool_connections": 20,     # Number of hosts kept in the shared connection pool
+        "pool_maxsize": 10,         # Keep-alive connections per host
+        "connect_timeout": 5,
+        "read_timeout": 30,
+        "retries": 2,               # Retries for connection errors and 502/503/504 responses
+        "backoff_factor": 0.5,
+    },
+    "hosts": {
+        "google.serper.dev": {"pool_maxsize": 10, "read_timeout": 15},
+        "localhost:1234": {"pool_maxsize": 4, "read_timeout": 120, "retries": 0},  # LM Studio
+    },
+}
+
+# Client side rate limits of the APIs with quotas (see utils/rate_limiter.py). Requests to a provider's hosts go through
+# its token bucket, and the ChatOpenAI calls go through the "openai" one. The rate adapts to 429 responses and rate limit headers.
+rate_limit_settings = {
+    "enabled": True,
+    "providers": {
+        "serper": {"hosts": ["google.serper.dev"], "requests_per_second": 5, "burst": 10},
+        "openai": {"hosts": ["api.openai.com"], "requests_per_second": 8, "burst": 16},
+        "local_llm": {"hosts": ["localhost:1234"], "requests_per_second": 4, "burst": 4},
+    },
+    "min_requests_per_second": 0.2,
+    "decrease_factor": 0.5,     # The rate is multiplied by this after a rate limited response
+    "increase_step": 0.1,       # Requests per second added back after each other response
+    "retry_statuses": [429],    # Responses that are treated as rate limited and retried
+    "transient_statuses": [408, 409, 500, 502, 503, 504],  # Retried (as are connection errors) without slowing down ...
+    "transient_retries": 2,     # ... this many times, as the OpenAI SDK would
+    "max_retries": 5,
+    "base_delay": 0.5,          # Backoff before retry n is random between 0 and base_delay * 2**n seconds (at most max_delay)
+    "max_delay": 60,
+}
+
+# How each list in AgentGraphState is kept bounded as the graph loops (see states/reducers.py).
+# Keys that are not listed keep every entry.
+state_reducer_settings = {
+    "search_planner_response": {"strategy": "keep_last", "keep": 3},
+    "web_search_response": {"strategy": "keep_last", "keep": 2},
+    "result_selector_response": {"strategy": "summarize", "keep": 3, "max_summary_chars": 1500},
+    "scraper_response": {"strategy": "budget", "max_tokens": 12000, "min_keep": 5},     # min_keep covers one full scraping pass
+    "reviewer_response": {"strategy": "summarize", "keep": 2, "max_summary_chars": 1500},
+    "presenter_response": {"strategy": "keep_last", "keep": 2},
+    "writer_response": {"strategy": "keep_last", "keep": 2},
+    "retrieval_response": {"strategy": "keep_last", "keep": 2},
+}
+
+# Model router (see models/router.py). Each node has an ordered list of candidate endpoints from models_config.models;
+# the router ranks them on every call by latency, queue depth, error rate and token cost and fails over on errors.
+# Off by default. To send the cheap planning calls to a local server first (e.g. LM Studio on the local_llama address in
+# models_config), start the server, set "enabled" to True and change the search_planner policy to ["local_llama", "openai"].
+router_settings = {
+    "enabled": False,
+    "policies": {
+        "search_planner": ["openai"],
+        "result_selector": ["openai"],
+    },
+    "default_policy": ["openai"],
+    "initial_latency": 2.0,         # Seconds assumed for an endpoint that has not been called yet
+    "max_in_flight": 8,             # Calls waiting on one endpoint before it counts as saturated
+    "ewma_alpha": 0.2,              # Weight of the newest call in the rolling latency and error rate
+    "error_penalty_seconds": 10,    # Score added for an endpoint whose calls all fail
+    "cost_weight": 0.2,             # Score added per USD per million tokens
+    "preference_seconds": 5,        # Score added for each place an endpoint is down its policy list
+    "failure_threshold": 3,         # Failures in a row before an endpoint is treated as down ...
+    "cooldown_seconds": 30,         # ... for this long
+    "endpoints": {                  # Per endpoint overrides of initial_latency / max_in_flight
+        "local_llama": {"initial_latency": 1.0, "max_in_flight": 2},
+    },
+}
+
+# Prompt assembly (see prompts/prompt_builder.py). Each volatile section of an agent's prompt is trimmed to its
+# token budget. Tokens are counted with tiktoken when the encoding is available and estimated otherwise.
+prompt_settings = {
+    "encoding": "cl100k_base",
+    "budgets": {
+        "search_planner": {"feedback": 500},
+        "result_selector": {"web_search_result": 2500, "previous_selections": 600, "feedback": 500},
+    },
+}
+
+# Identical searches, page downloads and temperature 0 LLM calls that are in flight at the same time share one
+# request (see utils/single_flight.py). Set a group to False to let every caller make its own request.
+single_flight_settings = {
+    "robots": True,
+    "serper": True,
+    "scraper": True,
+    "llm": True,
+}
+
+# Local caches. Cache files are kept in .cache/ at the root of the project.
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '.cache')
+
+search_cache_settings = {
+    "enabled": True,
+    "path": os.path.join(CACHE_DIR, "serper_cache.sqlite"),
+    "ttl_seconds": 24 * 60 * 60,    # Search results older than this are fetched again
+    "max_entries": 5000,            # Least recently used results are evicted above this
+}
+
+page_cache_settings = {
+    "enabled": True,
+    "path": os.path.join(CACHE_DIR, "page_cache.sqlite"),
+    "fresh_seconds": 60 * 60,           # Pages fetched more recently than this are used without contacting the site
+    "max_pages": 2000,                  # Least recently used pages are evicted above either of these limits
+    "max_bytes": 200 * 1024 * 1024,
+}
+
+# Checkpoints of graph runs, so a failed run can be resumed (see agent_graph/checkpoint.py and app.py --resume)
+checkpoint_settings = {
+    "enabled": True,
+    "path": os.path.join(CACHE_DIR, "checkpoints.sqlite"),
+    "batch_size": 50,           # Queued checkpoint rows that are committed straight away
+    "flush_interval": 0.5,      # Longest time (seconds) a checkpoint waits before it is committed
+    "compress_min_bytes": 512,  # Serialized state at least this big is zlib compressed
+    "keep_per_thread": 20,      # Newest checkpoints kept for each run (thread id). None keeps every checkpoint
+    "max_age_days": 30,         # Runs not written to for this long are deleted when the store is opened. None keeps them
+}
+
+# Cache of LLM responses for temperature 0 agent calls (see models/llm_cache.py)
+llm_cache_settings = {
+    "backend": "memory",        # "memory", "sqlite" or None to turn the cache off
+    "path": os.path.join(CACHE_DIR, "llm_cache.sqlite"),
+    "max_entries": 1000,
+}
+
+# Local corpus of scraped pages used before going to the web (see retrieval/). Pages are chunked, embedded on the CPU with
+# the sentence-transformers model (or feature hashing when it is not installed) and kept in a memory-mapped vector store.
+retrieval_settings = {
+    "enabled": True,
+    "path": os.path.join(CACHE_DIR, "vector_store"),
+    "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
+    "embedding_batch_size": 32,
+    "hashing_dimension": 1024,          # Vector length of the feature hashing fallback
+    "chunk_words": 180,
+    "chunk_overlap_words": 40,
+    "min_chunk_words": 25,              # Shorter chunks (e.g. the tail of a page) are not indexed
+    "top_k": 10,                        # Chunks retrieved per query
+    "search_block_rows": 65536,         # Rows of the matrix scored at a time
+    "min_similarity": 0.6,              # Cosine similarity a chunk needs to count as a match with the sentence-transformers model
+    "hashing_min_similarity": 0.35,     # and with feature hashing, whose scores are lower for the same match
+    "min_sources": 2,                   # Matching sources needed to skip the web search
+    "max_sources": 5,
+    "max_chunks_per_source": 3,
+}
+
+# Tracing (see utils/tracing.py). The level is read when modules are imported, so set TRACE_LEVEL before starting the app.
+# "off" - decorated functions are left unwrapped and cost nothing, "info" - graph runs and nodes, "debug" - every decorated function.
+tracing_settings = {
+    "level": os.environ.get("TRACE_LEVEL", "off"),
+    "format": os.environ.get("TRACE_FORMAT", "chrome"),    # "chrome" (trace-event JSON for chrome://tracing / Perfetto) or "log" (JSON lines)
+    "path": os.environ.get("TRACE_PATH", "trace.json"),
+}
+
+# Estimated LLM cost in US dollars per million tokens, used by the metrics collector (see utils/metrics.py).
+# Models that are not listed (e.g. local models) are counted as free.
+llm_pricing = {
+    "gpt-4o": {"prompt": 2.50, "completion": 10.00},
+    "gpt-4o-mini": {"prompt": 0.15, "completion": 0.60},
+    "gpt-3.5-turbo": {"prompt": 0.50, "completion": 1.50},
+}
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from config.settings import llm_cache_settings
+from utils.helper_functions import log_function_call
+
+def make_cache_key(model: str, server: Optional[str], temperature: float, response_format: Any,
+                   messages: List[Dict[str, str]], stop: Optional[str] = None) -> str:
+    """
+        Builds the cache key for an LLM call. Two calls with the same key send exactly the same request.
+
+        Args:
+            model (str): The LLM model.
+            server (str | None): The local endpoint, or None for OpenAI.
+            temperature (float): The model temperature.
+            response_format (Any): The requested response format e.g. {"type": "json_object"}.
+            messages (List[Dict[str, str]]): The messages sent to the model.
+            stop (str, optional): The stop sequence.
+
+        Returns:
+            str: SHA-256 hex digest of the request.
+    """
+    request = {"model": model, "server": server, "temperature": temperature,
+               "response_format": response_format, "stop": stop, "messages": messages}
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class InMemoryLLMCache():
+    """
+        Least recently used cache of LLM responses held in memory.
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteLLMCache():
+    """
+        Least recently used cache of LLM responses stored in SQLite, so answers survive restarts.
+    """
+    @log_function_call
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS llm_responses (
+                                            key TEXT PRIMARY KEY,
+                                            response TEXT NOT NULL,
+                                            last_access REAL NOT NULL)""")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses (last_access)")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?)", (key, response, time.time()))
+            self._connection.execute("""DELETE FROM llm_responses WHERE key IN (
+                                            SELECT key FROM llm_responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)""",
+                                     (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM llm_responses")
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[InMemoryLLMCache | SQLiteLLMCache]:
+    """
+        Gets the process-wide LLM response cache for the backend chosen in llm_cache_settings,
+        or None if the cache is turned off.
+    """
+    global _llm_cache
+    backend = llm_cache_settings["backend"]
+    if backend is None:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                if backend == "sqlite":
+                    _llm_cache = SQLiteLLMCache(llm_cache_settings["path"], llm_cache_settings["max_entries"])
+                elif backend == "memory":
+                    _llm_cache = InMemoryLLMCache(llm_cache_settings["max_entries"])
+                else:
+                    raise ValueError(f"Unknown LLM cache backend: {backend}")
+    return _llm_cache
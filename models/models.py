@@ -1,39 +1,113 @@
+from config.settings import rate_limit_settings
 from langchain_openai import ChatOpenAI
+import threading
+from typing import Dict, Optional, Sequence, Tuple
 from utils.helper_functions import log_function_call
 
+# Process-wide registry of LLM clients. Building a ChatOpenAI validates its config and sets up its own HTTP
+# connection pools, so each distinct configuration is built once and every agent (on any thread or event loop)
+# borrows the same warm client instead of paying for the setup on every call.
+ClientKey = Tuple[str, Optional[str], float, bool, Optional[Tuple[str, ...]]]
+_clients: Dict[ClientKey, ChatOpenAI] = {}
+_clients_lock = threading.Lock()
+
+def _client_key(model: str, server: Optional[str], temperature: float, json_mode: bool,
+                stop: Optional[str | Sequence[str]]) -> ClientKey:
+    if isinstance(stop, str):
+        stop = (stop,)
+    return (model, server, float(temperature), json_mode, tuple(stop) if stop else None)
+
+def _create_client(model: str, server: Optional[str], temperature: float, json_mode: bool,
+                   stop: Optional[Tuple[str, ...]]) -> ChatOpenAI:
+    kwargs = {}
+    if json_mode:
+        kwargs["model_kwargs"] = {"response_format": {"type": "json_object"}}
+    if stop:
+        kwargs["stop"] = list(stop)
+    if server is not None:
+        # OpenAI compatible local servers (LM Studio, Ollama) are given as the full chat completions URL
+        kwargs["base_url"] = server.rsplit("/chat/completions", 1)[0]
+        kwargs["api_key"] = "local"
+    elif rate_limit_settings["enabled"]:
+        # Rate limited OpenAI calls are retried by utils/rate_limiter.py, which also slows the other calls down.
+        # Retries inside the SDK would hide the 429s from it, so the limiter also retries the connection errors
+        # and 408/409/5xx responses the SDK would have (rate_limit_settings["transient_statuses"]).
+        kwargs["max_retries"] = 0
+    return ChatOpenAI(model=model, temperature=temperature, stream_usage=True, **kwargs)
+
+@log_function_call
+def get_chat_client(model: str, server: Optional[str] = None, temperature: float = 0, json_mode: bool = False,
+                    stop: Optional[str | Sequence[str]] = None) -> ChatOpenAI:
+    """
+        Gets the shared client for a model configuration, creating it on first use.
+
+        Args:
+            model (str): The model name.
+            server (str, optional): Chat completions URL of an OpenAI compatible server. None for OpenAI.
+            temperature (float, optional): Model temperature. Defaults to 0.
+            json_mode (bool, optional): Ask for a JSON object response. Defaults to False.
+            stop (str | Sequence[str], optional): Stop sequence(s).
+
+        Returns:
+            ChatOpenAI: Client that can be used from any thread or event loop.
+    """
+    key = _client_key(model, server, temperature, json_mode, stop)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _create_client(*key)
+    return client
+
+def clear_clients():
+    """
+        Drops every registered client e.g. after the API key or base URL environment variables have changed.
+    """
+    with _clients_lock:
+        _clients.clear()
+
 class LLM_Model():
+    """
+        Thin handle on a model configuration. The clients it hands out come from the shared registry,
+        so creating handles is cheap and every handle with the same configuration shares one client.
+    """
     @log_function_call
-    def __init__(self, model, server, temperature):
+    def __init__(self, model, server, temperature, stop=None):
         self.model = model
         self.server = server
         self.temperature = temperature
-    
+        self.stop = stop
+
+    def get_client(self, json_mode: bool = False) -> ChatOpenAI:
+        return get_chat_client(self.model, self.server, self.temperature, json_mode, self.stop)
+
 class OpenAI_LLM(LLM_Model):
     DEFAULT_MODEL = 'gpt-3.5-turbo'
     DEFAULT_TEMPERATURE = 0
 
     @log_function_call
-    def __init__(self, model=DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE):
-        super().__init__(model, temperature)
-    
+    def __init__(self, model=DEFAULT_MODEL, server=None, temperature=DEFAULT_TEMPERATURE, stop=None):
+        super().__init__(model, server, temperature, stop)
+
     @log_function_call
     def get_openai(self):
-        llm = ChatOpenAI(model=self.model, temperature=self.temperature)
-        return llm
+        return self.get_client(json_mode=False)
 
     @log_function_call
     def get_openai_json(self):
-        llm = ChatOpenAI(model=self.model, temperature=self.temperature, model_kwargs={
-                        "response_format": {"type": "json_object"}})
-        return llm
-    
+        return self.get_client(json_mode=True)
+
 class Llama_LLM(LLM_Model):
     DEFAULT_MODEL = "meta-llama/Meta-Llama-3.1-8B-Instruct"
     DEFAULT_SERVER = None
     DEFAULT_TEMPERATURE = 0
 
-    def __init__(self, model="meta-llama/Meta-Llama-3.1-8B-Instruct", server=DEFAULT_SERVER, temperature=0):
-        super().__init__(model, server, temperature)
+    def __init__(self, model="meta-llama/Meta-Llama-3.1-8B-Instruct", server=DEFAULT_SERVER, temperature=0, stop=None):
+        super().__init__(model, server, temperature, stop)
         self.local_model_endpoint = "http://localhost:1234/v1/chat/completions"
         self.temperature = temperature
-        self.model = model
\ No newline at end of file
+        self.model = model
+
+    def get_client(self, json_mode: bool = False) -> ChatOpenAI:
+        return get_chat_client(self.model, self.server or self.local_model_endpoint, self.temperature, json_mode, self.stop)
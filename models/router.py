@@ -0,0 +1,177 @@
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config.settings import llm_pricing, router_settings
+from models_config import models_config
+from utils.helper_functions import log_function_call
+from utils.tracing import trace_event
+
+class EndpointStats():
+    """
+        Rolling health of one endpoint in models_config.
+
+        Attributes:
+            latency (float | None): Exponentially weighted moving average of call latency in seconds (None until the first call).
+            error_rate (float): Exponentially weighted moving average of failed calls (0 to 1).
+            in_flight (int): Calls currently waiting on the endpoint - its queue depth.
+            consecutive_failures (int): Failed calls in a row. The endpoint is skipped for a while once this reaches the threshold.
+            down_until (float): time.monotonic() until which the endpoint is treated as down.
+    """
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+class ModelRouter():
+    """
+        Picks the endpoint in models_config for each LLM call from the node's list of candidates in
+        router_settings["policies"], and fails over to the next one when a call fails.
+
+        Candidates are ranked by an estimated cost of using them now:
+
+            latency EWMA x (1 + in flight / max_in_flight)          queue-adjusted latency, in seconds
+            + error_rate x error_penalty_seconds                    how often the endpoint has been failing
+            + USD per million tokens x cost_weight                  from llm_pricing (local models are free)
+            + position in the policy x preference_seconds           the policy's own order of preference
+
+        Endpoints that are saturated (max_in_flight calls waiting) or down (failure_threshold failures in a row,
+        for cooldown_seconds) go to the back of the list. Every decision and failover is recorded in the run trace
+        as a "model_route" / "model_failover" event.
+
+        Args:
+            endpoints (dict): The endpoints e.g. models_config.models. Read on every call, so it can be changed at runtime.
+            settings (dict, optional): Defaults to router_settings.
+    """
+    def __init__(self, endpoints: Dict[str, dict], settings: dict = None):
+        self.endpoints = endpoints
+        self.settings = settings or router_settings
+        self.stats: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _setting(self, name: str, key: str) -> Any:
+        return self.settings.get("endpoints", {}).get(name, {}).get(key, self.settings[key])
+
+    def _score(self, name: str, stats: EndpointStats, position: int) -> float:
+        latency = stats.latency if stats.latency is not None else self._setting(name, "initial_latency")
+        queue_factor = 1 + stats.in_flight / self._setting(name, "max_in_flight")
+        pricing = llm_pricing.get(self.endpoints[name]["model"], {"prompt": 0, "completion": 0})
+        cost = (pricing["prompt"] + pricing["completion"]) / 2
+        return (latency * queue_factor + stats.error_rate * self.settings["error_penalty_seconds"]
+                + cost * self.settings["cost_weight"] + position * self.settings["preference_seconds"])
+
+    def rank(self, node: str) -> List[Tuple[str, float]]:
+        """
+            Orders the node's candidate endpoints, best first, with their scores.
+        """
+        candidates = [name for name in self.settings["policies"].get(node, self.settings["default_policy"]) if name in self.endpoints]
+        now = time.monotonic()
+        ranked = []
+        with self._lock:
+            for position, name in enumerate(candidates):
+                stats = self.stats.setdefault(name, EndpointStats())
+                unavailable = stats.down_until > now or stats.in_flight >= self._setting(name, "max_in_flight")
+                ranked.append((unavailable, self._score(name, stats, position), name))
+        ranked.sort()
+        return [(name, round(score, 4)) for _, score, name in ranked]
+
+    def _start(self, name: str):
+        with self._lock:
+            self.stats[name].in_flight += 1
+
+    def _finish(self, name: str, seconds: float, ok: bool):
+        alpha = self.settings["ewma_alpha"]
+        with self._lock:
+            stats = self.stats[name]
+            stats.in_flight -= 1
+            stats.calls += 1
+            stats.error_rate = (1 - alpha) * stats.error_rate + alpha * (0.0 if ok else 1.0)
+            if ok:
+                stats.latency = seconds if stats.latency is None else (1 - alpha) * stats.latency + alpha * seconds
+                stats.consecutive_failures = 0
+            else:
+                stats.consecutive_failures += 1
+                if stats.consecutive_failures >= self.settings["failure_threshold"]:
+                    stats.down_until = time.monotonic() + self.settings["cooldown_seconds"]
+
+    def _attempts(self, node: str):
+        ranked = self.rank(node)
+        if not ranked:
+            raise ValueError(f"No endpoints in models_config for the {node} routing policy")
+        for position, (name, score) in enumerate(ranked):
+            if position == 0:
+                trace_event("model_route", node=node, endpoint=name, ranking=ranked)
+            yield name, self.endpoints[name]
+
+    def _failed(self, node: str, name: str, error: Exception):
+        trace_event("model_failover", node=node, endpoint=name, error=f"{type(error).__name__}: {error}")
+
+    @log_function_call
+    def call(self, node: str, attempt: Callable[[str, dict], Any]) -> Any:
+        """
+            Calls attempt(endpoint_name, endpoint) with the best endpoint for the node, failing over to the
+            next one if it raises.
+
+            Args:
+                node (str): The graph node making the call, used to find its policy.
+                attempt (Callable[[str, dict], Any]): Makes the LLM call against the given endpoint.
+
+            Returns:
+                Any: What the successful attempt returned. The last error is raised if every endpoint fails.
+        """
+        last_error = None
+        for name, endpoint in self._attempts(node):
+            self._start(name)
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = attempt(name, endpoint)
+                ok = True
+                return result
+            except Exception as e:
+                self._failed(node, name, e)
+                last_error = e
+            finally:
+                # Also runs if the call is cancelled, so the in-flight count never leaks
+                self._finish(name, time.perf_counter() - started, ok)
+        raise last_error
+
+    @log_function_call
+    async def acall(self, node: str, attempt: Callable[[str, dict], Awaitable[Any]]) -> Any:
+        """
+            Async version of call.
+        """
+        last_error = None
+        for name, endpoint in self._attempts(node):
+            self._start(name)
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = await attempt(name, endpoint)
+                ok = True
+                return result
+            except Exception as e:
+                self._failed(node, name, e)
+                last_error = e
+            finally:
+                # Also runs if the call is cancelled, so the in-flight count never leaks
+                self._finish(name, time.perf_counter() - started, ok)
+        raise last_error
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+def get_model_router() -> Optional[ModelRouter]:
+    """
+        Gets the process-wide model router over models_config.models, or None if routing is disabled in router_settings.
+    """
+    global _router
+    if not router_settings["enabled"]:
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter(models_config.models)
+    return _router
@@ -0,0 +1,127 @@
+import threading
+from typing import Any, List, Optional
+from config.settings import prompt_settings
+from utils.helper_functions import get_current_utc_date, log_function_call
+
+try:
+    import tiktoken
+except ImportError: # tiktoken is optional - tokens are estimated from the length of the text without it
+    tiktoken = None
+
+'''
+Builds the messages sent to the agents' LLMs so that
+
+ - the static instructions (the prompt templates in prompts.py) always come first, in the system message, and are
+   byte-for-byte the same on every call. Providers that cache prompt prefixes can then reuse them between calls.
+ - the volatile parts - the research question, search results, previous selections, feedback and the date - come
+   last, in the user message, each trimmed to its own token budget (prompt_settings["budgets"]) so the prompt
+   cannot grow without limit as the graph loops.
+'''
+
+CHARS_PER_TOKEN = 4
+TRUNCATED_MARKER = " [...]"
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def get_encoding():
+    """
+        Gets the tiktoken encoding named in prompt_settings, or None if tiktoken is not installed or the encoding
+        cannot be loaded (tiktoken downloads it on first use). The result is remembered, so a failure only costs once.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    _encoding = tiktoken.get_encoding(prompt_settings["encoding"]) if tiktoken is not None else None
+                except Exception:
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """
+        Counts the tokens in a piece of text with the local tokenizer, or estimates them at about 4 characters per token.
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+        Cuts text down to a token budget.
+
+        Args:
+            text (str): The text.
+            max_tokens (int): The budget.
+            keep (str, optional): "head" keeps the start of the text, "tail" keeps the end. Defaults to "head".
+
+        Returns:
+            str: The text if it fits, otherwise the kept part with a marker where text was removed.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        kept = text[:max_chars] if keep == "head" else text[-max_chars:]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        kept = encoding.decode(tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:])
+    return kept + TRUNCATED_MARKER if keep == "head" else TRUNCATED_MARKER.strip() + " " + kept
+
+def render_value(value: Any) -> str:
+    """
+        Turns a state value (a message, a list of messages, a string or None) into prompt text.
+        Only the content of messages is used - their ids and metadata are not useful to the LLM.
+    """
+    if value is None:
+        return "None"
+    if isinstance(value, (list, tuple)):
+        return "\n".join(render_value(item) for item in value) if value else "None"
+    return str(value.content) if hasattr(value, "content") else str(value)
+
+class PromptBuilder():
+    """
+        Assembles the messages for an agent: static instructions in the system message, then the volatile
+        sections in the user message, each trimmed to its budget.
+
+        Args:
+            agent (str): The agent's key in prompt_settings["budgets"] e.g. "result_selector".
+            instructions (str): The static prompt template. It must not contain placeholders.
+    """
+    def __init__(self, agent: str, instructions: str):
+        self.agent = agent
+        self.instructions = instructions.strip()
+        self.budgets = prompt_settings["budgets"].get(agent, {})
+        self.sections: List[str] = []
+
+    def add_section(self, name: str, heading: str, value: Any, keep: str = "head") -> "PromptBuilder":
+        """
+            Adds a volatile section, trimmed to prompt_settings["budgets"][agent][name] tokens if there is a budget.
+
+            Args:
+                name (str): The section's key in the agent's budgets.
+                heading (str): The line written above the section.
+                value (Any): The section's content (see render_value).
+                keep (str, optional): Keep the "head" (e.g. top search results) or "tail" (e.g. the newest feedback) when trimming.
+        """
+        text = render_value(value)
+        max_tokens: Optional[int] = self.budgets.get(name)
+        if max_tokens is not None:
+            text = truncate_to_tokens(text, max_tokens, keep)
+        self.sections.append(f"{heading}\n{text}")
+        return self
+
+    @log_function_call
+    def build(self, research_question: str) -> List[dict]:
+        """
+            Returns the system and user messages. The current date is always the last section.
+        """
+        volatile = [f"research_question: {research_question}", *self.sections,
+                    f"Current date:\n{get_current_utc_date()}"]
+        return [{"role": "system", "content": self.instructions},
+                {"role": "user", "content": "\n\n".join(volatile)}]
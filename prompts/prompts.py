@@ -1,27 +1,30 @@
+# The planner and selector templates only hold static instructions. The volatile parts (research question, results,
+# feedback, date) are added after them by prompts/prompt_builder.py so the start of every prompt stays the same.
+
 # starting point
 search_planner_prompt_template = """
 You are a planner. Your responsibility is to create a comprehensive plan to help your team answer a question related to
 low back pain. Your plan should provide appropriate guidance for your team to use an internet search engine effectively.
 
 Focus on highlighting the most relevant search term to start with, as another team member will use your suggestions 
-to search for relevant information.
-
-If you receive feedback, you must adjust your plan accordingly. Here is the feedback received:
-Feedback: {feedback}
+to search for relevant information. Also give up to 3 other search terms that would find different relevant papers, 
+for example synonyms, narrower outcomes or study types. All of the search terms are searched at the same time.
 
-Current date and time:
-{datetime}
+The research question, any feedback you have received and the current date are given in the user message.
+If you receive feedback, you must adjust your plan accordingly.
 
 Please generate a response ONLY as JSON key-value pairs. Include the following keys only:
-"search_term", "overall_strategy", "additional_information"
+"search_term", "search_terms", "overall_strategy", "additional_information"
 
 Instructions for each key is provided between the ##:
 "search_term": ##The most relevant search term to start with##,
+"search_terms": ##A list of up to 3 other search terms that complement the first one##,
 "overall_strategy": ##The overall strategy to guide the search process##,
 "additional_information": ##Any additional information to guide the search including other search terms or filters##
 
 The following shows a good example of response between the ##:
 ##"search_term": "low back pain",
+"search_terms": ["non specific low back pain exercise therapy", "lbp systematic review"],
 "overall_strategy": "Use a search engine like Google to find articles on low back pain. Use quotes around the search
 term to search for an exact phrase",
 "additional_information": "'low back pain', 'non specific low back pain', 'lbp'."##
@@ -51,14 +54,15 @@ reason for your selection. For example, you might say "Looking at the text in th
 Please specify exactly why you chose this particular advert. You can choose more than one. You must not give a link to the website if it doesn't
 match one that has been given in the list.
 
-Here is the search engine results page:
-{web_search_result}
+The research question, the search engine results page, your previous selections, any feedback you have received
+and the current date are given in the user message. Adjust your selection based on any feedback received and consider
+your previous selections when making your new selection.
 
 Please generate a response ONLY as JSON key-value pairs. Include the following keys only:
 "selected_page_url", "title", "reason_for_selection"
 
 Instructions for each key is provided between the ##:
-"selected_page_url": ##The exact URL of the page you selected.##,
+"selected_page_url": ##The exact URL of the page you selected. If you choose more than one page, give a JSON list of up to 5 URLs.##,
 "title": ##The title of the page(s) that you have chosen.##,
 "reason_for_selection": ##Specify exactly why you chose this particular article.##
 
@@ -77,16 +81,6 @@ The following shows a bad example of a response between the ##:
 "reason_for_selection": "The title contains the phrase 'Low Back Pain'"##
 
 This is a bad example because there is extra text before the json like structure.
-
-Adjust your selection based on any feedback received:
-Feedback: {feedback}
-
-Here are your previous selections:
-{previous_selections}
-Consider this information when making your new selection.
-
-Current date and time:
-{datetime}
 """
 
 reporter_presenter_prompt_template = """    "selected_page_url": "The exact URL of the page you selected",
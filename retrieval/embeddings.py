@@ -0,0 +1,90 @@
+import re
+import threading
+from typing import List, Optional
+import zlib
+import numpy as np
+from config.settings import retrieval_settings
+from utils.helper_functions import log_function_call
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError: # sentence-transformers is optional - texts are embedded with HashingEmbedder without it
+    SentenceTransformer = None
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+class HashingEmbedder():
+    """
+        Embeds text by feature hashing its words and word pairs into a fixed number of dimensions. It needs no
+        model download, is fast on a CPU and gives the same vectors in every process, but only matches texts
+        that share words - a sentence-transformers model is used instead when one is installed.
+
+        Args:
+            dimension (int): Length of the vectors.
+    """
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+        self.min_similarity = retrieval_settings["hashing_min_similarity"]
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+            Returns one L2 normalised float32 row per text.
+        """
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            # crc32 rather than hash(), which is salted differently in every process
+            hashes = np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dimension, signs)
+        # Sublinear term frequency so a word repeated all over a page does not dominate its vector
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+class SentenceTransformerEmbedder():
+    """
+        Embeds text with a sentence-transformers model on the CPU.
+
+        Args:
+            model_name (str): The model e.g. "sentence-transformers/all-MiniLM-L6-v2".
+    """
+    def __init__(self, model_name: str):
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.name = model_name.replace("/", "--")
+        self.min_similarity = retrieval_settings["min_similarity"]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=retrieval_settings["embedding_batch_size"], convert_to_numpy=True,
+                                 normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+@log_function_call
+def get_embedder():
+    """
+        Gets the process-wide embedder: the sentence-transformers model in retrieval_settings when the package is
+        installed and the model can be loaded, otherwise a HashingEmbedder.
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                model_name: Optional[str] = retrieval_settings["embedding_model"]
+                embedder = None
+                if SentenceTransformer is not None and model_name:
+                    try:
+                        embedder = SentenceTransformerEmbedder(model_name)
+                    except Exception:
+                        embedder = None # e.g. the model is not downloaded and there is no network
+                _embedder = embedder or HashingEmbedder(retrieval_settings["hashing_dimension"])
+    return _embedder
@@ -0,0 +1,137 @@
+import asyncio
+import json
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from langchain_core.messages import HumanMessage
+from termcolor import colored
+from config.settings import retrieval_settings
+from retrieval.embeddings import get_embedder
+from retrieval.vector_store import Hit, get_vector_store
+from states.state import AgentGraphState
+from tools.search_plan import get_search_terms
+from utils.helper_functions import log_function_call
+from utils.tracing import trace_event
+
+'''
+Retrieval augmented generation over the pages the scraper has already read. Every scraped page is chunked, embedded
+and added to the local vector store (see vector_store.py). Before going to the web, the retrieval node searches the
+store with the research question and the planner's search terms. If enough sources match closely enough, their best
+chunks are used as the scraper_response and the web search, result selection and scraping are skipped.
+'''
+
+@log_function_call
+def chunk_text(text: str, chunk_words: int = None, overlap_words: int = None) -> List[str]:
+    """
+        Splits text into overlapping chunks of about chunk_words words. Chunks shorter than
+        retrieval_settings["min_chunk_words"] (e.g. the tail of a page) are dropped.
+    """
+    chunk_words = chunk_words or retrieval_settings["chunk_words"]
+    overlap_words = overlap_words if overlap_words is not None else retrieval_settings["chunk_overlap_words"]
+    words = text.split()
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunk = words[start:start + chunk_words]
+        if len(chunk) >= retrieval_settings["min_chunk_words"]:
+            chunks.append(" ".join(chunk))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+@log_function_call
+def index_documents(documents: Iterable[Tuple[str, str]]) -> int:
+    """
+        Chunks, embeds and stores documents. Chunks that are already in the store are not embedded again.
+
+        Args:
+            documents (Iterable[Tuple[str, str]]): (source URL, text) pairs.
+
+        Returns:
+            int: The number of chunks added.
+    """
+    store = get_vector_store()
+    if store is None:
+        return 0
+    embedder = get_embedder()
+    added = 0
+    for source, text in documents:
+        chunks = [chunk for chunk in chunk_text(text) if not store.contains(chunk)]
+        if chunks:
+            added += store.add(source, chunks, embedder.embed(chunks))
+    return added
+
+def _search_terms(get_plan: Callable[[], Any]) -> List[str]:
+    try:
+        return get_search_terms(json.loads(get_plan().content))
+    except (json.JSONDecodeError, AttributeError, IndexError, TypeError):
+        return []
+
+def _merge_hits(results: List[List[Hit]]) -> List[Hit]:
+    # A chunk found by several queries keeps its best similarity
+    best: Dict[str, Hit] = {}
+    for hits in results:
+        for score, chunk in hits:
+            if chunk["hash"] not in best or score > best[chunk["hash"]][0]:
+                best[chunk["hash"]] = (score, chunk)
+    return sorted(best.values(), key=lambda hit: hit[0], reverse=True)
+
+def _group_by_source(hits: List[Hit]) -> Dict[str, List[Hit]]:
+    sources: Dict[str, List[Hit]] = {}
+    for score, chunk in hits:
+        sources.setdefault(chunk["source"], []).append((score, chunk))
+    return sources
+
+@log_function_call
+def retrieve_evidence(state: AgentGraphState, get_plan: Callable[[], Any]) -> dict:
+    """
+        Searches the local corpus for the research question and the latest search terms.
+
+        Args:
+            state (AgentGraphState): The current state of the graph.
+            get_plan (Callable[[], Any]): Gets the latest search planner response.
+
+        Returns:
+            dict: State update. retrieval_response always gets a summary of the search ("answered" says whether the
+                corpus was good enough), and scraper_response gets one entry per matching source when it was.
+    """
+    queries = [state["research_question"], *_search_terms(get_plan)]
+
+    store = get_vector_store()
+    hits = []
+    if store is not None and store.count:
+        embedder = get_embedder()
+        # All the queries are scored against the corpus in one pass
+        hits = _merge_hits(store.search(embedder.embed(queries), retrieval_settings["top_k"]))
+        close_hits = [hit for hit in hits if hit[0] >= embedder.min_similarity]
+    else:
+        close_hits = []
+
+    sources = list(_group_by_source(close_hits).items())[:retrieval_settings["max_sources"]]
+    answered = len(sources) >= retrieval_settings["min_sources"]
+    summary = {"answered": answered, "queries": queries,
+               "top_similarity": round(hits[0][0], 4) if hits else None,
+               "sources": [source for source, _ in sources]}
+    trace_event("retrieval", **summary)
+
+    update = {"retrieval_response": [HumanMessage(role="system", content=json.dumps(summary))]}
+    if answered:
+        print(colored(f"Answering from {len(sources)} sources in the local corpus: {summary['sources']}\n", "blue"))
+        update["scraper_response"] = [
+            HumanMessage(role="system", content=str({"source": source,
+                                                     "content": "\n\n".join(chunk["text"] for _, chunk in source_hits[:retrieval_settings["max_chunks_per_source"]])}))
+            for source, source_hits in sources]
+    return update
+
+@log_function_call
+async def aretrieve_evidence(state: AgentGraphState, get_plan: Callable[[], Any]) -> dict:
+    """
+        Async version of retrieve_evidence. Embedding and searching are CPU work, so they run in a worker thread.
+    """
+    return await asyncio.to_thread(retrieve_evidence, state, get_plan)
+
+def route_after_retrieval(state: AgentGraphState) -> str:
+    """
+        Chooses the node after retrieval: "end" if the local corpus answered the question, otherwise "web_search_tool".
+    """
+    responses = state.get("retrieval_response") or []
+    answered = bool(responses) and json.loads(responses[-1].content)["answered"]
+    return "end" if answered else "web_search_tool"
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config.settings import retrieval_settings
+from retrieval.embeddings import get_embedder
+from utils.helper_functions import log_function_call
+
+Hit = Tuple[float, dict]
+
+class VectorStore():
+    """
+        Append-only store of text chunks and their embeddings.
+
+        The vectors are rows of a float32 matrix in vectors.f32, memory-mapped with NumPy so the corpus does not have
+        to fit in memory or be loaded at start up. Each row's source URL and text are kept in a JSON lines sidecar,
+        chunks.jsonl, and index.json records how many rows are complete. It is written last, so rows from an
+        interrupted write are ignored (and overwritten) the next time the store is opened.
+
+        Args:
+            directory (str): Folder the three files are kept in.
+            dimension (int): Length of the vectors.
+    """
+    INITIAL_CAPACITY = 1024
+
+    @log_function_call
+    def __init__(self, directory: str, dimension: int):
+        self.directory = directory
+        self.dimension = dimension
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._metadata_path = os.path.join(directory, "chunks.jsonl")
+        self._index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        index = {"count": 0, "capacity": 0, "metadata_bytes": 0, "dimension": dimension}
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as file:
+                index = json.load(file)
+            if index["dimension"] != dimension:
+                raise ValueError(f"{directory} holds {index['dimension']} dimensional vectors, not {dimension}")
+        self.count: int = index["count"]
+        self._capacity: int = index["capacity"]
+        self._metadata_bytes: int = index["metadata_bytes"]
+
+        # Drop metadata written after the last complete update
+        with open(self._metadata_path, "ab") as file:
+            file.truncate(self._metadata_bytes)
+        self.metadata: List[dict] = []
+        with open(self._metadata_path, encoding="utf-8") as file:
+            for line in file:
+                self.metadata.append(json.loads(line))
+        self._hashes = {entry["hash"] for entry in self.metadata}
+        self._matrix = self._map(max(self._capacity, self.INITIAL_CAPACITY))
+
+    def _map(self, capacity: int) -> np.memmap:
+        # Growing the file keeps the rows that are already there. Maps handed out earlier stay valid.
+        size = capacity * self.dimension * np.dtype(np.float32).itemsize
+        with open(self._vectors_path, "ab") as file:
+            if file.tell() < size:
+                file.truncate(size)
+        self._capacity = capacity
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def _write_index(self):
+        temp_path = self._index_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"count": self.count, "capacity": self._capacity, "metadata_bytes": self._metadata_bytes,
+                       "dimension": self.dimension}, file)
+        os.replace(temp_path, self._index_path)
+
+    @staticmethod
+    def chunk_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def contains(self, text: str) -> bool:
+        return self.chunk_hash(text) in self._hashes
+
+    @log_function_call
+    def add(self, source: str, chunks: List[str], vectors: np.ndarray) -> int:
+        """
+            Adds chunks of a document and their (L2 normalised) vectors. Chunks already in the store are skipped.
+
+            Args:
+                source (str): Where the chunks came from e.g. the page URL.
+                chunks (List[str]): The chunk texts.
+                vectors (np.ndarray): One row per chunk.
+
+            Returns:
+                int: The number of chunks added.
+        """
+        with self._lock:
+            rows = []
+            for chunk, vector in zip(chunks, vectors):
+                chunk_hash = self.chunk_hash(chunk)
+                if chunk_hash not in self._hashes:
+                    self._hashes.add(chunk_hash)
+                    rows.append(({"source": source, "text": chunk, "hash": chunk_hash}, vector))
+            if not rows:
+                return 0
+
+            if self.count + len(rows) > self._capacity:
+                capacity = self._capacity
+                while capacity < self.count + len(rows):
+                    capacity *= 2
+                self._matrix = self._map(capacity)
+            self._matrix[self.count:self.count + len(rows)] = np.stack([vector for _, vector in rows])
+            self._matrix.flush()
+
+            lines = "".join(json.dumps(entry) + "\n" for entry, _ in rows).encode("utf-8")
+            with open(self._metadata_path, "ab") as file:
+                file.write(lines)
+            self._metadata_bytes += len(lines)
+            self.metadata.extend(entry for entry, _ in rows)
+            self.count += len(rows)
+            self._write_index()
+            return len(rows)
+
+    @log_function_call
+    def search(self, queries: np.ndarray, top_k: int) -> List[List[Hit]]:
+        """
+            Finds the chunks most similar to each query by cosine similarity. The matrix is scanned in blocks of
+            retrieval_settings["search_block_rows"] rows and every query is scored against a block in one matrix
+            product, so memory use stays flat however large the corpus grows.
+
+            Args:
+                queries (np.ndarray): One L2 normalised query vector per row.
+                top_k (int): Number of chunks returned per query.
+
+            Returns:
+                List[List[Tuple[float, dict]]]: For each query, (similarity, chunk metadata) pairs, best first.
+        """
+        with self._lock:
+            count, matrix, metadata = self.count, self._matrix, self.metadata
+        if count == 0 or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        queries = np.asarray(queries, dtype=np.float32)
+        best_scores = np.full((0, len(queries)), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((0, len(queries)), dtype=np.int64)
+        block_rows = retrieval_settings["search_block_rows"]
+        for start in range(0, count, block_rows):
+            block = np.asarray(matrix[start:min(start + block_rows, count)])
+            scores = block @ queries.T                                  # (rows in block, queries)
+            keep = min(top_k, len(block))
+            candidates = np.argpartition(-scores, keep - 1, axis=0)[:keep]
+            scores = np.take_along_axis(scores, candidates, axis=0)
+            # Merge the block's best with the best so far and keep top_k per query
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, candidates + start])
+            if len(best_scores) > top_k:
+                keep_rows = np.argpartition(-best_scores, top_k - 1, axis=0)[:top_k]
+                best_scores = np.take_along_axis(best_scores, keep_rows, axis=0)
+                best_rows = np.take_along_axis(best_rows, keep_rows, axis=0)
+
+        order = np.argsort(-best_scores, axis=0)
+        best_scores = np.take_along_axis(best_scores, order, axis=0)
+        best_rows = np.take_along_axis(best_rows, order, axis=0)
+        return [[(float(best_scores[rank, query]), metadata[best_rows[rank, query]]) for rank in range(len(best_scores))]
+                for query in range(len(queries))]
+
+    def stats(self) -> Dict[str, int]:
+        return {"chunks": self.count, "sources": len({entry["source"] for entry in self.metadata})}
+
+_store: Optional[VectorStore] = None
+_store_lock = threading.Lock()
+
+def get_vector_store() -> Optional[VectorStore]:
+    """
+        Gets the process-wide vector store, or None if retrieval is disabled in retrieval_settings. Each embedder has
+        its own store (a sub folder named after it), so changing the model never mixes vectors from different models.
+    """
+    global _store
+    if not retrieval_settings["enabled"]:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                embedder = get_embedder()
+                _store = VectorStore(os.path.join(retrieval_settings["path"], embedder.name), embedder.dimension)
+    return _store
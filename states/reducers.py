@@ -0,0 +1,102 @@
+from typing import Callable, List
+from langchain_core.messages import AnyMessage, HumanMessage
+from langgraph.graph import add_messages
+from config.settings import state_reducer_settings
+
+'''
+Reducers that stop the lists in AgentGraphState from growing with every pass through the graph. Each one merges the
+update with add_messages (so nodes can keep returning the whole list, matched by message id) and then compacts the
+result using the strategy configured for the key in state_reducer_settings:
+
+ - "keep_last":  keep the newest `keep` entries.
+ - "budget":     keep the newest entries that fit in `max_tokens` (estimated), but never fewer than `min_keep`.
+ - "summarize":  keep the newest `keep` entries and fold the older ones into a single rolling summary entry
+                 of at most `max_summary_chars` characters.
+ - None:         keep everything (the behaviour of plain add_messages).
+'''
+
+CHARS_PER_TOKEN = 4
+SUMMARY_PREFIX = "Summary of earlier entries:"
+
+def estimate_tokens(message: AnyMessage) -> int:
+    """
+        Rough token count of a message (about 4 characters per token), which is enough for budgeting state.
+    """
+    return len(str(message.content)) // CHARS_PER_TOKEN + 1
+
+def _summary_id(state_key: str) -> str:
+    return f"{state_key}-summary"
+
+def _keep_last(messages: List[AnyMessage], keep: int = 3, **_) -> List[AnyMessage]:
+    return messages[-keep:] if keep > 0 else []
+
+def _within_budget(messages: List[AnyMessage], max_tokens: int = 8000, min_keep: int = 1, **_) -> List[AnyMessage]:
+    kept = 0
+    tokens = 0
+    for message in reversed(messages):
+        tokens += estimate_tokens(message)
+        if tokens > max_tokens and kept >= min_keep:
+            break
+        kept += 1
+    return messages[len(messages) - kept:]
+
+def _summarize(messages: List[AnyMessage], state_key: str, keep: int = 3, max_summary_chars: int = 2000,
+               digest_chars: int = 300, **_) -> List[AnyMessage]:
+    if len(messages) <= keep:
+        return messages
+    older, newer = messages[:len(messages) - keep], messages[len(messages) - keep:]
+
+    # The previous summary is carried forward and each older entry adds a short digest of itself.
+    # When the summary is over its limit the oldest digests are dropped first.
+    digests = []
+    for message in older:
+        content = " ".join(str(message.content).split())
+        if message.id == _summary_id(state_key):
+            digests.append(content[len(SUMMARY_PREFIX):].strip())
+        else:
+            digests.append(f"- {content[:digest_chars]}{'...' if len(content) > digest_chars else ''}")
+    summary = " ".join(digest for digest in digests if digest)[-max_summary_chars:]
+
+    return [HumanMessage(role="system", content=f"{SUMMARY_PREFIX} {summary}", id=_summary_id(state_key))] + newer
+
+STRATEGIES = {
+    "keep_last": _keep_last,
+    "budget": _within_budget,
+    "summarize": _summarize,
+}
+
+def compact_messages(state_key: str, messages: List[AnyMessage]) -> List[AnyMessage]:
+    """
+        Applies the strategy configured for a state key in state_reducer_settings to a list of messages.
+
+        Args:
+            state_key (str): The AgentGraphState key the messages belong to.
+            messages (List[AnyMessage]): The messages, oldest first.
+
+        Returns:
+            List[AnyMessage]: The compacted messages, oldest first.
+    """
+    settings = dict(state_reducer_settings.get(state_key) or {})
+    strategy = settings.pop("strategy", None)
+    if strategy is None or not isinstance(messages, list):
+        return messages
+    if strategy == "summarize":
+        settings["state_key"] = state_key
+    return STRATEGIES[strategy](messages, **settings)
+
+def bounded_messages(state_key: str) -> Callable[[list, list], list]:
+    """
+        Creates the reducer for a state key: add_messages followed by compact_messages. The settings are read
+        on every update, so they can be changed at runtime (e.g. by the benchmarks).
+
+        Args:
+            state_key (str): The AgentGraphState key the reducer is used for.
+
+        Returns:
+            Callable[[list, list], list]: The reducer to use in the key's Annotated type.
+    """
+    def reducer(left, right):
+        return compact_messages(state_key, add_messages(left, right))
+
+    reducer.__name__ = f"bounded_{state_key}"
+    return reducer
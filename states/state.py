@@ -1,5 +1,5 @@
 from typing import TypedDict, Annotated
-from langgraph.graph import add_messages
+from states.reducers import bounded_messages, compact_messages
 from utils.helper_functions import log_function_call
 import sys
 
@@ -8,10 +8,12 @@ class AgentGraphState(TypedDict):
         Represents the state of an agent-driven workflow in a graph-based system.
 
         This state is used to track responses between various agents involved in the graph.
+        The lists are kept bounded as the graph loops - see states/reducers.py and state_reducer_settings.
 
         Attributes:
             research_question (str): The main research question or query driving the workflow.
             search_planner_response (list): A list of responses returned from the search planner agent.
+            retrieval_response (list): A list of summaries of the searches of the local corpus (see retrieval/retriever.py).
             web_search_response (list): A list of formatted data (consisting of title, link, snippet) returned by the web search tool.
             result_selector_response (list): A list of responses returned from the result selector agent.
             scraper_response (list): A list of formatted data (url source, content) returned by the web scraper agent.
@@ -19,17 +21,19 @@ class AgentGraphState(TypedDict):
             presenter_response (list): A list of messages from the presenter agent, likely preparing final output.
     """    
     research_question: str
-    search_planner_response: Annotated[list, add_messages]
-    web_search_response: Annotated[list, add_messages]
-    result_selector_response: Annotated[list, add_messages] # In the futre, might select more than on result and create a CV for them both
-    scraper_response: Annotated[list, add_messages]
-    reviewer_response: Annotated[list, add_messages]
-    presenter_response: Annotated[list, add_messages]
-    writer_response: Annotated[list, add_messages]
+    search_planner_response: Annotated[list, bounded_messages("search_planner_response")]
+    retrieval_response: Annotated[list, bounded_messages("retrieval_response")]
+    web_search_response: Annotated[list, bounded_messages("web_search_response")]
+    result_selector_response: Annotated[list, bounded_messages("result_selector_response")] # In the futre, might select more than on result and create a CV for them both
+    scraper_response: Annotated[list, bounded_messages("scraper_response")]
+    reviewer_response: Annotated[list, bounded_messages("reviewer_response")]
+    presenter_response: Annotated[list, bounded_messages("presenter_response")]
+    writer_response: Annotated[list, bounded_messages("writer_response")]
 
 state = {
     "research_question": "",
     "search_planner_response": [],
+    "retrieval_response": [],
     "web_search_response": [],
     "result_selector_response": [],
     "scraper_response": [],
@@ -43,7 +47,8 @@ def get_agent_graph_state(state:AgentGraphState, state_key: str, retrieve_all: b
     """
         Gets either all of the state or just the latest response. 
         If retrieve_all is false, assume that the last response only
-        should be retrieved.
+        should be retrieved. All of the state is returned compacted with the
+        key's reducer settings, so prompts never see more than the window.
 
         Args:
             state (AgentGraphState): _description_
@@ -54,7 +59,7 @@ def get_agent_graph_state(state:AgentGraphState, state_key: str, retrieve_all: b
             _type_: _description_
     """
     if state_key in state:
-       return state[state_key] if retrieve_all else state[state_key][-1]
+       return compact_messages(state_key, state[state_key]) if retrieve_all else state[state_key][-1]
 
 
 
@@ -0,0 +1,90 @@
+import operator
+import sqlite3
+from typing import Annotated, List, TypedDict
+import pytest
+from langgraph.graph import END, StateGraph
+from agent_graph.checkpoint import SQLiteCheckpointSaver
+
+class _State(TypedDict):
+    steps: Annotated[List[str], operator.add]
+
+def _workflow(checkpointer, fail: dict):
+    def first(state):
+        return {"steps": ["first"]}
+
+    def second(state):
+        if fail.get("second"):
+            raise RuntimeError("second failed")
+        return {"steps": ["second"]}
+
+    graph = StateGraph(_State)
+    graph.add_node("first", first)
+    graph.add_node("second", second)
+    graph.set_entry_point("first")
+    graph.add_edge("first", "second")
+    graph.add_edge("second", END)
+    return graph.compile(checkpointer=checkpointer)
+
+@pytest.fixture
+def saver(tmp_path):
+    with SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"), flush_interval=60, keep_per_thread=3) as saver:
+        yield saver
+
+def test_failed_run_resumes_from_last_checkpoint(saver):
+    fail = {"second": True}
+    workflow = _workflow(saver, fail)
+    config = {"configurable": {"thread_id": "run-1"}}
+    with pytest.raises(RuntimeError):
+        workflow.invoke({"steps": []}, config)
+
+    fail["second"] = False
+    assert workflow.invoke(None, config)["steps"] == ["first", "second"]
+
+def test_old_checkpoints_are_pruned(saver):
+    workflow = _workflow(saver, {})
+    for _ in range(3):
+        workflow.invoke({"steps": []}, {"configurable": {"thread_id": "run-1"}})
+    saver.flush()
+
+    assert len(list(saver.list({"configurable": {"thread_id": "run-1"}}))) == 3
+    checkpoint_ids = {row[0] for row in saver._connection.execute("SELECT checkpoint_id FROM checkpoints")}
+    write_ids = {row[0] for row in saver._connection.execute("SELECT checkpoint_id FROM writes")}
+    assert write_ids <= checkpoint_ids
+
+class _FailingConnection():
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.failures = 1
+
+    def __enter__(self):
+        return self.connection.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.connection.__exit__(*exc_info)
+
+    def execute(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database or disk is full")
+        return self.connection.execute(*args)
+
+def test_rows_are_requeued_when_a_flush_fails(saver):
+    config = {"configurable": {"thread_id": "run-1"}}
+    _workflow(saver, {}).invoke({"steps": []}, config)
+    connection = saver._connection
+    saver._connection = _FailingConnection(connection)
+
+    with pytest.raises(sqlite3.OperationalError):
+        saver.flush()
+    assert saver._pending
+
+    saver.flush()
+    saver._connection = connection
+    assert saver.get_tuple(config).checkpoint["channel_values"]["steps"] == ["first", "second"]
+
+def test_old_threads_are_deleted_on_open(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    with SQLiteCheckpointSaver(path, flush_interval=60) as saver:
+        _workflow(saver, {}).invoke({"steps": []}, {"configurable": {"thread_id": "run-1"}})
+    with SQLiteCheckpointSaver(path, flush_interval=60, max_age_days=0) as saver:
+        assert saver.get_tuple({"configurable": {"thread_id": "run-1"}}) is None
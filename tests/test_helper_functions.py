@@ -0,0 +1,15 @@
+import pytest
+from utils.helper_functions import canonicalize_url
+
+@pytest.mark.parametrize("url, canonical", [
+    ("HTTPS://Example.org:443/a/b/?utm_source=x&b=2&a=1#top", "https://example.org/a/b?a=1&b=2"),
+    ("http://example.org:8080", "http://example.org:8080/"),
+    ("https://www.example.org/a%20b", "https://www.example.org/a%20b"),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+
+def test_loose_form_ignores_scheme_www_and_extra_params():
+    first = canonicalize_url("https://www.example.org/a%20b/?fbclid=1", loose=True, drop_params=["fbclid"])
+    second = canonicalize_url("http://example.org/a b", loose=True)
+    assert first == second == "//example.org/a b"
@@ -0,0 +1,45 @@
+import pytest
+from tools.html_extractor import HTMLTextExtractor, extract_text
+
+def test_prefers_main_content():
+    html = "<html><body><div>Site wide text</div><main><p>The trial found a benefit.</p></main></body></html>"
+    assert extract_text(html, max_chars=1000) == "The trial found a benefit."
+
+def test_skips_boilerplate_subtrees():
+    html = "<main><nav>Home About</nav><p>Body text.</p><div class='share-links social'>Share this</div><footer>Copyright</footer></main>"
+    assert extract_text(html, max_chars=1000) == "Body text."
+
+def test_skipped_list_item_without_end_tag_ends_with_its_list():
+    html = ("<main><p>Intro text.</p><ul><li class=\"menu\">Home<li>Other</ul>"
+            "<p>Important body text.</p></main>")
+    assert extract_text(html, max_chars=1000) == "Intro text. Other Important body text."
+
+def test_skipped_paragraph_without_end_tag_ends_at_next_block():
+    html = "<main><p class=\"share\">Share this<div><p>Important body text.</p></div></main>"
+    assert extract_text(html, max_chars=1000) == "Important body text."
+
+def test_skipped_subtree_ends_when_parent_closes():
+    html = "<main><div><span class=\"advert\">Buy now</div><p>Important body text.</p></main>"
+    assert extract_text(html, max_chars=1000) == "Important body text."
+
+def test_nested_boilerplate_of_the_same_tag():
+    html = "<main><div class=\"sidebar\"><div>One</div><div>Two</div></div><p>Body text.</p></main>"
+    assert extract_text(html, max_chars=1000) == "Body text."
+
+@pytest.mark.parametrize("attribute", ["hidden", "hidden=\"\"", "aria-hidden=\"true\""])
+def test_hidden_elements_are_skipped(attribute):
+    html = f"<main><div {attribute}>SECRET</div><p>Visible text.</p></main>"
+    assert extract_text(html, max_chars=1000) == "Visible text."
+
+def test_stray_end_tags_are_ignored():
+    html = "<main></span><p>Body text.</p></div><p>More text.</p></main>"
+    assert extract_text(html, max_chars=1000) == "Body text. More text."
+
+def test_stops_once_budget_is_filled():
+    extractor = HTMLTextExtractor(max_chars=20, backend="html.parser")
+    assert extractor.feed("<main><p>" + "word " * 20 + "</p>")
+    assert len(extractor.close()) == 20
+
+def test_page_without_main_content_uses_the_rest_of_the_page():
+    html = "<body><div>First.</div><script>var x = 1;</script><div>Second.</div></body>"
+    assert extract_text(html, max_chars=1000) == "First. Second."
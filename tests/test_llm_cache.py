@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+import pytest
+from models.llm_cache import InMemoryLLMCache, SQLiteLLMCache, make_cache_key
+
+MESSAGES = [{"role": "user", "content": "What helps low back pain?"}]
+
+def test_the_key_changes_with_every_part_of_the_request():
+    key = make_cache_key("gpt-4o", None, 0, {"type": "json_object"}, MESSAGES)
+    assert key == make_cache_key("gpt-4o", None, 0, {"type": "json_object"}, [dict(MESSAGES[0])])
+    assert key != make_cache_key("gpt-4o-mini", None, 0, {"type": "json_object"}, MESSAGES)
+    assert key != make_cache_key("gpt-4o", "http://localhost:11434", 0, {"type": "json_object"}, MESSAGES)
+    assert key != make_cache_key("gpt-4o", None, 0, None, MESSAGES)
+    assert key != make_cache_key("gpt-4o", None, 0, {"type": "json_object"}, MESSAGES, stop="\n")
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path, monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr("models.llm_cache.time", SimpleNamespace(time=lambda: clock.now))
+
+    def make(max_entries):
+        clock.now += 1
+        if request.param == "memory":
+            return InMemoryLLMCache(max_entries)
+        return SQLiteLLMCache(str(tmp_path / "llm.sqlite"), max_entries)
+    make.clock = clock
+    return make
+
+def test_least_recently_used_responses_are_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    for key in ("a", "b"):
+        make_cache.clock.now += 1
+        cache.put(key, key.upper())
+    make_cache.clock.now += 1
+    assert cache.get("a") == "A"
+    make_cache.clock.now += 1
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert (cache.hits, cache.misses) == (3, 1)
+
+def test_sqlite_responses_survive_reopening_the_cache(tmp_path):
+    SQLiteLLMCache(str(tmp_path / "llm.sqlite"), 10).put("key", "response")
+    assert SQLiteLLMCache(str(tmp_path / "llm.sqlite"), 10).get("key") == "response"
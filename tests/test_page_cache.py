@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+import pytest
+from tools.page_cache import PageCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr("tools.page_cache.time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def _cache(tmp_path, fresh_seconds=60, max_pages=10, max_bytes=10_000):
+    return PageCache(str(tmp_path / "pages.sqlite"), fresh_seconds=fresh_seconds, max_pages=max_pages, max_bytes=max_bytes)
+
+def test_pages_are_looked_up_by_canonical_url(tmp_path, clock):
+    cache = _cache(tmp_path)
+    cache.store("HTTPS://Example.com/paper?utm_source=x#section", PageCache.hash_body(b"body"), "text", etag='"v1"')
+    page = cache.lookup("https://example.com/paper")
+    assert page is not None and page.text == "text" and page.fresh
+    assert cache.lookup("https://example.com/other") is None
+
+def test_stale_pages_are_revalidated_with_their_validators(tmp_path, clock):
+    cache = _cache(tmp_path, fresh_seconds=60)
+    cache.store("https://example.com/paper", PageCache.hash_body(b"body"), "text", etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    clock.now += 61
+    page = cache.lookup("https://example.com/paper")
+    assert not page.fresh
+    assert PageCache.conditional_headers(page) == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    cache.mark_revalidated(page, etag='"v2"')
+    page = cache.lookup("https://example.com/paper")
+    assert page.fresh and page.etag == '"v2"'
+
+def test_mirrored_pages_share_one_body(tmp_path, clock):
+    cache = _cache(tmp_path)
+    content_hash = PageCache.hash_body(b"same article")
+    cache.store("https://a.example.com/paper", content_hash, "text")
+    assert cache.get_body_text(content_hash) == "text"
+    cache.store("https://b.example.com/paper", content_hash, "text")
+    assert cache.stats()["pages"] == 2 and cache.stats()["bodies"] == 1
+
+def test_least_recently_used_pages_are_evicted_above_the_byte_limit(tmp_path, clock):
+    cache = _cache(tmp_path, max_bytes=10)
+    cache.store("https://example.com/a", PageCache.hash_body(b"a"), "aaaaaa")
+    clock.now += 1
+    cache.store("https://example.com/b", PageCache.hash_body(b"b"), "bbbbbb")
+    assert cache.lookup("https://example.com/a") is None
+    assert cache.lookup("https://example.com/b") is not None
+    assert cache.stats()["bodies"] == 1
+
+def test_bodies_cut_off_by_a_deadline_are_not_stored(tmp_path, clock):
+    cache = _cache(tmp_path)
+    cache.store("https://example.com/paper", PageCache.hash_body(b"old"), "old text", etag='"v1"')
+    clock.now += 3600
+    cache.store("https://example.com/paper", PageCache.hash_body(b"new, cut off"), "new", etag='"v2"', complete=False)
+    assert cache.lookup("https://example.com/paper") is None
+    assert cache.stats()["bodies"] == 0
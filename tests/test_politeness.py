@@ -0,0 +1,70 @@
+import asyncio
+import time
+import pytest
+from config.settings import politeness_settings
+from tools.politeness import HostScheduler, HostSlotTimeout
+
+URL = "https://example.org/page"
+
+def _scheduler(**overrides) -> HostScheduler:
+    return HostScheduler({**politeness_settings, "hosts": {}, "max_connections_per_host": 1, "min_delay": 0.05, **overrides})
+
+def test_requests_to_a_host_are_spaced_out():
+    scheduler = _scheduler()
+    started = time.monotonic()
+    for _ in range(3):
+        with scheduler.slot(URL, timeout=5):
+            pass
+    assert time.monotonic() - started >= 0.1
+
+def test_throttled_host_wait_is_capped_at_the_timeout():
+    scheduler = _scheduler(max_delay=30)
+    scheduler.response_received(URL, 429, {"Retry-After": "20"})
+    started = time.monotonic()
+    with pytest.raises(HostSlotTimeout):
+        with scheduler.slot(URL, timeout=0.2):
+            pass
+    assert time.monotonic() - started < 0.2
+    # The slot was given back and the failed caller did not book a start
+    host = scheduler._host(URL)
+    assert host.slots.acquire(blocking=False)
+    assert host.next_start - time.monotonic() <= 20.1
+
+def test_async_throttled_host_wait_is_capped_at_the_timeout():
+    scheduler = _scheduler(max_delay=30)
+    scheduler.response_received(URL, 503, {"Retry-After": "20"})
+
+    async def scrape():
+        async with scheduler.aslot(URL, timeout=0.2):
+            pass
+
+    with pytest.raises(HostSlotTimeout):
+        asyncio.run(scrape())
+
+def test_throttling_doubles_delay_and_success_eases_it_back():
+    scheduler = _scheduler(min_delay=0.5, max_delay=30, recovery_factor=0.5)
+    scheduler.response_received(URL, 429, {})
+    assert scheduler._host(URL).delay == 1.0
+    scheduler.response_received(URL, 200, {})
+    assert scheduler._host(URL).delay == 0.5
+
+def test_robots_disallow_and_crawl_delay():
+    scheduler = _scheduler(max_delay=30)
+    robots = scheduler._parse_robots(URL, 200, "User-agent: *\nDisallow: /private\nCrawl-delay: 2\n")
+    assert scheduler._apply_robots("https://example.org/private/page", robots, "test-agent") is False
+    assert scheduler._apply_robots(URL, robots, "test-agent") is True
+    assert scheduler._host(URL).min_delay == 2.0
+
+def test_robots_fetch_waits_for_the_host_like_any_other_request(monkeypatch):
+    import tools.politeness as politeness
+    scheduler = _scheduler(max_delay=30)
+    scheduler.response_received(URL, 429, {"Retry-After": "20"})
+    requested = []
+    monkeypatch.setattr(politeness, "http_request", lambda *args, **kwargs: requested.append(args))
+
+    started = time.monotonic()
+    with pytest.raises(HostSlotTimeout):
+        scheduler.allowed(URL, "test-agent", timeout=0.2)
+    assert time.monotonic() - started < 0.2
+    # The throttled host was not sent the request and the failed fetch was not cached
+    assert requested == [] and scheduler._cached_robots(URL) is None
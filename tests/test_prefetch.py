@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import pytest
+from tools.prefetch import Prefetcher, current_run_key, prefetch_run
+import tools.prefetch as prefetch_module
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    prefetcher = Prefetcher()
+    monkeypatch.setattr(prefetch_module, "_prefetcher", prefetcher)
+    return prefetcher
+
+def _fetch(url: str) -> str:
+    return f"text of {url}"
+
+def test_nothing_is_prefetched_outside_a_run(prefetcher):
+    prefetcher.start(current_run_key(), ["https://a"], _fetch)
+    assert prefetcher.stats()["prefetched"] == 0
+    assert prefetcher.take(current_run_key(), "https://a") is None
+
+def test_selected_pages_are_taken_and_the_rest_discarded(prefetcher):
+    with prefetch_run() as run_key:
+        prefetcher.start(run_key, ["https://a", "https://b"], _fetch)
+        assert prefetcher.take(run_key, "https://a").result() == "text of https://a"
+        assert prefetcher.take(run_key, "https://c") is None
+    stats = prefetcher.stats()
+    assert (stats["hits"], stats["misses"], stats["wasted"]) == (1, 1, 1)
+    assert prefetcher._runs == {}
+
+def test_run_that_fails_before_scraping_is_discarded(prefetcher):
+    with pytest.raises(RuntimeError):
+        with prefetch_run() as run_key:
+            prefetcher.start(run_key, ["https://a"], _fetch)
+            raise RuntimeError("result selector failed")
+    assert prefetcher._runs == {}
+
+def test_runs_with_the_same_question_do_not_share_prefetches(prefetcher):
+    keys = []
+
+    def run():
+        with prefetch_run() as run_key:
+            keys.append(run_key)
+            prefetcher.start(current_run_key(), ["https://a"], _fetch)
+            barrier.wait()
+
+    barrier = threading.Barrier(2)
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(keys)) == 2 and prefetcher.stats()["prefetched"] == 2
+
+def test_async_prefetch(prefetcher):
+    async def fetch(url: str) -> str:
+        return _fetch(url)
+
+    async def run():
+        with prefetch_run() as run_key:
+            prefetcher.astart(run_key, ["https://a", "https://b"], fetch)
+            return await prefetcher.take(run_key, "https://b")
+
+    assert asyncio.run(run()) == "text of https://b"
+    assert prefetcher._runs == {}
@@ -0,0 +1,78 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from config.settings import rate_limit_settings
+from utils.rate_limiter import RateLimiter, acall_with_rate_limit, call_with_rate_limit, parse_seconds
+
+SETTINGS = {**rate_limit_settings, "base_delay": 0.001, "max_delay": 0.01}
+
+def _limiter() -> RateLimiter:
+    return RateLimiter("test", requests_per_second=1000, burst=100, settings=SETTINGS)
+
+def _status_error(status: int, headers: dict = None) -> openai.APIStatusError:
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.APIStatusError("error", response=response, body=None)
+
+def _failing(*errors):
+    errors = list(errors)
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    return fn
+
+@pytest.mark.parametrize("value, seconds", [("2", 2.0), ("0.5", 0.5), ("6m0s", 360.0), ("250ms", 0.25), ("soon", None)])
+def test_parse_seconds(value, seconds):
+    assert parse_seconds(value) == seconds
+
+def test_rate_limited_calls_are_retried_and_slow_the_provider_down():
+    limiter = _limiter()
+    assert call_with_rate_limit(limiter, _failing(_status_error(429))) == "ok"
+    assert limiter.throttled == 1 and limiter.rate < limiter.max_rate
+
+@pytest.mark.parametrize("error", [_status_error(500), _status_error(503), _status_error(408),
+                                   openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com")),
+                                   ConnectionResetError()])
+def test_transient_failures_are_retried_without_slowing_down(error):
+    limiter = _limiter()
+    assert call_with_rate_limit(limiter, _failing(error)) == "ok"
+    assert limiter.retries == 1 and limiter.throttled == 0
+
+def test_transient_retries_are_limited():
+    limiter = _limiter()
+    with pytest.raises(openai.APIStatusError):
+        call_with_rate_limit(limiter, _failing(*[_status_error(502)] * (SETTINGS["transient_retries"] + 1)))
+
+def test_client_errors_are_not_retried():
+    limiter = _limiter()
+    with pytest.raises(openai.APIStatusError):
+        call_with_rate_limit(limiter, _failing(_status_error(400)))
+    assert limiter.retries == 0
+
+def test_async_calls_retry_transient_failures():
+    async def fn(call=_failing(_status_error(500))):
+        return call()
+
+    assert asyncio.run(acall_with_rate_limit(_limiter(), fn)) == "ok"
+
+@pytest.mark.parametrize("status", [500, 503, 408])
+def test_server_errors_do_not_speed_the_provider_up(status):
+    limiter = _limiter()
+    limiter.rate = 10.0
+    call_with_rate_limit(limiter, _failing(*[_status_error(status)] * SETTINGS["transient_retries"]))
+    # Only the final successful call adds back to the rate
+    assert limiter.rate == pytest.approx(10.0 + SETTINGS["increase_step"])
+
+def test_error_responses_passed_to_the_limiter_do_not_speed_it_up():
+    limiter = _limiter()
+    limiter.rate = 10.0
+    assert limiter.response_received(503, {}, 0) is None
+    assert limiter.rate == 10.0
+
+def test_calls_that_cannot_be_retried_raise_straight_away():
+    limiter = _limiter()
+    with pytest.raises(openai.APIStatusError):
+        call_with_rate_limit(limiter, _failing(_status_error(503)), can_retry=lambda: False)
+    assert limiter.retries == 0
@@ -0,0 +1,30 @@
+from tools.result_dedup import clean_title, dedupe_results, extract_identifiers, link_key, simhash
+
+def _result(link: str, title: str, snippet: str = "") -> dict:
+    return {"link": link, "title": title, "snippet": snippet}
+
+def test_link_key_matches_mirrors_of_a_page():
+    assert link_key("https://www.example.org/paper/?utm_medium=x&ref=feed") == link_key("http://example.org/paper")
+
+def test_identifiers_are_found_in_links_and_text():
+    result = _result("https://doi.org/10.1002/14651858.CD009790/full", "A trial", "PMID: 12345678 and PMC1234")
+    assert extract_identifiers(result) == {"doi": "10.1002/14651858.cd009790", "pmid": "12345678", "pmcid": "PMC1234"}
+
+def test_site_decorations_are_removed_from_titles():
+    assert clean_title("(PDF) Exercise therapy for low back pain - PubMed") == "Exercise therapy for low back pain"
+
+def test_short_texts_have_no_simhash():
+    assert simhash("Low back pain") is None
+
+def test_copies_of_a_paper_are_clustered():
+    results = [_result("https://www.researchgate.net/publication/1", "(PDF) Exercise therapy for chronic low back pain in adults"),
+               _result("https://pmc.ncbi.nlm.nih.gov/articles/PMC1234/", "Exercise therapy for chronic low back pain in adults - PMC"),
+               _result("https://example.org/other", "Manual therapy versus surgery for sciatica outcomes")]
+    deduped = dedupe_results(results)
+    assert [result["link"] for result in deduped] == ["https://pmc.ncbi.nlm.nih.gov/articles/PMC1234/", "https://example.org/other"]
+    assert deduped[0]["duplicates"] == ["https://www.researchgate.net/publication/1"]
+
+def test_different_identifiers_are_never_clustered():
+    results = [_result("https://pmc.ncbi.nlm.nih.gov/articles/PMC1/", "Exercise therapy for low back pain: trial 1"),
+               _result("https://pmc.ncbi.nlm.nih.gov/articles/PMC2/", "Exercise therapy for low back pain: trial 1")]
+    assert len(dedupe_results(results)) == 2
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from config.settings import router_settings
+from models.router import ModelRouter
+
+ENDPOINTS = {"local": {"server": "http://localhost:1234", "model": "local-model"},
+             "remote": {"server": None, "model": "remote-model"}}
+
+def _router(**overrides) -> ModelRouter:
+    settings = {**router_settings, "policies": {"planner": ["local", "remote"]}, "endpoints": {},
+                "failure_threshold": 2, **overrides}
+    return ModelRouter(ENDPOINTS, settings)
+
+def test_routing_is_off_by_default():
+    assert router_settings["enabled"] is False
+    assert all(policy == ["openai"] for policy in router_settings["policies"].values())
+
+def test_policy_order_breaks_ties():
+    assert [name for name, _ in _router().rank("planner")] == ["local", "remote"]
+
+def test_fails_over_to_next_endpoint():
+    router = _router()
+    calls = []
+
+    def attempt(name, endpoint):
+        calls.append(name)
+        if name == "local":
+            raise ConnectionError("refused")
+        return "answer"
+
+    assert router.call("planner", attempt) == "answer"
+    assert calls == ["local", "remote"]
+
+def test_failing_endpoint_goes_down_for_cooldown():
+    router = _router()
+
+    def attempt(name, endpoint):
+        if name == "local":
+            raise ConnectionError("refused")
+        return name
+
+    for _ in range(2):
+        router.call("planner", attempt)
+    assert [name for name, _ in router.rank("planner")] == ["remote", "local"]
+
+def test_raises_last_error_when_every_endpoint_fails():
+    def attempt(name, endpoint):
+        raise ConnectionError(name)
+
+    with pytest.raises(ConnectionError, match="remote"):
+        _router().call("planner", attempt)
+
+def test_async_call_fails_over_and_releases_in_flight():
+    router = _router()
+
+    async def attempt(name, endpoint):
+        if name == "local":
+            raise ConnectionError("refused")
+        return name
+
+    assert asyncio.run(router.acall("planner", attempt)) == "remote"
+    assert all(stats.in_flight == 0 for stats in router.stats.values())
+
+def test_unknown_node_uses_default_policy():
+    router = _router(default_policy=["remote"])
+    assert [name for name, _ in router.rank("writer")] == ["remote"]
+
+def _routed_planner(monkeypatch):
+    import agents.agents as agents
+    router = ModelRouter(ENDPOINTS, {**router_settings, "policies": {"search_planner": ["local"]}, "endpoints": {}})
+    monkeypatch.setattr(agents, "get_model_router", lambda: router)
+    # Starts out as an OpenAI agent, but its node's policy only has the local endpoint
+    return agents.SearchPlannerAgent(state={}, model="remote-model", server=None, temperature=0.5, node="search_planner")
+
+def test_routed_call_that_fails_on_a_local_endpoint_is_handled(monkeypatch):
+    import requests
+    import agents.agents as agents
+    from prompts.prompts import search_planner_prompt_template
+
+    def refuse(*args, **kwargs):
+        raise requests.ConnectionError("refused")
+    monkeypatch.setattr(agents, "http_request", refuse)
+
+    agent = _routed_planner(monkeypatch)
+    response = agent.invoke("What helps low back pain?", prompt=search_planner_prompt_template)
+    assert response == {"Request error occurred: refused"}
+    # The router's choice does not overwrite the agent's own model and server
+    assert (agent.model, agent.server) == ("remote-model", None)
+
+def test_async_routed_call_that_fails_on_a_local_endpoint_is_handled(monkeypatch):
+    import httpx
+    import agents.agents as agents
+    from prompts.prompts import search_planner_prompt_template
+
+    async def refuse(*args, **kwargs):
+        raise httpx.ConnectError("refused")
+    monkeypatch.setattr(agents, "async_http_request", refuse)
+
+    agent = _routed_planner(monkeypatch)
+    response = asyncio.run(agent.ainvoke("What helps low back pain?", prompt=search_planner_prompt_template))
+    assert response == {"Request error occurred: refused"}
+    assert (agent.model, agent.server) == ("remote-model", None)
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+import pytest
+from tools.search_cache import SearchCache, normalize_search_term
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr("tools.search_cache.time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def _cache(tmp_path, ttl_seconds=60, max_entries=10):
+    return SearchCache(str(tmp_path / "search.sqlite"), ttl_seconds=ttl_seconds, max_entries=max_entries)
+
+def test_searches_differing_only_in_case_and_spacing_share_an_entry(tmp_path, clock):
+    cache = _cache(tmp_path)
+    cache.put("Low back  pain", {"organic": [1]})
+    assert normalize_search_term(" LOW back pain ") == "low back pain"
+    assert cache.get(" low BACK pain") == {"organic": [1]}
+    assert cache.get("low back pain", {"num": 20}) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.put("sciatica", {"organic": []})
+    clock.now += 61
+    assert cache.get("sciatica") is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.put("a", {"q": "a"})
+    clock.now += 1
+    cache.put("b", {"q": "b"})
+    clock.now += 1
+    assert cache.get("a") is not None
+    clock.now += 1
+    cache.put("c", {"q": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["entries"] == 2
+
+def test_entries_survive_reopening_the_cache(tmp_path, clock):
+    _cache(tmp_path).put("sciatica", {"organic": [1]})
+    assert _cache(tmp_path).get("sciatica") == {"organic": [1]}
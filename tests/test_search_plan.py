@@ -0,0 +1,31 @@
+from tools.search_plan import fuse_results, get_search_terms
+
+def test_search_terms_are_deduplicated_and_capped():
+    plan = {"search_term": "Low back pain", "search_terms": ["low  back pain", "", 3, "lbp", "a", "b", "c"]}
+    assert get_search_terms(plan) == ["Low back pain", "lbp", "a", "b"]
+
+def test_plan_without_search_terms():
+    assert get_search_terms({"overall_strategy": "x"}) == []
+
+def test_results_found_by_several_searches_rank_first():
+    first = [{"link": "https://a.org/1"}, {"link": "https://b.org/2"}, {"link": "https://c.org/3"}]
+    second = [{"link": "https://c.org/3/"}, {"link": "http://www.a.org/1?utm_source=q"}]
+    assert [result["link"] for result in fuse_results([first, second])] == ["https://a.org/1", "https://c.org/3/", "https://b.org/2"]
+
+def test_plan_without_search_terms_gives_the_same_response_sync_and_async():
+    import asyncio
+    import json
+    from langchain_core.messages import HumanMessage
+    from tools.google_serper import aget_google_serper, get_google_serper
+
+    plan = HumanMessage(content=json.dumps({"search_term": " ", "overall_strategy": "x"}))
+    state = {"research_question": "What helps low back pain?"}
+    sync_state = get_google_serper(state, lambda: plan)
+    async_state = asyncio.run(aget_google_serper(state, lambda: plan))
+    assert sync_state["web_search_response"] == async_state["web_search_response"] == "No search terms found in the search plan."
+
+def test_searching_nothing_returns_no_responses():
+    import asyncio
+    from tools.google_serper import asearch_serper_many, search_serper_many
+
+    assert search_serper_many([]) == [] and asyncio.run(asearch_serper_many([])) == []
@@ -0,0 +1,20 @@
+import json
+from utils import tracing
+
+def _record(name: str):
+    with tracing._events_lock:
+        tracing._events.append({"name": name, "ph": "i"})
+
+def test_chrome_trace_replaces_file_from_earlier_process(tmp_path, monkeypatch):
+    path = str(tmp_path / "trace.json")
+    with open(path, "w") as file:
+        json.dump({"traceEvents": [{"name": "old run"}]}, file)
+    monkeypatch.setattr(tracing, "_chrome_paths", set())
+
+    _record("first")
+    tracing.flush_trace(path, "chrome")
+    _record("second")
+    tracing.flush_trace(path, "chrome")
+
+    with open(path) as file:
+        assert [event["name"] for event in json.load(file)["traceEvents"]] == ["first", "second"]
@@ -0,0 +1,86 @@
+import json
+from tools.website_scraper import BASE_ERROR_MSG, get_selected_urls
+
+def test_selected_urls_list():
+    assert get_selected_urls(json.dumps({"selected_page_urls": ["https://a", "https://b", "https://a"]})) == ["https://a", "https://b"]
+
+def test_selected_url_single():
+    assert get_selected_urls(json.dumps({"selected_page_url": "https://a"})) == ["https://a"]
+
+def test_selector_error_is_returned():
+    assert get_selected_urls(json.dumps({"error": "No relevant results"})) == ["No relevant results"]
+
+def test_no_url_keys_gives_error_entry():
+    urls = get_selected_urls(json.dumps({"title": "x"}))
+    assert len(urls) == 1 and urls[0].startswith(BASE_ERROR_MSG)
+
+def test_page_reader_stops_at_byte_ceiling():
+    from tools.website_scraper import PageReader
+    reader = PageReader("text/plain", max_bytes=10)
+    assert reader.feed(b"0123456789abcdef")
+    assert reader.truncated and reader.bytes_read == 10
+    assert reader.close() == "0123456789"
+
+def test_page_reader_uses_meta_charset():
+    from tools.website_scraper import PageReader
+    reader = PageReader("text/html")
+    reader.feed('<meta charset="iso-8859-1"><main><p>Caf\xe9</p></main>'.encode("iso-8859-1"))
+    assert reader.close() == "Caf\xe9"
+
+class _StreamedResponse():
+    def __init__(self, chunks, clock):
+        self.status_code = 200
+        self.headers = {"Content-Type": "text/plain", "ETag": '"v1"'}
+        self._chunks = chunks
+        self._clock = clock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self._chunks:
+            yield chunk
+            self._clock.now += 20   # The site is slow to send the next chunk
+
+def test_page_cut_off_by_the_deadline_is_returned_but_not_cached(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    import tools.website_scraper as website_scraper
+    from tools.page_cache import PageCache
+
+    clock = SimpleNamespace(now=0.0)
+    page_cache = PageCache(str(tmp_path / "pages.sqlite"), fresh_seconds=3600, max_pages=10, max_bytes=10_000)
+    monkeypatch.setattr(website_scraper, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(website_scraper, "get_page_cache", lambda: page_cache)
+    monkeypatch.setattr(website_scraper, "get_host_scheduler", lambda: None)
+    monkeypatch.setattr(website_scraper, "http_request", lambda *args, **kwargs: _StreamedResponse([b"first ", b"second ", b"third"], clock))
+
+    content = website_scraper._fetch_page_content("https://example.com/slow", timeout=15)
+    assert content == "first second"
+    assert page_cache.lookup("https://example.com/slow") is None
+    assert page_cache.stats()["bodies"] == 0
+
+def test_each_page_gets_its_own_deadline(monkeypatch):
+    import time
+    import tools.website_scraper as website_scraper
+
+    def fetch(url, timeout=None):
+        if "slow" in url:
+            time.sleep(1.5)
+        return f"text of {url}"
+    monkeypatch.setattr(website_scraper, "fetch_page_content", fetch)
+    monkeypatch.setattr(website_scraper, "get_prefetcher", lambda: None)
+    monkeypatch.setattr(website_scraper, "index_documents", lambda pages: None)
+
+    selection = json.dumps({"selected_page_urls": ["https://example.com/slow", "https://example.com/fast"]})
+    started = time.monotonic()
+    response = website_scraper.scrape_websites({"scraper_response": []}, selection, max_workers=2, timeout=0.3)
+    # The slow page is given up on after its own 0.3 seconds, not the 1.3 seconds allowed for the whole pass
+    assert time.monotonic() - started < 1.0
+    slow, fast = [message.content for message in response["scraper_response"]]
+    assert "Timed out after 0.3 seconds" in slow and "text of https://example.com/fast" in fast
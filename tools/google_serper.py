@@ -1,11 +1,23 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import json
-from typing import Any, Callable, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 from langchain_community.utilities import GoogleSerperAPIWrapper
 import os
 from termcolor import colored 
 import requests
+from config.settings import serper_settings
 from states.state import AgentGraphState
+from tools.prefetch import current_run_key, get_prefetcher
+from tools.result_dedup import dedupe_results
+from tools.search_cache import SearchCache, get_search_cache
+from tools.search_plan import fuse_results, get_search_terms
+from tools.website_scraper import afetch_page_content, fetch_page_content
 from utils.helper_functions import load_config, log_function_call, validate_json
+from utils.http_clients import async_http_request, http_request
+from utils.single_flight import get_single_flight
+from utils.tracing import trace_event
 
 config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.yaml')
 
@@ -29,6 +41,158 @@ def format_results(organic_results):
 
     return '\n'.join(result_strings)
 
+@log_function_call
+def search_serper(search: str, params: Optional[Dict[str, Any]] = None) -> dict:
+    """
+        Sends a search to Google Serper, using the local search cache when the same search has been made recently.
+        Runs that make the same search at the same time share one request (see utils/single_flight.py).
+
+        Args:
+            search (str): The search term.
+            params (Dict[str, Any], optional): Any other Serper request parameters e.g. "num" or "gl".
+
+        Returns:
+            dict: The Serper JSON response.
+    """
+    results, _ = get_single_flight("serper").do(SearchCache.make_key(search, params), _search_serper, search, params)
+    return results
+
+def _search_serper(search: str, params: Optional[Dict[str, Any]]) -> dict:
+    search_cache = get_search_cache()
+    if search_cache is not None:
+        results = search_cache.get(search, params)
+        if results is not None:
+            print(colored(f"Serper cache hit for: {search}", "blue"))
+            return results
+
+    headers = {
+        'Content-Type': 'application/json',
+        'X-API-KEY': os.environ['SERPER_API_KEY']
+    }
+
+    payload = json.dumps({'q': search, **(params or {})})
+
+    # Ready to make a POST request to Google Serper
+    response = http_request("POST", serper_settings["url"], headers=headers, data=payload)
+    response.raise_for_status() # Raise an HTTPError for bad responses (4XX, 5XX)
+    results = response.json()
+
+    if search_cache is not None:
+        search_cache.put(search, results, params)
+    return results
+
+@log_function_call
+async def asearch_serper(search: str, params: Optional[Dict[str, Any]] = None) -> dict:
+    """
+        Async version of search_serper.
+    """
+    results, _ = await get_single_flight("serper").ado(SearchCache.make_key(search, params), _asearch_serper, search, params)
+    return results
+
+async def _asearch_serper(search: str, params: Optional[Dict[str, Any]]) -> dict:
+    search_cache = get_search_cache()
+    if search_cache is not None:
+        results = search_cache.get(search, params)
+        if results is not None:
+            print(colored(f"Serper cache hit for: {search}", "blue"))
+            return results
+
+    headers = {
+        'Content-Type': 'application/json',
+        'X-API-KEY': os.environ['SERPER_API_KEY']
+    }
+
+    response = await async_http_request("POST", serper_settings["url"], headers=headers, json={'q': search, **(params or {})})
+    response.raise_for_status()
+    results = response.json()
+
+    if search_cache is not None:
+        search_cache.put(search, results, params)
+    return results
+
+@log_function_call
+def search_serper_many(searches: List[str]) -> List[dict]:
+    """
+        Sends several searches to Google Serper at the same time (each one through search_serper, so the search cache,
+        single flight and rate limiter still apply).
+
+        Args:
+            searches (List[str]): The search terms.
+
+        Returns:
+            List[dict]: The Serper JSON response of each search that succeeded, in the same order as the searches.
+                Empty if there were no searches.
+    """
+    if not searches:
+        return []
+    if len(searches) == 1:
+        return [search_serper(searches[0])]
+    with ThreadPoolExecutor(max_workers=len(searches), thread_name_prefix="serper") as executor:
+        # Each thread runs in a copy of the caller's context so its tracing spans and metrics belong to this node
+        futures = [executor.submit(contextvars.copy_context().run, search_serper, search) for search in searches]
+        return _successful_responses(searches, [_outcome(future) for future in futures])
+
+@log_function_call
+async def asearch_serper_many(searches: List[str]) -> List[dict]:
+    """
+        Async version of search_serper_many.
+    """
+    if not searches:
+        return []
+    if len(searches) == 1:
+        return [await asearch_serper(searches[0])]
+    outcomes = await asyncio.gather(*(asearch_serper(search) for search in searches), return_exceptions=True)
+    return _successful_responses(searches, outcomes)
+
+def _outcome(future) -> Union[dict, BaseException]:
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+def _successful_responses(searches: List[str], outcomes: List[Union[dict, BaseException]]) -> List[dict]:
+    # A failed search does not lose the results of the others. Only if every search failed is the error raised.
+    failures = [(search, outcome) for search, outcome in zip(searches, outcomes) if isinstance(outcome, BaseException)]
+    if failures:
+        trace_event("search_failed", searches=[search for search, _ in failures],
+                    errors=[repr(error) for _, error in failures])
+        if len(failures) == len(outcomes):
+            raise failures[0][1]
+    return [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+
+def _organic_results(responses: List[dict]) -> Optional[List[dict]]:
+    # Check if 'organic' key is in the results (NB: 'organic' is a key in a dictionary, specifically representing 
+    # the organic (natural, non-paid) search results returned by the Google Serper API.)
+    organic = [response['organic'] for response in responses if 'organic' in response]
+    if not organic:
+        return None
+    # The searches are merged into one ranking (see tools/search_plan.py), then copies of the same paper on different
+    # sites are shown to the result selector once (see tools/result_dedup.py)
+    results = dedupe_results(fuse_results(organic))[:serper_settings["max_results"]]
+    if len(organic) > 1:
+        trace_event("search_results_fused", searches=len(organic), results=sum(map(len, organic)), kept=len(results))
+    return results
+
+def _prefetch_links(organic_results: Optional[List[dict]]) -> List[str]:
+    # The top links start downloading while the result selector decides which to scrape (see tools/prefetch.py)
+    return [result["link"] for result in organic_results or [] if result.get("link")]
+
+def _no_search_terms_state(state: AgentGraphState, plan_data: dict):
+    # e.g. the planner left out "search_term" or gave it as an empty string
+    print(colored(f"The search plan has no search terms: {plan_data}\n", "red"))
+    return {**state, 'web_search_response': 'No search terms found in the search plan.'}
+
+def _search_state(state: AgentGraphState, organic_results: Optional[List[dict]]):
+    if organic_results is not None:
+        formatted_results = format_results(organic_results)
+
+        ## Note that when objects, classes, dictionaries, or lists are passed in to a function,
+        # it is the ref that is beig passed in. It can therefore be modified directly.
+        print(colored(f"Web search results:{formatted_results}\n", 'light_blue'))
+        return {**state, 'web_search_response': formatted_results}
+    else:
+        return {**state, 'web_search_response': 'No organic results found.'}
+
 # SERPer (Search Engine Results Page)
 @log_function_call
 def get_google_serper(state: AgentGraphState, get_plan: Callable[[], Any]):
@@ -40,33 +204,40 @@ def get_google_serper(state: AgentGraphState, get_plan: Callable[[], Any]):
     print(colored(plan_data, "magenta"))
     try:
         plan_data = json.loads(plan_data)
-        search = plan_data.get("search_term")
-
-        print(colored(f"The following is going to be used for the serper search: {search}\n", "blue"))
-        web_searcher_server_url = "https://google.serper.dev/search"
-        headers = {
-            'Content-Type': 'application/json',
-            'X-API-KEY': os.environ['SERPER_API_KEY']
-        }
+        searches = get_search_terms(plan_data)
+        if not searches:
+            return _no_search_terms_state(state, plan_data)
 
-        payload = json.dumps({'q': search})
+        print(colored(f"The following is going to be used for the serper search: {searches}\n", "blue"))
+        organic_results = _organic_results(search_serper_many(searches))
+        prefetcher = get_prefetcher()
+        if prefetcher is not None:
+            prefetcher.start(current_run_key(), _prefetch_links(organic_results), fetch_page_content)
+        return _search_state(state, organic_results)
+    except json.JSONDecodeError as e:
+        validate_json(plan_data)
 
-        # Ready to make a POST request to Google Serper
-        response = requests.post(web_searcher_server_url, headers=headers, data=payload)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4XX, 5XX)
-        results = response.json()
+@log_function_call
+async def aget_google_serper(state: AgentGraphState, get_plan: Callable[[], Any]):
+    """
+        Async version of get_google_serper, so many searches can wait on Serper at the same time on one event loop.
+    """
+    load_config(config_path)
 
-        # Check if 'organic' key is in the results (NB: 'organic' is a key in a dictionary, specifically representing 
-        # the organic (natural, non-paid) search results returned by the Google Serper API.)
-        if 'organic' in results:
-            formatted_results = format_results(results['organic'])
+    plan_data = get_plan().content
+    print(colored(plan_data, "magenta"))
+    try:
+        plan_data = json.loads(plan_data)
+        searches = get_search_terms(plan_data)
+        if not searches:
+            return _no_search_terms_state(state, plan_data)
 
-            ## Note that when objects, classes, dictionaries, or lists are passed in to a function,
-            # it is the ref that is beig passed in. It can therefore be modified directly.
-            print(colored(f"Web search results:{formatted_results}\n", 'light_blue'))
-            return {**state, 'web_search_response': formatted_results}
-        else:
-            return {**state, 'web_search_response': 'No organic results found.'}
+        print(colored(f"The following is going to be used for the serper search: {searches}\n", "blue"))
+        organic_results = _organic_results(await asearch_serper_many(searches))
+        prefetcher = get_prefetcher()
+        if prefetcher is not None:
+            prefetcher.astart(current_run_key(), _prefetch_links(organic_results), afetch_page_content)
+        return _search_state(state, organic_results)
     except json.JSONDecodeError as e:
         validate_json(plan_data)
     
@@ -0,0 +1,235 @@
+from html.parser import HTMLParser
+import re
+from typing import Dict, List, Optional
+from config.settings import scraper_settings
+from utils.helper_functions import log_function_call
+
+try:
+    from lxml import etree
+except ImportError: # lxml is optional - the standard library parser is used without it
+    etree = None
+
+# Subtrees whose text is never useful as evidence
+SKIP_TAGS = {"head", "script", "style", "noscript", "template", "svg", "canvas", "iframe", "nav", "header", "footer",
+             "aside", "form", "button", "select", "figure"}
+SKIP_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog"}
+BOILERPLATE_PATTERN = re.compile(r"\b(nav|navbar|menu|footer|sidebar|cookie|banner|breadcrumbs?|share|social|advert|ads|promo|related|comments?|skip-link)\b", re.I)
+
+# Tags that mark the main content of the page
+MAIN_TAGS = {"article", "main"}
+
+# Elements without an end tag - the standard library parser does not close them for us
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+# End tags HTML lets pages leave out: starting one of these elements closes the open elements listed for it
+# e.g. "<li>Home<li>About" is two sibling list items. The standard library parser does not do this for us.
+IMPLIED_END_TAGS = {"li": {"li"}, "dt": {"dt", "dd"}, "dd": {"dt", "dd"}, "tr": {"tr", "td", "th"}, "td": {"td", "th"},
+                    "th": {"td", "th"}, "option": {"option"}, "p": {"p"}}
+# Block elements that close an open <p>
+CLOSES_P_TAGS = {"address", "article", "aside", "blockquote", "div", "dl", "fieldset", "figure", "footer", "form", "h1", "h2",
+                 "h3", "h4", "h5", "h6", "header", "hr", "main", "nav", "ol", "p", "pre", "section", "table", "ul"}
+
+CHARS_PER_TOKEN = 4
+
+class _TextCollector():
+    """
+        Collects the text of a page from start/end/data parser events, skipping boilerplate subtrees and keeping
+        the text inside <article>/<main> separately so it can be preferred over the rest of the page.
+        The same object is the target for the lxml parser and is driven by the standard library parser.
+    """
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.main_parts: List[str] = []
+        self.other_parts: List[str] = []
+        self.main_chars = 0
+        self.other_chars = 0
+        self.done = False
+        # The open elements, and where in that stack the boilerplate subtree being skipped and the main content start.
+        # Tracking the whole stack means a subtree whose end tag the page left out still ends when its parent does.
+        self._open: List[str] = []
+        self._skip_at: Optional[int] = None
+        self._main_at: Optional[int] = None
+        self.main_seen = False
+
+    def _is_boilerplate(self, tag: str, attrs: Dict[str, str]) -> bool:
+        if tag in SKIP_TAGS or (attrs.get("role") or "").lower() in SKIP_ROLES:
+            return True
+        # A bare attribute such as <div hidden> is given with the value None
+        if "hidden" in attrs or attrs.get("aria-hidden") == "true":
+            return True
+        marker = f"{attrs.get('id') or ''} {attrs.get('class') or ''}"
+        return bool(marker.strip()) and BOILERPLATE_PATTERN.search(marker) is not None
+
+    def _close_to(self, depth: int):
+        # Closes the open elements from depth upwards, ending any skipped subtree or main content among them
+        del self._open[depth:]
+        if self._skip_at is not None and self._skip_at >= depth:
+            self._skip_at = None
+        if self._main_at is not None and self._main_at >= depth:
+            self._main_at = None
+
+    def start(self, tag: str, attrs: Dict[str, str]):
+        tag = tag.lower()
+        if tag in VOID_TAGS:
+            return
+        implied = IMPLIED_END_TAGS.get(tag, set()) | ({"p"} if tag in CLOSES_P_TAGS else set())
+        while self._open and self._open[-1] in implied:
+            self._close_to(len(self._open) - 1)
+
+        depth = len(self._open)
+        self._open.append(tag)
+        if self._skip_at is not None:
+            return
+        if self._main_at is None and (tag in MAIN_TAGS or (attrs.get("role") or "").lower() == "main"):
+            self._main_at = depth
+            self.main_seen = True
+            return
+        if self._is_boilerplate(tag, attrs):
+            self._skip_at = depth
+
+    def end(self, tag: str):
+        tag = tag.lower()
+        # The end tag closes the nearest open element of the same name and everything opened inside it.
+        # Stray end tags are ignored.
+        for depth in range(len(self._open) - 1, -1, -1):
+            if self._open[depth] == tag:
+                self._close_to(depth)
+                return
+
+    def data(self, text: str):
+        if self._skip_at is not None or self.done:
+            return
+        text = text.strip()
+        if not text:
+            return
+        if self._main_at is not None:
+            self.main_parts.append(text)
+            self.main_chars += len(text) + 1
+            if self.main_chars >= self.max_chars:
+                self.done = True
+        elif self.other_chars < self.max_chars:
+            # Text outside the main content is only kept (up to the budget) in case the page has no <article>/<main>
+            self.other_parts.append(text)
+            self.other_chars += len(text) + 1
+
+    def close(self) -> str:
+        parts = self.main_parts if self.main_parts else self.other_parts
+        return " ".join(parts)[:self.max_chars]
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, collector: _TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+class _LxmlTarget(_TextCollector):
+    # lxml passes the attributes as its own mapping type and calls close() itself
+    def start(self, tag, attrs):
+        super().start(tag, dict(attrs))
+
+def get_parser_backend(backend: Optional[str] = None) -> str:
+    """
+        Resolves the parser backend: "lxml" when it is requested (or "auto") and installed, otherwise "html.parser".
+    """
+    backend = backend or scraper_settings["parser_backend"]
+    if backend in ("auto", "lxml") and etree is not None:
+        return "lxml"
+    return "html.parser"
+
+class HTMLTextExtractor():
+    """
+        Incremental HTML to text extractor with a character budget.
+
+        Feed it the page in chunks (e.g. as they are downloaded). Navigation, scripts, styles and other boilerplate
+        subtrees are skipped and text inside <article>/<main> is preferred. feed() returns True as soon as the
+        budget has been filled, so the caller can stop parsing (and downloading) the rest of the page.
+
+        Args:
+            max_chars (int, optional): Character budget. Defaults to scraper_settings["max_content_chars"].
+            max_tokens (int, optional): Token budget, converted at roughly 4 characters per token. Used instead of max_chars if given.
+            backend (str, optional): "lxml", "html.parser" or "auto". Defaults to scraper_settings["parser_backend"].
+    """
+    def __init__(self, max_chars: int = None, max_tokens: int = None, backend: str = None):
+        if max_tokens is not None:
+            max_chars = max_tokens * CHARS_PER_TOKEN
+        max_chars = max_chars or scraper_settings["max_content_chars"]
+        self.backend = get_parser_backend(backend)
+        # Pages without main content are given up on once this much more HTML has been read after the budget was filled
+        self._lookahead_chars = max_chars * 8
+        self._chars_fed = 0
+        self._other_full_at: Optional[int] = None
+
+        if self.backend == "lxml":
+            self.collector = _LxmlTarget(max_chars)
+            self._parser = etree.HTMLParser(target=self.collector, recover=True)
+        else:
+            self.collector = _TextCollector(max_chars)
+            self._parser = _StdlibParser(self.collector)
+
+    @property
+    def done(self) -> bool:
+        return self.collector.done
+
+    def feed(self, chunk: str) -> bool:
+        """
+            Parses the next chunk of the page.
+
+            Returns:
+                bool: True once the budget has been filled and the rest of the page can be ignored.
+        """
+        if self.done:
+            return True
+        self._parser.feed(chunk)
+        self._chars_fed += len(chunk)
+
+        collector = self.collector
+        if not collector.main_seen and collector.other_chars >= collector.max_chars:
+            if self._other_full_at is None:
+                self._other_full_at = self._chars_fed
+            elif self._chars_fed - self._other_full_at > self._lookahead_chars:
+                collector.done = True
+        return self.done
+
+    def close(self) -> str:
+        """
+            Finishes parsing and returns the extracted text (cut to the budget).
+        """
+        if not self.done:
+            try:
+                self._parser.close()
+            except Exception:
+                # Truncated or badly broken HTML - keep whatever text was collected
+                pass
+        return self.collector.close()
+
+@log_function_call
+def extract_text(html: str, max_chars: int = None, max_tokens: int = None, backend: str = None, chunk_size: int = 16384) -> str:
+    """
+        Extracts the main text of a page, stopping as soon as the budget is filled.
+
+        Args:
+            html (str): The HTML of the page.
+            max_chars (int, optional): Character budget. Defaults to scraper_settings["max_content_chars"].
+            max_tokens (int, optional): Token budget, used instead of max_chars if given.
+            backend (str, optional): "lxml", "html.parser" or "auto".
+            chunk_size (int, optional): Characters parsed between budget checks.
+
+        Returns:
+            str: The extracted text.
+    """
+    extractor = HTMLTextExtractor(max_chars=max_chars, max_tokens=max_tokens, backend=backend)
+    for start in range(0, len(html), chunk_size):
+        if extractor.feed(html[start:start + chunk_size]):
+            break
+    return extractor.close()
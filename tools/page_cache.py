@@ -0,0 +1,213 @@
+from dataclasses import dataclass
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from config.settings import page_cache_settings
+from utils.helper_functions import canonicalize_url, log_function_call
+
+@dataclass
+class CachedPage:
+    """
+        A scraped page held in the page cache.
+
+        Attributes:
+            url (str): The canonical URL of the page.
+            text (str): The text extracted from the page.
+            content_hash (str): SHA-256 of the downloaded body.
+            etag (str | None): The ETag validator sent by the site.
+            last_modified (str | None): The Last-Modified validator sent by the site.
+            fetched_at (float): When the page was last downloaded or revalidated.
+            fresh (bool): True if the page can be used without revalidating it with the site.
+    """
+    url: str
+    text: str
+    content_hash: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    fresh: bool
+
+class PageCache():
+    """
+        Content-addressed store of scraped pages kept in SQLite.
+
+        Pages are keyed by canonical URL and point at a body row keyed by the SHA-256 of the downloaded
+        content, so the same article mirrored under several URLs is only parsed and stored once. The ETag
+        and Last-Modified validators are kept so stale pages can be revalidated with a conditional GET.
+        The least recently used pages are evicted once max_pages or max_bytes is exceeded.
+    """
+    @log_function_call
+    def __init__(self, path: str, fresh_seconds: float, max_pages: int, max_bytes: int):
+        self.path = path
+        self.fresh_seconds = fresh_seconds
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS bodies (
+                                            content_hash TEXT PRIMARY KEY,
+                                            text TEXT NOT NULL,
+                                            size INTEGER NOT NULL)""")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+                                            url TEXT PRIMARY KEY,
+                                            content_hash TEXT NOT NULL REFERENCES bodies (content_hash),
+                                            etag TEXT,
+                                            last_modified TEXT,
+                                            fetched_at REAL NOT NULL,
+                                            last_access REAL NOT NULL)""")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages (last_access)")
+
+    @staticmethod
+    def hash_body(body: bytes) -> str:
+        return hashlib.sha256(body).hexdigest()
+
+    @log_function_call
+    def lookup(self, url: str) -> Optional[CachedPage]:
+        """
+            Gets a cached page.
+
+            Args:
+                url (str): The page URL (does not need to be canonical).
+
+            Returns:
+                CachedPage | None: The cached page, or None if the page has never been stored.
+        """
+        url = canonicalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("""SELECT bodies.text, pages.content_hash, pages.etag, pages.last_modified, pages.fetched_at
+                                              FROM pages JOIN bodies ON bodies.content_hash = pages.content_hash
+                                              WHERE pages.url = ?""", (url,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE pages SET last_access = ? WHERE url = ?", (now, url))
+        fresh = now - row[4] <= self.fresh_seconds
+        if fresh:
+            self.hits += 1
+        return CachedPage(url, row[0], row[1], row[2], row[3], row[4], fresh)
+
+    @staticmethod
+    def conditional_headers(page: Optional[CachedPage]) -> Dict[str, str]:
+        """
+            Gets the If-None-Match / If-Modified-Since headers needed to revalidate a cached page.
+        """
+        headers = {}
+        if page is not None:
+            if page.etag:
+                headers["If-None-Match"] = page.etag
+            if page.last_modified:
+                headers["If-Modified-Since"] = page.last_modified
+        return headers
+
+    @log_function_call
+    def mark_revalidated(self, page: CachedPage, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """
+            Records that the site answered 304 Not Modified for a cached page, making it fresh again.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("""UPDATE pages SET fetched_at = ?, last_access = ?,
+                                            etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+                                        WHERE url = ?""", (now, now, etag, last_modified, page.url))
+            self.revalidated += 1
+
+    @log_function_call
+    def get_body_text(self, content_hash: str) -> Optional[str]:
+        """
+            Gets the text already extracted from a body with the same content hash, if there is one.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT text FROM bodies WHERE content_hash = ?", (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    @log_function_call
+    def store(self, url: str, content_hash: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+              complete: bool = True):
+        """
+            Stores the text extracted from a downloaded page and evicts pages above the size limits.
+
+            A body that was cut off part way for a reason that depends on timing (e.g. the scraper's deadline) is
+            not stored: it would be served as fresh, and once stale the site would answer the conditional GET with
+            304 so it would never be replaced. The copy stored before is dropped as well, as the site has sent a
+            new one. Bodies cut off by the byte ceiling or the text budget are complete enough to store, as they
+            always give the same text.
+
+            Args:
+                url (str): The page URL (does not need to be canonical).
+                content_hash (str): SHA-256 of the downloaded body (see hash_body).
+                text (str): The text extracted from the page.
+                etag (str, optional): The ETag response header.
+                last_modified (str, optional): The Last-Modified response header.
+                complete (bool, optional): False if the body was cut off by a deadline.
+        """
+        url = canonicalize_url(url)
+        now = time.time()
+        with self._lock, self._connection:
+            if not complete:
+                self._connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self._connection.execute("DELETE FROM bodies WHERE content_hash NOT IN (SELECT content_hash FROM pages)")
+                return
+            self._connection.execute("INSERT OR IGNORE INTO bodies VALUES (?, ?, ?)", (content_hash, text, len(text.encode("utf-8"))))
+            self._connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                                     (url, content_hash, etag, last_modified, now, now))
+            self._evict()
+
+    def _evict(self):
+        # Must be called with the lock held and inside a transaction
+        self._connection.execute("""DELETE FROM pages WHERE url IN (
+                                        SELECT url FROM pages ORDER BY last_access DESC LIMIT -1 OFFSET ?)""", (self.max_pages,))
+        self._connection.execute("DELETE FROM bodies WHERE content_hash NOT IN (SELECT content_hash FROM pages)")
+        total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+        while total_bytes > self.max_bytes:
+            oldest = self._connection.execute("SELECT url, content_hash FROM pages ORDER BY last_access LIMIT 1").fetchone()
+            if oldest is None:
+                break
+            self._connection.execute("DELETE FROM pages WHERE url = ?", (oldest[0],))
+            size = self._connection.execute("""DELETE FROM bodies WHERE content_hash = ? AND content_hash NOT IN
+                                                   (SELECT content_hash FROM pages) RETURNING size""", (oldest[1],)).fetchone()
+            total_bytes -= size[0] if size else 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+            Returns the hit, revalidation and miss counters and the number of cached pages and bodies.
+        """
+        with self._lock:
+            pages = self._connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            bodies = self._connection.execute("SELECT COUNT(*) FROM bodies").fetchone()[0]
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses, "pages": pages, "bodies": bodies}
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM pages")
+            self._connection.execute("DELETE FROM bodies")
+
+_page_cache: Optional[PageCache] = None
+_page_cache_lock = threading.Lock()
+
+def get_page_cache() -> Optional[PageCache]:
+    """
+        Gets the process-wide page cache, or None if it is disabled in page_cache_settings.
+    """
+    global _page_cache
+    if not page_cache_settings["enabled"]:
+        return None
+    if _page_cache is None:
+        with _page_cache_lock:
+            if _page_cache is None:
+                _page_cache = PageCache(path=page_cache_settings["path"],
+                                        fresh_seconds=page_cache_settings["fresh_seconds"],
+                                        max_pages=page_cache_settings["max_pages"],
+                                        max_bytes=page_cache_settings["max_bytes"])
+    return _page_cache
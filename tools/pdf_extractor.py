@@ -0,0 +1,189 @@
+import re
+from typing import Iterator, List, Optional, Tuple
+import zlib
+from config.settings import scraper_settings
+from utils.helper_functions import log_function_call
+
+'''
+A deliberately small PDF text extractor for the scraper. It walks the content streams in the order they appear in the
+file, inflates the FlateDecode ones and collects the strings shown by the text operators (Tj, TJ, ' and ").
+It does not build the cross-reference table or map fonts with custom encodings, so it works on a truncated download
+and on the text layer of most journal PDFs, while scanned or CID-font PDFs come back empty or garbled (which the
+scraper's garbled check then reports).
+'''
+
+STREAM_START = re.compile(rb"(?<!end)stream\r?\n")
+OPERATOR = re.compile(rb"[A-Za-z'\"*]+")
+NUMBER = re.compile(rb"[-+]?(?:\d+\.?\d*|\.\d+)")
+
+# Operators that move to a new line or position, where a separator is added between strings
+NEW_LINE_OPERATORS = {b"Td", b"TD", b"T*", b"Tm", b"ET"}
+
+# TJ offsets below this (thousandths of an em) are treated as the gap between two words
+WORD_GAP = -200
+
+ESCAPES = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f",
+           ord("("): b"(", ord(")"): b")", ord("\\"): b"\\"}
+
+def _iter_streams(data: bytes) -> Iterator[bytes]:
+    """
+        Yields the decoded content of every stream that can be decoded without external libraries.
+    """
+    position = 0
+    while True:
+        match = STREAM_START.search(data, position)
+        if match is None:
+            return
+        end = data.find(b"endstream", match.end())
+        raw = data[match.end():end if end != -1 else len(data)]
+        position = match.end() if end == -1 else end + len(b"endstream")
+
+        # The stream dictionary sits between the "obj" keyword and "stream"
+        dictionary = data[data.rfind(b"obj", 0, match.start()):match.start()]
+        if b"/Image" in dictionary or b"/Font" in dictionary:
+            continue
+        if b"/FlateDecode" in dictionary:
+            try:
+                # A decompress object copes with truncated streams and trailing bytes
+                yield zlib.decompressobj().decompress(raw)
+            except zlib.error:
+                continue
+        elif b"/Filter" not in dictionary:
+            yield raw
+
+        if end == -1:
+            return
+
+def _read_literal(stream: bytes, start: int) -> Tuple[bytes, int]:
+    # Reads a (literal string) starting after its opening bracket. Brackets can nest and be escaped.
+    depth = 1
+    output = bytearray()
+    index = start
+    while index < len(stream):
+        byte = stream[index]
+        if byte == 0x5C and index + 1 < len(stream):  # backslash
+            following = stream[index + 1]
+            if following in ESCAPES:
+                output += ESCAPES[following]
+                index += 2
+                continue
+            octal = re.match(rb"[0-7]{1,3}", stream[index + 1:index + 4])
+            if octal:
+                output.append(int(octal.group(), 8) & 0xFF)
+                index += 1 + len(octal.group())
+                continue
+            index += 2
+            continue
+        if byte == 0x28:
+            depth += 1
+        elif byte == 0x29:
+            depth -= 1
+            if depth == 0:
+                return bytes(output), index + 1
+        output.append(byte)
+        index += 1
+    return bytes(output), index
+
+def _decode_string(value: bytes, hex_string: bool = False) -> Optional[str]:
+    if value.startswith(b"\xfe\xff"):
+        return value[2:].decode("utf-16-be", errors="ignore")
+    text = value.decode("latin-1")
+    if hex_string:
+        # Hex strings are mostly glyph ids of embedded fonts, which cannot be mapped without the font
+        printable = sum(1 for char in text if char.isprintable())
+        if not text or printable < len(text) * 0.7:
+            return None
+    return text
+
+def _tokens(stream: bytes) -> Iterator[Tuple[str, object]]:
+    """
+        Splits a content stream into ("string", str), ("number", float), ("operator", bytes) and ("array", "[" or "]") tokens.
+    """
+    index = 0
+    length = len(stream)
+    while index < length:
+        byte = stream[index]
+        if byte == 0x28:  # (
+            value, index = _read_literal(stream, index + 1)
+            yield "string", _decode_string(value)
+        elif byte == 0x3C and stream[index + 1:index + 2] != b"<":  # <hex string>
+            end = stream.find(b">", index)
+            end = length if end == -1 else end
+            digits = re.sub(rb"\s", b"", stream[index + 1:end])
+            try:
+                yield "string", _decode_string(bytes.fromhex((digits + b"0" * (len(digits) % 2)).decode("ascii")), hex_string=True)
+            except ValueError:
+                pass
+            index = end + 1
+        elif byte in (0x5B, 0x5D):  # [ ]
+            yield "array", chr(byte)
+            index += 1
+        elif byte == 0x25:  # % comment
+            end = stream.find(b"\n", index)
+            index = length if end == -1 else end
+        else:
+            match = NUMBER.match(stream, index)
+            if match:
+                yield "number", float(match.group())
+                index = match.end()
+                continue
+            match = OPERATOR.match(stream, index)
+            if match:
+                yield "operator", match.group()
+                index = match.end()
+                continue
+            index += 1
+
+def _stream_text(stream: bytes) -> List[str]:
+    parts: List[str] = []
+    operands: List[Tuple[str, object]] = []
+    in_array = False
+    for kind, value in _tokens(stream):
+        if kind == "array":
+            in_array = value == "["
+            if in_array:
+                operands = []
+            continue
+        if kind != "operator":
+            operands.append((kind, value))
+            continue
+
+        if value in (b"Tj", b"'", b'"', b"TJ"):
+            if value in (b"'", b'"'):
+                parts.append("\n")
+            for operand_kind, operand in operands:
+                if operand_kind == "string" and operand:
+                    parts.append(operand)
+                elif value == b"TJ" and operand_kind == "number" and operand < WORD_GAP:
+                    parts.append(" ")
+        elif value in NEW_LINE_OPERATORS:
+            parts.append("\n")
+        if not in_array:
+            operands = []
+    return parts
+
+@log_function_call
+def extract_pdf_text(data: bytes, max_chars: int = None) -> str:
+    """
+        Extracts the text layer of a PDF (or the first part of one).
+
+        Args:
+            data (bytes): The PDF, possibly cut short by the download byte ceiling.
+            max_chars (int, optional): Character budget. Defaults to scraper_settings["max_content_chars"].
+
+        Returns:
+            str: The text with runs of whitespace collapsed, cut to the budget. Empty if no text could be read.
+    """
+    max_chars = max_chars or scraper_settings["max_content_chars"]
+    chunks = []
+    length = 0
+    for stream in _iter_streams(data):
+        if b"BT" not in stream:
+            continue
+        text = " ".join("".join(_stream_text(stream)).split())
+        if text:
+            chunks.append(text)
+            length += len(text) + 1
+            if length >= max_chars:
+                break
+    return " ".join(chunks)[:max_chars]
@@ -0,0 +1,269 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, Mapping, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import weakref
+from config.settings import politeness_settings
+from utils.helper_functions import log_function_call
+from utils.http_clients import async_http_request, http_request
+from utils.rate_limiter import retry_after_seconds
+from utils.single_flight import get_single_flight
+from utils.tracing import trace_event
+
+'''
+Per-host politeness for the scraper. Batches of questions tend to send most of their page requests to the same few
+hosts (www.ncbi.nlm.nih.gov and the journal sites), which throttle or block clients that do not space their
+requests out. Every host gets
+
+ - a limit on the connections open to it at once. Callers over the limit queue for a slot.
+ - a minimum delay between the starts of requests to it, raised to the Crawl-delay / Request-rate in its robots.txt
+   and doubled (up to max_delay) each time it answers with a 403, 429 or 503, then eased back as requests succeed.
+ - a robots.txt that is fetched once and kept for robots_ttl seconds. Fetching it takes a slot like any other
+   request, so it is spaced out too and counts against the page's deadline.
+
+Hosts are independent, so one host being slow or throttled does not hold up requests to the others.
+'''
+
+class HostSlotTimeout(Exception):
+    """
+        Raised when no connection slot for a host became free within the caller's timeout.
+    """
+
+class _Robots():
+    def __init__(self, parser: Optional[RobotFileParser], fetched_at: float):
+        # parser is None when the site has no usable robots.txt, in which case everything is allowed
+        self.parser = parser
+        self.fetched_at = fetched_at
+
+class _Host():
+    def __init__(self, name: str, max_connections: int, min_delay: float):
+        self.name = name
+        self.max_connections = max_connections
+        self.min_delay = min_delay
+        self.delay = min_delay
+        self.next_start = 0.0
+        self.slots = threading.BoundedSemaphore(max_connections)
+        # asyncio semaphores belong to the event loop they are used on, so there is one per loop. The thread and
+        # loop limits are separate: a process that scrapes a host from threads and from event loops at the same time
+        # can have max_connections open for each of them (next_start still spaces all of its requests out).
+        self.async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+class HostScheduler():
+    """
+        Schedules the scraper's requests per host (see the module notes).
+
+        Args:
+            settings (dict, optional): Defaults to politeness_settings.
+    """
+    def __init__(self, settings: dict = None):
+        self.settings = settings or politeness_settings
+        self._hosts: Dict[str, _Host] = {}
+        self._robots: Dict[str, _Robots] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url: str) -> _Host:
+        name = urlsplit(url).netloc.lower()
+        with self._lock:
+            host = self._hosts.get(name)
+            if host is None:
+                overrides = self.settings["hosts"].get(name, {})
+                host = self._hosts[name] = _Host(name,
+                                                 overrides.get("max_connections", self.settings["max_connections_per_host"]),
+                                                 overrides.get("min_delay", self.settings["min_delay"]))
+            return host
+
+    def _reserve_start(self, host: _Host, deadline: float) -> float:
+        # Books the next start time for the host and returns how long the caller has to wait for it. A start after
+        # the caller's deadline is not booked, so it does not push back the callers queued behind.
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, host.next_start)
+            if start > deadline:
+                raise HostSlotTimeout(f"{host.name} cannot be requested again for {round(start - now, 1)} seconds")
+            host.next_start = start + host.delay
+            return start - now
+
+    @contextmanager
+    def slot(self, url: str, timeout: float) -> Iterator[None]:
+        """
+            Holds a connection slot for the URL's host while the request is made, starting it no sooner than
+            the host's delay allows. Use as "with scheduler.slot(url, timeout):".
+
+            Raises:
+                HostSlotTimeout: If no slot became free, or the host's delay would not let the request start, within the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        host = self._host(url)
+        if not host.slots.acquire(timeout=timeout):
+            raise HostSlotTimeout(f"No free connection to {host.name} after {timeout} seconds")
+        try:
+            wait = self._reserve_start(host, deadline)
+            if wait > 0:
+                time.sleep(wait)
+            yield
+        finally:
+            host.slots.release()
+
+    @asynccontextmanager
+    async def aslot(self, url: str, timeout: float) -> AsyncIterator[None]:
+        """
+            Async version of slot. Use as "async with scheduler.aslot(url, timeout):".
+        """
+        deadline = time.monotonic() + timeout
+        host = self._host(url)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = host.async_slots.get(loop)
+            if slots is None:
+                slots = host.async_slots[loop] = asyncio.Semaphore(host.max_connections)
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise HostSlotTimeout(f"No free connection to {host.name} after {timeout} seconds")
+        try:
+            wait = self._reserve_start(host, deadline)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
+        finally:
+            slots.release()
+
+    def response_received(self, url: str, status: int, headers: Mapping[str, str]):
+        """
+            Slows down a host that is throttling us and eases back towards its minimum delay as requests succeed.
+        """
+        host = self._host(url)
+        with self._lock:
+            if status in self.settings["throttle_statuses"]:
+                retry_after = retry_after_seconds(headers) or 0.0
+                host.delay = min(self.settings["max_delay"], max(host.delay * 2, self.settings["min_delay"], retry_after))
+                host.next_start = max(host.next_start, time.monotonic() + max(host.delay, retry_after))
+                delay = host.delay
+            else:
+                host.delay = max(host.min_delay, host.delay * self.settings["recovery_factor"])
+                return
+        trace_event("host_throttled", host=host.name, status=status, delay=round(delay, 3))
+
+    def _robots_url(self, url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}/robots.txt"
+
+    def _parse_robots(self, url: str, status: Optional[int], text: str) -> _Robots:
+        parser = None
+        if status is not None and status < 400:
+            parser = RobotFileParser(self._robots_url(url))
+            parser.parse(text.splitlines())
+        elif status in (401, 403):
+            # The same rule as RobotFileParser.read - a site that hides its robots.txt is treated as disallowing everything
+            parser = RobotFileParser(self._robots_url(url))
+            parser.disallow_all = True
+        return _Robots(parser, time.monotonic())
+
+    def _cached_robots(self, url: str) -> Optional[_Robots]:
+        robots = self._robots.get(self._robots_url(url))
+        if robots is None or time.monotonic() - robots.fetched_at > self.settings["robots_ttl"]:
+            return None
+        return robots
+
+    def _robots_timeout(self, deadline: float) -> float:
+        return max(0.001, min(self.settings["robots_timeout"], deadline - time.monotonic()))
+
+    def _fetch_robots(self, url: str, user_agent: str, timeout: float) -> _Robots:
+        # HostSlotTimeout is raised (and nothing is cached) if the host cannot be requested within the timeout
+        deadline = time.monotonic() + timeout
+        status, text = None, ""
+        with self.slot(url, timeout):
+            try:
+                response = http_request("GET", self._robots_url(url), headers={"User-Agent": user_agent},
+                                        timeout=self._robots_timeout(deadline))
+                status, text = response.status_code, response.text
+            except Exception:
+                pass # A robots.txt that cannot be fetched does not stop the page being scraped
+        robots = self._robots[self._robots_url(url)] = self._parse_robots(url, status, text)
+        return robots
+
+    async def _afetch_robots(self, url: str, user_agent: str, timeout: float) -> _Robots:
+        deadline = time.monotonic() + timeout
+        status, text = None, ""
+        async with self.aslot(url, timeout):
+            try:
+                response = await async_http_request("GET", self._robots_url(url), headers={"User-Agent": user_agent},
+                                                    timeout=self._robots_timeout(deadline))
+                status, text = response.status_code, response.text
+            except Exception:
+                pass
+        robots = self._robots[self._robots_url(url)] = self._parse_robots(url, status, text)
+        return robots
+
+    def _apply_robots(self, url: str, robots: _Robots, user_agent: str) -> bool:
+        if robots.parser is None:
+            return True
+        # Crawl-delay and Request-rate become the host's minimum delay (never more than max_delay)
+        delay = robots.parser.crawl_delay(user_agent)
+        rate = robots.parser.request_rate(user_agent)
+        if rate is not None and rate.requests:
+            delay = max(float(delay or 0), rate.seconds / rate.requests)
+        if delay:
+            host = self._host(url)
+            with self._lock:
+                host.min_delay = min(self.settings["max_delay"], max(host.min_delay, float(delay)))
+                host.delay = max(host.delay, host.min_delay)
+        return robots.parser.can_fetch(user_agent, url)
+
+    @log_function_call
+    def allowed(self, url: str, user_agent: str, timeout: float = None) -> bool:
+        """
+            Checks the host's robots.txt (fetching it if it is not cached or has expired) to see whether the URL may be scraped.
+
+            Args:
+                url (str): The page about to be scraped.
+                user_agent (str): The User-Agent the page will be requested with.
+                timeout (float, optional): Seconds the caller can wait for robots.txt, including for a slot.
+                    Defaults to politeness_settings["robots_timeout"].
+
+            Returns:
+                bool: False if robots.txt disallows the URL.
+
+            Raises:
+                HostSlotTimeout: If robots.txt had to be fetched and the host could not be requested within the timeout.
+        """
+        if not self.settings["respect_robots"]:
+            return True
+        robots = self._cached_robots(url)
+        if robots is None:
+            # Runs that scrape the same host at the same time share one robots.txt download
+            robots, _ = get_single_flight("robots").do(self._robots_url(url), self._fetch_robots, url, user_agent,
+                                                       timeout if timeout is not None else self.settings["robots_timeout"])
+        return self._apply_robots(url, robots, user_agent)
+
+    @log_function_call
+    async def aallowed(self, url: str, user_agent: str, timeout: float = None) -> bool:
+        """
+            Async version of allowed.
+        """
+        if not self.settings["respect_robots"]:
+            return True
+        robots = self._cached_robots(url)
+        if robots is None:
+            robots, _ = await get_single_flight("robots").ado(self._robots_url(url), self._afetch_robots, url, user_agent,
+                                                              timeout if timeout is not None else self.settings["robots_timeout"])
+        return self._apply_robots(url, robots, user_agent)
+
+_scheduler: Optional[HostScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_host_scheduler() -> Optional[HostScheduler]:
+    """
+        Gets the process-wide host scheduler, or None if politeness is disabled in politeness_settings.
+    """
+    global _scheduler
+    if not politeness_settings["enabled"]:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = HostScheduler()
+    return _scheduler
@@ -0,0 +1,197 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
+import threading
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Union
+import uuid
+from config.settings import prefetch_settings
+from utils.metrics import collect_io
+from utils.tracing import trace_event
+
+'''
+Speculative prefetching of search results. The result selector nearly always picks from the first few organic
+results, so as soon as the web search returns, the top prefetch_settings["top_k"] links start downloading in the
+background while the selector's LLM call is still running. The scraper then takes the prefetched page for each
+URL it was asked for, and the prefetches nobody asked for are cancelled.
+
+Prefetches belong to a graph run, marked by a prefetch_run() block around the graph invocation (see app/app.py and
+app/batch.py). Each block gets an id of its own, so one run never takes or cancels another run's pages however alike
+their questions are, and whatever a run has not used is discarded when its block ends, even if the run failed before
+it got to the scraper. Outside a prefetch_run() block nothing is prefetched.
+'''
+
+_current_run: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("prefetch_run", default=None)
+
+class _Prefetch():
+    def __init__(self, url: str, future: Union[Future, asyncio.Task]):
+        self.url = url
+        self.future = future
+        self.bytes = 0          # Bytes received, set when the download has finished
+        self.discarded = False
+
+class Prefetcher():
+    """
+        Background page downloads for the runs in this process.
+
+        Attributes:
+            prefetched (int): Pages whose download was started.
+            hits (int): Selected pages that had been prefetched.
+            misses (int): Selected pages that had not.
+            hit_bytes (int): Bytes of prefetched pages that were used.
+            wasted (int): Prefetched pages that were not used.
+            wasted_bytes (int): Bytes downloaded for pages that were not used.
+    """
+    def __init__(self):
+        self._runs: Dict[str, Dict[str, _Prefetch]] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.prefetched = self.hits = self.misses = self.hit_bytes = self.wasted = self.wasted_bytes = 0
+
+    def _finished(self, prefetch: _Prefetch, received: int):
+        with self._lock:
+            prefetch.bytes = received
+            if prefetch.discarded:
+                self.wasted_bytes += received
+
+    def _fetch(self, prefetch: _Prefetch, fetch: Callable[[str], str]) -> str:
+        # Runs in the prefetch thread. Its bytes are counted here rather than against the node that started it.
+        with collect_io() as io:
+            try:
+                return fetch(prefetch.url)
+            finally:
+                self._finished(prefetch, int(io.values["http_bytes_received"]))
+
+    async def _afetch(self, prefetch: _Prefetch, fetch: Callable[[str], Awaitable[str]]) -> str:
+        with collect_io() as io:
+            try:
+                return await fetch(prefetch.url)
+            finally:
+                self._finished(prefetch, int(io.values["http_bytes_received"]))
+
+    def _register(self, run_key: Optional[str], urls: List[str], start: Callable[[_Prefetch], Union[Future, asyncio.Task]]):
+        if run_key is None:
+            return
+        urls = list(dict.fromkeys(urls))[:prefetch_settings["top_k"]]
+        with self._lock:
+            prefetches = self._runs.setdefault(run_key, {})
+            new = [url for url in urls if url not in prefetches]
+            # Started with the lock held (submitting and creating a task do not block) so discard never sees a
+            # prefetch without its download
+            for url in new:
+                prefetches[url] = _Prefetch(url, None)
+                prefetches[url].future = start(prefetches[url])
+            self.prefetched += len(new)
+        if new:
+            trace_event("prefetch_started", run=run_key, urls=new)
+
+    def start(self, run_key: Optional[str], urls: List[str], fetch: Callable[[str], str]):
+        """
+            Starts downloading the top urls in background threads.
+
+            Args:
+                run_key (str | None): The run the pages are fetched for (see current_run_key). Nothing is prefetched if None.
+                urls (List[str]): The search result links, best first.
+                fetch (Callable[[str], str]): Downloads a page and returns its text e.g. fetch_page_content.
+        """
+        if run_key is None:
+            return
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=prefetch_settings["max_workers"], thread_name_prefix="prefetch")
+        # Each download runs in a copy of the caller's context so its tracing spans belong to the run
+        self._register(run_key, urls, lambda prefetch: self._executor.submit(contextvars.copy_context().run, self._fetch, prefetch, fetch))
+
+    def astart(self, run_key: Optional[str], urls: List[str], fetch: Callable[[str], Awaitable[str]]):
+        """
+            Async version of start. The downloads are tasks on the running event loop.
+        """
+        self._register(run_key, urls, lambda prefetch: asyncio.get_running_loop().create_task(self._afetch(prefetch, fetch)))
+
+    def take(self, run_key: Optional[str], url: str) -> Optional[Union[Future, asyncio.Task]]:
+        """
+            Takes the prefetch of a selected page, counting a hit or a miss.
+
+            Returns:
+                Future | asyncio.Task | None: The download (its result is the page text), or None if the page was not prefetched.
+        """
+        if run_key is None:
+            return None
+        with self._lock:
+            prefetch = self._runs.get(run_key, {}).pop(url, None)
+            if prefetch is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        prefetch.future.add_done_callback(lambda _: self._count_hit_bytes(prefetch))
+        return prefetch.future
+
+    def _count_hit_bytes(self, prefetch: _Prefetch):
+        with self._lock:
+            self.hit_bytes += prefetch.bytes
+
+    def discard(self, run_key: Optional[str]):
+        """
+            Cancels the run's prefetches that were not taken. Downloads that have already started in a thread
+            cannot be stopped, so they finish (within the scraper's byte and text limits) and count as wasted.
+        """
+        with self._lock:
+            prefetches = list(self._runs.pop(run_key, {}).values())
+            for prefetch in prefetches:
+                prefetch.discarded = True
+                self.wasted += 1
+                if prefetch.future.done():
+                    self.wasted_bytes += prefetch.bytes
+        for prefetch in prefetches:
+            prefetch.future.cancel()
+        if prefetches:
+            trace_event("prefetch_discarded", run=run_key, urls=[prefetch.url for prefetch in prefetches])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            selected = self.hits + self.misses
+            return {"prefetched": self.prefetched, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / selected, 3) if selected else 0.0,
+                    "hit_bytes": self.hit_bytes, "wasted": self.wasted, "wasted_bytes": self.wasted_bytes}
+
+def current_run_key() -> Optional[str]:
+    """
+        Gets the id the caller's run keeps its prefetches under, or None outside a prefetch_run() block.
+    """
+    return _current_run.get()
+
+@contextmanager
+def prefetch_run() -> Iterator[str]:
+    """
+        Marks the code inside the block (including threads and tasks started from it with a copy of its context)
+        as one graph run for prefetching, and discards the run's unused prefetches when the block ends.
+    """
+    run_key = uuid.uuid4().hex
+    token = _current_run.set(run_key)
+    try:
+        yield run_key
+    finally:
+        _current_run.reset(token)
+        if _prefetcher is not None:
+            _prefetcher.discard(run_key)
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher() -> Optional[Prefetcher]:
+    """
+        Gets the process-wide prefetcher, or None if prefetching is disabled in prefetch_settings.
+    """
+    global _prefetcher
+    if not prefetch_settings["enabled"]:
+        return None
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher()
+    return _prefetcher
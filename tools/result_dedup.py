@@ -0,0 +1,164 @@
+import hashlib
+import re
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlsplit
+from config.settings import dedup_settings
+from utils.helper_functions import canonicalize_url, log_function_call
+from utils.tracing import trace_event
+
+'''
+Near-duplicate suppression for search results. The same paper is often returned several times - on PubMed, PMC,
+the publisher's site and ResearchGate - which wastes the result selector's prompt tokens and gets the same content
+scraped twice. Results are clustered when they
+
+ - have the same canonical URL,
+ - share a DOI, PMID or PMCID, or
+ - have near-identical title / title and snippet text (64 bit SimHash within max_hamming_distance bits),
+
+unless they carry different identifiers of the same kind (two different DOIs are two different papers, however
+alike their titles are). One representative is kept per cluster.
+'''
+
+_DOI = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>?#&]+)", re.IGNORECASE)
+_PMID = re.compile(r"(?:pubmed\.ncbi\.nlm\.nih\.gov/|\bPMID:?\s*)(\d{5,9})\b", re.IGNORECASE)
+_PMCID = re.compile(r"\b(PMC\d{1,9})\b", re.IGNORECASE)
+# Landing page suffixes publishers add after a DOI in their URLs
+_DOI_SUFFIX = re.compile(r"/(?:full|abstract|pdf|epdf|fulltext|html|meta|references)$", re.IGNORECASE)
+# Decorations sites add to the same title e.g. "(PDF) ..." on ResearchGate or "... - PMC"
+_TITLE_PREFIX = re.compile(r"^\s*[(\[](?:pdf|html|citation)[)\]]\s*", re.IGNORECASE)
+_TITLE_SUFFIX = re.compile(r"\s+[-|–—:]\s+(?:" + "|".join(map(re.escape, dedup_settings["title_site_names"])) + r")\s*$", re.IGNORECASE)
+_WORD = re.compile(r"[a-z0-9]+")
+
+def link_key(url: str) -> str:
+    """
+        Normalises a result's link so that links to the same page compare equal: the loose form of
+        utils.helper_functions.canonicalize_url, also without dedup_settings["tracking_params"].
+    """
+    return canonicalize_url(url, loose=True, drop_params=dedup_settings["tracking_params"])
+
+@log_function_call
+def extract_identifiers(result: dict) -> Dict[str, str]:
+    """
+        Finds the DOI, PMID and PMCID of a search result in its link, title and snippet.
+
+        Returns:
+            Dict[str, str]: Identifier kind ("doi", "pmid" or "pmcid") to normalised value.
+    """
+    text = " ".join(unquote(str(result.get(key, ""))) for key in ("link", "title", "snippet"))
+    identifiers = {}
+    doi = _DOI.search(text)
+    if doi:
+        identifiers["doi"] = _DOI_SUFFIX.sub("", doi.group(1).rstrip(".,;:)]}")).lower()
+    pmid = _PMID.search(text)
+    if pmid:
+        identifiers["pmid"] = pmid.group(1)
+    pmcid = _PMCID.search(text)
+    if pmcid:
+        identifiers["pmcid"] = pmcid.group(1).upper()
+    return identifiers
+
+def simhash(text: str, bits: int = 64) -> Optional[int]:
+    """
+        SimHash of the words and word pairs in a text, or None if it has fewer than dedup_settings["min_words"] words.
+        Texts that differ in a few words get fingerprints that differ in a few bits.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < dedup_settings["min_words"]:
+        return None
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    weights = [0] * bits
+    for feature in features:
+        # blake2b rather than hash(), which is salted differently in every process
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+def clean_title(title: str) -> str:
+    """
+        Removes what sites add to a paper's title, such as "(PDF)" or a trailing " - PubMed" or " | Wiley Online Library"
+        (the site names are listed in dedup_settings["title_site_names"]).
+    """
+    return _TITLE_SUFFIX.sub("", _TITLE_PREFIX.sub("", title))
+
+def _hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+class _UnionFind():
+    # Clusters of results. Each cluster also collects its members' identifiers, so clusters that would end up with
+    # two different DOIs (or PMIDs or PMCIDs) are never joined.
+    def __init__(self, identifiers: List[Dict[str, str]]):
+        self.parent = list(range(len(identifiers)))
+        self.identifiers = [dict(ids) for ids in identifiers]
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def conflict(self, first: int, second: int) -> bool:
+        first_ids, second_ids = self.identifiers[self.find(first)], self.identifiers[self.find(second)]
+        return any(kind in second_ids and second_ids[kind] != value for kind, value in first_ids.items())
+
+    def union(self, first: int, second: int):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[second] = first
+            self.identifiers[first].update(self.identifiers[second])
+
+def _preference(result: dict, position: int) -> tuple:
+    # Hosts earlier in preferred_hosts (open full text) are kept over the others, then the higher ranked result
+    host = (urlsplit(result.get("link", "")).hostname or "").lower()
+    preferred = dedup_settings["preferred_hosts"]
+    return (preferred.index(host) if host in preferred else len(preferred), position)
+
+@log_function_call
+def dedupe_results(organic_results: List[dict]) -> List[dict]:
+    """
+        Clusters near-duplicate search results and keeps one representative of each cluster.
+
+        Args:
+            organic_results (List[dict]): Serper organic results, best first.
+
+        Returns:
+            List[dict]: One result per cluster, in the order of each cluster's best ranked member. The representative
+                gets a "duplicates" key listing the links of the results it stands for.
+    """
+    if not dedup_settings["enabled"] or len(organic_results) < 2:
+        return organic_results
+
+    identifiers = [extract_identifiers(result) for result in organic_results]
+    canonical = [link_key(result.get("link", "")) for result in organic_results]
+    titles = [clean_title(result.get("title", "")) for result in organic_results]
+    title_hashes = [simhash(title) for title in titles]
+    texts = [simhash(f"{title} {result.get('snippet', '')}") for title, result in zip(titles, organic_results)]
+    max_distance = dedup_settings["max_hamming_distance"]
+
+    clusters = _UnionFind(identifiers)
+    for first in range(len(organic_results)):
+        for second in range(first + 1, len(organic_results)):
+            if clusters.find(first) == clusters.find(second) or clusters.conflict(first, second):
+                continue
+            same = (canonical[first] == canonical[second]
+                    or any(identifiers[second].get(kind) == value for kind, value in identifiers[first].items())
+                    or (title_hashes[first] is not None and title_hashes[second] is not None and _hamming(title_hashes[first], title_hashes[second]) <= max_distance)
+                    or (texts[first] is not None and texts[second] is not None and _hamming(texts[first], texts[second]) <= max_distance))
+            if same:
+                clusters.union(first, second)
+
+    members: Dict[int, List[int]] = {}
+    for index in range(len(organic_results)):
+        members.setdefault(clusters.find(index), []).append(index)
+
+    deduped = []
+    for cluster in sorted(members.values(), key=min):
+        keep = min(cluster, key=lambda index: _preference(organic_results[index], index))
+        result = dict(organic_results[keep])
+        if len(cluster) > 1:
+            result["duplicates"] = [organic_results[index].get("link") for index in cluster if index != keep]
+        deduped.append(result)
+
+    trace_event("search_results_deduplicated", results=len(organic_results), clusters=len(deduped),
+                removed=len(organic_results) - len(deduped), cluster_sizes=[len(cluster) for cluster in members.values() if len(cluster) > 1])
+    return deduped
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+from config.settings import search_cache_settings
+from utils.helper_functions import log_function_call
+
+def normalize_search_term(search_term: str) -> str:
+    """
+        Normalizes a search term so that the same question asked with different casing or spacing
+        shares one cache entry.
+    """
+    return " ".join(str(search_term).lower().split())
+
+class SearchCache():
+    """
+        Persistent, size-bounded cache of Google Serper responses stored in SQLite.
+
+        Entries are keyed by the normalized search term and the request parameters. They expire after
+        ttl_seconds and the least recently used entries are evicted once there are more than max_entries.
+        The hits and misses counters can be used to check how much Serper quota the cache is saving.
+    """
+    @log_function_call
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared between threads - access to it is serialised by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS search_results (
+                                            key TEXT PRIMARY KEY,
+                                            search_term TEXT NOT NULL,
+                                            results TEXT NOT NULL,
+                                            created_at REAL NOT NULL,
+                                            last_access REAL NOT NULL)""")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS idx_search_results_last_access ON search_results (last_access)")
+
+    @staticmethod
+    def make_key(search_term: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+            Builds the cache key from the normalized search term and the request parameters.
+        """
+        key_data = {**(params or {}), "q": normalize_search_term(search_term)}
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @log_function_call
+    def get(self, search_term: str, params: Optional[Dict[str, Any]] = None) -> Optional[dict]:
+        """
+            Gets the cached Serper response for a search.
+
+            Args:
+                search_term (str): The search term sent to Serper.
+                params (Dict[str, Any], optional): Any other request parameters e.g. "num" or "gl".
+
+            Returns:
+                dict | None: The Serper JSON response, or None if it is not cached or has expired.
+        """
+        key = self.make_key(search_term, params)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT results, created_at FROM search_results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE search_results SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    @log_function_call
+    def put(self, search_term: str, results: dict, params: Optional[Dict[str, Any]] = None):
+        """
+            Stores a Serper response and evicts expired and least recently used entries.
+
+            Args:
+                search_term (str): The search term sent to Serper.
+                results (dict): The Serper JSON response.
+                params (Dict[str, Any], optional): Any other request parameters e.g. "num" or "gl".
+        """
+        key = self.make_key(search_term, params)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?, ?)",
+                                     (key, normalize_search_term(search_term), json.dumps(results), now, now))
+            self._connection.execute("DELETE FROM search_results WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._connection.execute("""DELETE FROM search_results WHERE key IN (
+                                            SELECT key FROM search_results ORDER BY last_access DESC LIMIT -1 OFFSET ?)""",
+                                     (self.max_entries,))
+
+    def stats(self) -> Dict[str, int]:
+        """
+            Returns the hit and miss counters and the number of cached searches.
+        """
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM search_results").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM search_results")
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+        Gets the process-wide search cache, or None if it is disabled in search_cache_settings.
+    """
+    global _search_cache
+    if not search_cache_settings["enabled"]:
+        return None
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache(path=search_cache_settings["path"],
+                                            ttl_seconds=search_cache_settings["ttl_seconds"],
+                                            max_entries=search_cache_settings["max_entries"])
+    return _search_cache
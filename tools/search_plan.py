@@ -0,0 +1,62 @@
+from typing import Dict, List
+from config.settings import serper_settings
+from tools.result_dedup import link_key
+from tools.search_cache import normalize_search_term
+from utils.helper_functions import log_function_call
+
+'''
+Search plans with several search terms. The planner can return a "search_terms" list as well as its main
+"search_term"; every term is searched at the same time and the organic results of the searches are merged into one
+ranking with reciprocal rank fusion (RRF), so a page that several searches rank highly comes first.
+'''
+
+@log_function_call
+def get_search_terms(plan: dict) -> List[str]:
+    """
+        Gets the search terms of a search planner response.
+
+        Args:
+            plan (dict): The planner's JSON.
+
+        Returns:
+            List[str]: The main "search_term" followed by the "search_terms", without blanks or repeats (ignoring case
+                and spacing) and capped at serper_settings["max_queries"].
+    """
+    terms = plan.get("search_terms")
+    if isinstance(terms, str):
+        terms = [terms]
+    candidates = [plan.get("search_term"), *(terms if isinstance(terms, list) else [])]
+
+    search_terms: Dict[str, str] = {}
+    for term in candidates:
+        if isinstance(term, str) and term.strip():
+            search_terms.setdefault(normalize_search_term(term), term.strip())
+    return list(search_terms.values())[:serper_settings["max_queries"]]
+
+@log_function_call
+def fuse_results(result_lists: List[List[dict]], k: int = None) -> List[dict]:
+    """
+        Merges the organic results of several searches with reciprocal rank fusion: each result scores 1 / (k + rank)
+        in every search that returned it and the results are ordered by their total. Links are compared with
+        result_dedup.link_key.
+
+        Args:
+            result_lists (List[List[dict]]): The organic results of each search, best first.
+            k (int, optional): Dampens the weight of the top ranks. Defaults to serper_settings["rrf_k"].
+
+        Returns:
+            List[dict]: Every distinct result once, best first. A result found by more than one search keeps the copy
+                from its best ranked appearance.
+    """
+    k = k if k is not None else serper_settings["rrf_k"]
+    scores: Dict[str, float] = {}
+    best: Dict[str, tuple] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            link = result.get("link", "")
+            key = link_key(link) if link else f"title:{result.get('title', '')}"
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if key not in best or rank < best[key][0]:
+                best[key] = (rank, result)
+    # Ties keep the order the results were first seen in
+    return [best[key][1] for key in sorted(scores, key=lambda key: -scores[key])]
@@ -1,8 +1,28 @@
-from bs4 import BeautifulSoup
+import asyncio
+import codecs
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from config.settings import scraper_settings
+import contextlib
+import contextvars
+import hashlib
+import httpx
 import json
 from langchain_core.messages import HumanMessage
+import math
+import re
 import requests
+from retrieval.retriever import index_documents
 from states.state import AgentGraphState
+from tools.html_extractor import HTMLTextExtractor
+from tools.page_cache import CachedPage, PageCache, get_page_cache
+from tools.pdf_extractor import extract_pdf_text
+from tools.politeness import HostScheduler, HostSlotTimeout, get_host_scheduler
+from tools.prefetch import current_run_key, get_prefetcher
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from utils.helper_functions import log_function_call
+from utils.http_clients import async_http_stream, http_request
+from utils.single_flight import get_single_flight
 
 def is_garbled(text):
     # A simple heuristic to detect garbled text: high proportion of non-ASCII characters
@@ -10,86 +30,488 @@ def is_garbled(text):
     non_ascii_count = sum(1 for char in text if ord(char) > 127)
     return non_ascii_count > len(text) * 0.3
 
-'''
-selected_website is a function reference that when called gets the latest state
-of the result_selector.
-'''
-def scrape_website(state: AgentGraphState, selected_website):
-    # Call the selected_website function. The argument given is the address of a function that will get the most recent response
-    website_info = selected_website() if callable(selected_website) else selected_website
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0'}
+BASE_ERROR_MSG = "Error in scraping website."
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+PDF_TYPE = "application/pdf"
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.I)
+
+@log_function_call
+def get_selected_urls(website_info) -> List[str]:
+    """
+        Gets the URLs chosen in the latest result selector response.
+
+        Args:
+            website_info (list | HumanMessage): The result selector responses (or just the latest one).
+
+        Returns:
+            List[str]: The selected URLs, without duplicates and capped at scraper_settings["max_sources"].
+    """
+    # Only the most recent selection is of interest
+    latest = website_info[-1] if isinstance(website_info, list) else website_info
+    research_data = latest.content if hasattr(latest, "content") else latest
 
-    # from the result selector agent. Get the content from this HumanMessage.
-    research_data = website_info[0].content
-    
     # Convert the result_selector HumanMessage string into a JSON object
     website_content = json.loads(research_data)
 
-    # Once it is a JSON object, get the chosen website URL (include error checking for if the URL key does not exist)
-    try:
-        url = website_content["selected_page_url"]
-    except KeyError as e:
-        # I think a new key is being created here called "error" - maybe not ideal calling is 'url' when an error but it makes the code more tidy
-        # because need to return the 'url' in the HumanMessage at the end.
-        url = website_content["error"]
+    # The selector can return a single URL or a list of URLs (include error checking for if the URL key does not exist)
+    if "selected_page_urls" in website_content:
+        selected = website_content["selected_page_urls"]
+    elif "selected_page_url" in website_content:
+        selected = website_content["selected_page_url"]
+    else:
+        # Not ideal calling it a 'url' when it is an error but the error is returned in the HumanMessage 'source' at the end.
+        selected = website_content.get("error", f"{BASE_ERROR_MSG} The result selector did not return a URL.")
 
-    # Try getting the website page details (check the status tof the request)
-    content = ''
-    try:
-        base_error_msg = "Error in scraping website."
+    urls = [selected] if isinstance(selected, str) else list(selected)
+    return list(dict.fromkeys(urls))[:scraper_settings["max_sources"]]
 
-        # headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'}
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0'}
+class PageReader():
+    """
+        Turns the body of a page into text while it is being downloaded.
 
-        session = requests.Session()
-        response = session.get(url, headers=headers)
-        # response = requests.get('https://www.ncbi.nlm.nih.gov/pmc/articles/PMC9529058/', headers=headers)
-        response.raise_for_status()
+        Chunks are decoded incrementally (using the charset from the Content-Type header, a byte order mark or a
+        <meta> tag, falling back to UTF-8) and fed straight to the HTML extractor, so reading can stop as soon as
+        the text budget is filled. PDFs are collected up to the same byte ceiling and handed to the PDF extractor
+        when the download has finished.
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        Because HTML is parsed as it arrives, a page whose body is already in the page cache under another URL
+        (see _finish_page) has still been parsed by the time its hash is known. Parsing on the fly is what lets the
+        download stop early, which saves more than the parse, so only PDF extraction - by far the slower of the
+        two - is skipped for a known body.
 
-        # Extract the text content
-        text = soup.stripped_strings
+        Args:
+            content_type (str): The media type of the page e.g. "text/html".
+            charset (str, optional): The charset parameter of the Content-Type header.
+            max_bytes (int, optional): Byte ceiling. Defaults to scraper_settings["max_download_bytes"].
+    """
+    def __init__(self, content_type: str, charset: Optional[str] = None, max_bytes: int = None):
+        self.content_type = content_type
+        self.charset = charset
+        self.max_bytes = max_bytes or scraper_settings["max_download_bytes"]
+        self.bytes_read = 0
+        self.truncated = False
+        self.timed_out = False  # Set by the caller when the deadline stopped the download
+        self._hash = hashlib.sha256()
+        self._decoder = None
+        self._pdf = bytearray()
+        self._text: List[str] = []
+        self._text_chars = 0
+        self._extractor = HTMLTextExtractor(max_chars=scraper_settings["max_content_chars"]) if content_type in HTML_TYPES else None
 
-        # The example program adds a space - but not sure why yet
-        content = ' '.join(text)
+    @property
+    def content_hash(self) -> str:
+        # SHA-256 of the bytes read, as used by the page cache
+        return self._hash.hexdigest()
 
-        # Check for garbled text
-        if is_garbled(content):
-            content = f"{base_error_msg}. Garbled text returned."
+    def feed(self, chunk: bytes) -> bool:
+        """
+            Adds the next chunk of the body.
+
+            Returns:
+                bool: True once the byte ceiling or the text budget has been reached and the rest of the body is not needed.
+        """
+        if self.bytes_read + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.bytes_read]
+            self.truncated = True
+        self.bytes_read += len(chunk)
+        self._hash.update(chunk)
+
+        if self.content_type == PDF_TYPE:
+            self._pdf += chunk
+            return self.truncated
+
+        if self._decoder is None:
+            self._decoder = codecs.getincrementaldecoder(detect_charset(chunk, self.charset))(errors="replace")
+        text = self._decoder.decode(chunk)
+        if self._extractor is not None:
+            done = self._extractor.feed(text)
         else:
-            # Might change the length of this.
-            content = content[:8000]
+            self._text.append(text)
+            self._text_chars += len(text)
+            done = self._text_chars >= scraper_settings["max_content_chars"]
+        return done or self.truncated
+
+    def close(self) -> Optional[str]:
+        """
+            Returns the text of the page cut to scraper_settings["max_content_chars"], or None if the text is garbled.
+        """
+        if self.content_type == PDF_TYPE:
+            content = extract_pdf_text(bytes(self._pdf), max_chars=scraper_settings["max_content_chars"])
+        elif self._extractor is not None:
+            if self._decoder is not None:
+                self._extractor.feed(self._decoder.decode(b"", final=True))
+            content = self._extractor.close()
+        else:
+            content = " ".join("".join(self._text).split())[:scraper_settings["max_content_chars"]]
+
+        if is_garbled(content):
+            return None
+        return content
+
+def detect_charset(first_chunk: bytes, charset: Optional[str] = None) -> str:
+    """
+        Works out the encoding of a page from the Content-Type charset, a byte order mark or a <meta> tag
+        in the first chunk of the body. Falls back to UTF-8.
+    """
+    candidates = [charset]
+    for bom, encoding in BOMS:
+        if first_chunk.startswith(bom):
+            candidates.insert(0, encoding)
+    match = META_CHARSET_PATTERN.search(first_chunk[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii", errors="ignore"))
 
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+def _parse_content_type(header: Optional[str]) -> Tuple[str, Optional[str]]:
+    # "text/html; charset=ISO-8859-1" -> ("text/html", "ISO-8859-1"). Pages without the header are treated as HTML.
+    if not header:
+        return "text/html", None
+    media_type = header.split(";")[0].strip().lower()
+    match = re.search(r"charset=[\"']?([\w.:-]+)", header, re.I)
+    return media_type, match.group(1) if match else None
+
+def _start_reading(url: str, cached_page: Optional[CachedPage], response) -> Tuple[Optional[str], Optional[PageReader]]:
+    """
+        Checks the status and headers of a streamed requests or httpx response before any of the body is read.
+
+        Returns:
+            Tuple[str | None, PageReader | None]: Either the content to use straight away (a cached page that has
+            not changed or an error message) or a reader for the body.
+    """
+    if response.status_code == 304 and cached_page is not None:
+        get_page_cache().mark_revalidated(cached_page, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return cached_page.text, None
+    response.raise_for_status()
+
+    content_type, charset = _parse_content_type(response.headers.get("Content-Type"))
+    if content_type not in scraper_settings["content_types"]:
+        return f"{BASE_ERROR_MSG} Unsupported content type ({content_type}) for URL: {url}", None
+
+    # A PDF cut short loses most of its text, so PDFs known to be over the ceiling are not downloaded at all.
+    # Longer HTML pages are still read up to the ceiling as the text budget is usually filled well before it.
+    content_length = response.headers.get("Content-Length")
+    max_bytes = scraper_settings["max_download_bytes"]
+    if content_type == PDF_TYPE and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        return f"{BASE_ERROR_MSG} PDF is larger than {max_bytes} bytes for URL: {url}", None
+
+    return None, PageReader(content_type, charset, max_bytes)
+
+def _finish_page(url: str, reader: PageReader, response) -> str:
+    """
+        Gets the text from a page reader once the download has stopped, using the page cache where possible.
+    """
+    # Identical bodies (e.g. the same PDF under another URL) only need to be extracted once. HTML has already been
+    # parsed while it was read (see PageReader), so for HTML this only saves finishing the extractor.
+    # A download stopped by the deadline has only hashed part of the body, so it is neither looked up nor cached -
+    # the next run would get a different part (the byte ceiling and text budget always stop at the same place).
+    page_cache = get_page_cache()
+    content = None
+    if page_cache is not None and not reader.timed_out:
+        content = page_cache.get_body_text(reader.content_hash)
+    if content is None:
+        content = reader.close()
+
+    if content is None:
+        return f"{BASE_ERROR_MSG}. Garbled text returned."
+    if page_cache is not None:
+        page_cache.store(url, reader.content_hash, content, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                         complete=not reader.timed_out)
+    return content
+
+@log_function_call
+def fetch_page_content(url: str, timeout: float = None) -> str:
+    """
+        Downloads a single web page (or PDF) and extracts its text.
+
+        The body is streamed and handed to the extractor chunk by chunk. Reading stops once the text budget is
+        filled, the byte ceiling (scraper_settings["max_download_bytes"]) is reached or the deadline has passed,
+        and pages whose Content-Type is not in scraper_settings["content_types"] are not downloaded at all.
+
+        Args:
+            url (str): The page to scrape.
+            timeout (float, optional): Seconds allowed for the whole download. Defaults to scraper_settings["timeout"].
+
+        Returns:
+            str: The page text (or an error message if the page could not be scraped).
+    """
+    # Runs that scrape the same URL at the same time share one download (see utils/single_flight.py)
+    content, _ = get_single_flight("scraper").do(url, _fetch_page_content, url, timeout)
+    return content
+
+def _fetch_page_content(url: str, timeout: Optional[float]) -> str:
+    timeout = timeout or scraper_settings["timeout"]
+    deadline = time.monotonic() + timeout
+
+    # A recently fetched copy of the page is used as it is. An older copy is revalidated with the site
+    # using a conditional GET so it does not have to be downloaded and parsed again if it has not changed.
+    cached_page = _lookup_cached_page(url)
+    if cached_page is not None and cached_page.fresh:
+        return cached_page.text
+
+    # Requests to each host are spaced out and limited in number, and robots.txt is respected (see tools/politeness.py).
+    # Fetching robots.txt counts against the page's deadline.
+    scheduler = get_host_scheduler()
+    content = ''
+    try:
+        if scheduler is not None and not scheduler.allowed(url, HEADERS["User-Agent"], max(0.0, deadline - time.monotonic())):
+            return f"{BASE_ERROR_MSG} Disallowed by robots.txt for URL: {url}"
+
+        # The session comes from the shared registry so connections to the same host are reused
+        headers = {**HEADERS, **PageCache.conditional_headers(cached_page)}
+        request_timeout = (scraper_settings["connect_timeout"], min(scraper_settings["read_timeout"], timeout))
+        with _host_slot(scheduler, url, deadline), \
+             http_request("GET", url, headers=headers, timeout=request_timeout, stream=True) as response:
+            if scheduler is not None:
+                scheduler.response_received(url, response.status_code, response.headers)
+            content, reader = _start_reading(url, cached_page, response)
+            if reader is not None:
+                for chunk in response.iter_content(scraper_settings["chunk_size"]):
+                    if reader.feed(chunk):
+                        break
+                    # Whatever has been read when the deadline passes is used rather than nothing (but not cached)
+                    if time.monotonic() > deadline:
+                        reader.timed_out = True
+                        break
+                content = _finish_page(url, reader, response)
+
+    except HostSlotTimeout as e:
+        content = f"{BASE_ERROR_MSG} {e} for URL: {url}"
     except requests.HTTPError as e:
-        if e.response.status.code == 403:
-            content = f"{base_error_msg} Permission denied (403) for URL: {url}"
+        if e.response is not None and e.response.status_code == 403:
+            content = f"{BASE_ERROR_MSG} Permission denied (403) for URL: {url}"
         else:
-            content = f"{base_error_msg}"
-    
+            content = f"{BASE_ERROR_MSG}"
     except requests.RequestException as e:
-        content = f"{base_error_msg}, {str(e)}"
+        content = f"{BASE_ERROR_MSG}, {str(e)}"
     except Exception as e:
         pass
-    finally:
-        # could maybe use json.dumps instead of str. I think I would need to surrond {"source": url, "content": content} with double quotes though and therefore
-        # would be "{'source': url, 'content': content}"
-        state["scraper_response"].append(HumanMessage(
-            role="system", content=str({"source": url, "content": content})))
-        return {"scraper_response": state["scraper_response"]}
-
-# Explanation of soup.stripped_strings:
-    '''
-     - stripped strings returns a generator ('texts' is a generator object and not a list). But it can be converted to a
-        # list with list(soup.stripped_strings)
-    HTML Tag Removal: Yes, stripped_strings effectively removes HTML tags, but not directly. It's a byproduct of how BeautifulSoup works.
-    What stripped_strings actually does:
-
-    It traverses the parsed document tree.
-    It extracts only the text content from text nodes.
-    It ignores the tags themselves.
-    It strips whitespace from the beginning and end of each text segment.
-    It skips any strings that consist entirely of whitespace.
-
-
-    So, while it's not explicitly "stripping" HTML tags, the end result is that you get text content without HTML tags.
+
+    return content
+
+@log_function_call
+async def afetch_page_content(url: str, timeout: float = None) -> str:
+    """
+        Async version of fetch_page_content. HTML is parsed on the event loop as it arrives (the text budget
+        keeps this short) and PDFs are extracted in a worker thread so they do not block other coroutines.
+    """
+    content, _ = await get_single_flight("scraper").ado(url, _afetch_page_content, url, timeout)
+    return content
+
+async def _afetch_page_content(url: str, timeout: Optional[float]) -> str:
+    timeout = timeout or scraper_settings["timeout"]
+    deadline = time.monotonic() + timeout
+
+    cached_page = _lookup_cached_page(url)
+    if cached_page is not None and cached_page.fresh:
+        return cached_page.text
+
+    scheduler = get_host_scheduler()
+    content = ''
+    try:
+        if scheduler is not None and not await scheduler.aallowed(url, HEADERS["User-Agent"], max(0.0, deadline - time.monotonic())):
+            return f"{BASE_ERROR_MSG} Disallowed by robots.txt for URL: {url}"
+
+        headers = {**HEADERS, **PageCache.conditional_headers(cached_page)}
+        request_timeout = httpx.Timeout(min(scraper_settings["read_timeout"], timeout), connect=scraper_settings["connect_timeout"])
+        async with _ahost_slot(scheduler, url, deadline), \
+                   async_http_stream("GET", url, headers=headers, timeout=request_timeout) as response:
+            if scheduler is not None:
+                scheduler.response_received(url, response.status_code, response.headers)
+            content, reader = _start_reading(url, cached_page, response)
+            if reader is not None:
+                async for chunk in response.aiter_bytes(scraper_settings["chunk_size"]):
+                    if reader.feed(chunk):
+                        break
+                    if time.monotonic() > deadline:
+                        reader.timed_out = True
+                        break
+                content = await asyncio.to_thread(_finish_page, url, reader, response)
+
+    except HostSlotTimeout as e:
+        content = f"{BASE_ERROR_MSG} {e} for URL: {url}"
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
+            content = f"{BASE_ERROR_MSG} Permission denied (403) for URL: {url}"
+        else:
+            content = f"{BASE_ERROR_MSG}"
+    except httpx.HTTPError as e:
+        content = f"{BASE_ERROR_MSG}, {str(e)}"
+    except Exception as e:
+        pass
+
+    return content
+
+def _host_slot(scheduler: Optional[HostScheduler], url: str, deadline: float):
+    # Waiting for a slot counts against the page's deadline
+    if scheduler is None:
+        return contextlib.nullcontext()
+    return scheduler.slot(url, max(0.0, deadline - time.monotonic()))
+
+def _ahost_slot(scheduler: Optional[HostScheduler], url: str, deadline: float):
+    if scheduler is None:
+        return contextlib.nullcontext()
+    return scheduler.aslot(url, max(0.0, deadline - time.monotonic()))
+
+def _lookup_cached_page(url: str) -> Optional[CachedPage]:
+    page_cache = get_page_cache()
+    return page_cache.lookup(url) if page_cache is not None else None
+
+def _scraped_pages(pages: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    # Pages that could not be scraped are not worth indexing
+    return [(url, content) for url, content in pages if content and not content.startswith(BASE_ERROR_MSG)]
+
+def _scraper_message(url: str, content: str) -> HumanMessage:
+    # could maybe use json.dumps instead of str. I think I would need to surrond {"source": url, "content": content} with double quotes though and therefore
+    # would be "{'source': url, 'content': content}"
+    return HumanMessage(role="system", content=str({"source": url, "content": content}))
+
 '''
+selected_website is a function reference that when called gets the latest state
+of the result_selector.
+'''
+@log_function_call
+def scrape_website(state: AgentGraphState, selected_website):
+    # Call the selected_website function. The argument given is the address of a function that will get the most recent response
+    # from the result selector agent. Only the first chosen URL is scraped - see scrape_websites for the parallel version.
+    website_info = selected_website() if callable(selected_website) else selected_website
+    url = get_selected_urls(website_info)[0]
+
+    state["scraper_response"].append(_scraper_message(url, fetch_page_content(url)))
+    return {"scraper_response": state["scraper_response"]}
+
+@log_function_call
+def scrape_websites(state: AgentGraphState, selected_website, max_workers: int = None, timeout: float = None):
+    """
+        Scrapes every page chosen by the result selector at the same time, so a pass costs roughly
+        as long as the slowest page rather than the sum of all of them.
+
+        Args:
+            state (AgentGraphState): The current state of the graph.
+            selected_website (Callable[[], Any]): Gets the result selector responses.
+            max_workers (int, optional): Number of pages scraped at once. Defaults to scraper_settings["max_workers"].
+            timeout (float, optional): Seconds allowed per URL, counted from when its download starts (or, for a page
+                that was prefetched, from when the scraper asks for it). Defaults to scraper_settings["timeout"].
+                Pages queued behind others for a thread are covered by a limit on the whole pass of timeout for
+                each round of max_workers pages, plus a second.
+
+        Returns:
+            dict[str, Any]: State update with one scraper_response entry per source.
+    """
+    website_info = selected_website() if callable(selected_website) else selected_website
+    urls = get_selected_urls(website_info)
+    timeout = timeout or scraper_settings["timeout"]
+    max_workers = max(1, min(max_workers or scraper_settings["max_workers"], len(urls)))
+
+    # Pages prefetched while the result selector was running are not downloaded again (see tools/prefetch.py)
+    prefetcher = get_prefetcher()
+    prefetched = {url: prefetcher.take(current_run_key(), url) for url in urls} if prefetcher is not None else {}
+
+    # When each page's clock started. Prefetched pages are already downloading, so theirs starts now.
+    started = time.monotonic()
+    started_at: Dict[str, float] = {url: started for url in urls if prefetched.get(url) is not None}
+
+    def scrape(url: str) -> str:
+        started_at[url] = time.monotonic()
+        return fetch_page_content(url, timeout)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scraper")
+    # Each thread runs in a copy of the caller's context so its tracing spans and metrics belong to this node
+    futures = [prefetched.get(url) or executor.submit(contextvars.copy_context().run, scrape, url) for url in urls]
+    try:
+        done = _wait_for_pages(dict(zip(urls, futures)), started_at, timeout,
+                               started + timeout * math.ceil(len(urls) / max_workers) + 1)
+        pages = []
+        for url, future in zip(urls, futures):
+            if future in done:
+                content = future.result()
+            else:
+                content = f"{BASE_ERROR_MSG} Timed out after {timeout} seconds for URL: {url}"
+            state["scraper_response"].append(_scraper_message(url, content))
+            pages.append((url, content))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if prefetcher is not None:
+            prefetcher.discard(current_run_key())
+
+    # The pages are added to the local corpus so later runs can answer from it (see retrieval/retriever.py)
+    index_documents(_scraped_pages(pages))
+    return {"scraper_response": state["scraper_response"]}
+
+def _wait_for_pages(futures: Dict[str, Future], started_at: Dict[str, float], timeout: float, pass_deadline: float) -> set:
+    # Waits until every page has finished or run out of time, and returns the futures that finished. A page runs out
+    # of time timeout seconds after its clock started, whatever its download is still doing, and every page runs out
+    # of time at pass_deadline. Pages still running then are reported as timed out rather than holding up the rest
+    # of the sources.
+    done = set()
+    pending = dict(futures)
+    while pending:
+        now = time.monotonic()
+        deadlines = {url: min(started_at[url] + timeout, pass_deadline) if url in started_at else pass_deadline for url in pending}
+        for url, deadline in deadlines.items():
+            if now >= deadline:
+                del pending[url]
+        if not pending:
+            break
+        finished, _ = wait(pending.values(), timeout=min(deadlines[url] for url in pending) - now, return_when=FIRST_COMPLETED)
+        done |= finished
+        pending = {url: future for url, future in pending.items() if future not in finished}
+    return done
+
+@log_function_call
+async def ascrape_website(state: AgentGraphState, selected_website):
+    """
+        Async version of scrape_website.
+    """
+    website_info = selected_website() if callable(selected_website) else selected_website
+    url = get_selected_urls(website_info)[0]
+
+    state["scraper_response"].append(_scraper_message(url, await afetch_page_content(url)))
+    return {"scraper_response": state["scraper_response"]}
+
+@log_function_call
+async def ascrape_websites(state: AgentGraphState, selected_website, max_workers: int = None, timeout: float = None):
+    """
+        Async version of scrape_websites. The number of pages downloaded at once is bounded by a semaphore
+        and every page has its own timeout, counted from when it gets a slot (or, for a prefetched page, from when
+        the scraper asks for it).
+    """
+    website_info = selected_website() if callable(selected_website) else selected_website
+    urls = get_selected_urls(website_info)
+    timeout = timeout or scraper_settings["timeout"]
+    semaphore = asyncio.Semaphore(max_workers or scraper_settings["max_workers"])
+    prefetcher = get_prefetcher()
+
+    async def scrape(url: str) -> str:
+        prefetch = prefetcher.take(current_run_key(), url) if prefetcher is not None else None
+        try:
+            if prefetch is not None:
+                # Already downloading, so it does not need a slot
+                return await asyncio.wait_for(asyncio.wrap_future(prefetch) if isinstance(prefetch, Future) else prefetch, timeout)
+            async with semaphore:
+                return await asyncio.wait_for(afetch_page_content(url, timeout), timeout)
+        except asyncio.TimeoutError:
+            return f"{BASE_ERROR_MSG} Timed out after {timeout} seconds for URL: {url}"
+
+    try:
+        contents = await asyncio.gather(*(scrape(url) for url in urls))
+    finally:
+        if prefetcher is not None:
+            prefetcher.discard(current_run_key())
+    for url, content in zip(urls, contents):
+        state["scraper_response"].append(_scraper_message(url, content))
+
+    # Embedding is CPU work, so it is kept off the event loop
+    await asyncio.to_thread(index_documents, _scraped_pages(zip(urls, contents)))
+
+    return {"scraper_response": state["scraper_response"]}
@@ -1,8 +1,10 @@
 from datetime import datetime, timezone
-import functools
 import os
 import sys
 import types
+from typing import Iterable
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit, urlunsplit
+from utils.tracing import traced
 import yaml
 
 def get_current_utc_datetime():
@@ -10,6 +12,39 @@ def get_current_utc_datetime():
     current_time_utc = now_utc.strftime("%Y-%m-%d %H:%M:%S %Z")
     return current_time_utc
 
+def get_current_utc_date():
+    # Only changes once a day, so prompts that include it stay identical (and cacheable) between calls
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %Z")
+
+def canonicalize_url(url: str, loose: bool = False, drop_params: Iterable[str] = ()) -> str:
+    """
+        Gets a canonical form of a URL so that the same page is recognised even when it is linked
+        to in slightly different ways. The scheme and host are lowercased, default ports, fragments,
+        tracking parameters and trailing slashes are removed and the query parameters are sorted.
+
+        Args:
+            url (str): The URL to canonicalize.
+            loose (bool, optional): Also drop the scheme and a leading "www." and decode the path, so http/https and
+                www/bare links to the same page compare equal. The result is for comparing links, not requesting them.
+                Defaults to False.
+            drop_params (Iterable[str], optional): More query parameters to remove as well as utm_*.
+
+        Returns:
+            str: The canonical URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    if loose and host.startswith("www."):
+        host = host[4:]
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    drop_params = {param.lower() for param in drop_params}
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not key.lower().startswith("utm_") and key.lower() not in drop_params))
+    path = (unquote(parts.path) if loose else parts.path).rstrip("/") or "/"
+    return urlunsplit(("" if loose else scheme, host, path, query, ""))
+
 # Ignore this - was going to call this in every file and automate adding a decorator to each function
 # in that file (module) but it didn't work well. I'm not using it right in the module ...
 def apply_decorator_to_all_functions(module, decorator):
@@ -22,54 +57,22 @@ def print_function_name(function_name):
     print(f"\nEntering function: {function_name}\n")
 
 '''
-This code defines a decorator function called log_function_call. A decorator is a special kind of function that can modify or 
-enhance the behavior of other functions without changing their actual code. The purpose of this decorator is to add logging 
-functionality to any function it's applied to.
-
-The log_function_call function takes a single input: the function that it will be decorating (referred to as func in the code).
-It doesn't produce any direct output, but it returns a new function (called wrapper) that will replace the original function when
-the decorator is used.
-
-Here's how it works: When you use this decorator on a function, it creates a new function (wrapper) that does three things:
-
-It prints a message saying it's entering the original function.
-It calls the original function and stores its result.
-It prints a message saying it's exiting the original function.
-Finally, it returns the result of the original function.
-The wrapper function uses *args and **kwargs, which allow it to accept any number and type of arguments. 
-This means the decorator can be used on functions with any number of parameters.
-
-The @functools.wraps(func) line is a special decorator that helps preserve the original function's metadata
-(like its name and docstring) in the new wrapper function.
-
-When you use this decorator on a function, it will print log messages every time that function is called, showing when 
-the function starts and ends its execution. This can be very useful for debugging or understanding the flow of your program,
-especially when dealing with complex functions or multiple function calls.
-Update: Added ability to print class name too.
+log_function_call is the decorator used on most functions in the project. It used to print a message every time a
+function was entered and exited. It is now a thin alias for utils.tracing.traced at the "debug" level: when
+TRACE_LEVEL is "debug" each call is recorded as a timed span (nested under the span of its caller) and written to
+the trace file, and at any other level the function is returned unwrapped so the decorator costs nothing.
 '''
 def log_function_call(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        if args and hasattr(args[0], '__class__'):
-            class_name = args[0].__class__.__name__
-            print(f"Entering {class_name}.{func.__name__}")
-        else:
-            print(f"Entering {func.__name__}")
-        
-        result = func(*args, **kwargs)
-        
-        if args and hasattr(args[0], '__class__'):
-            class_name = args[0].__class__.__name__
-            print(f"Exiting {class_name}.{func.__name__}")
-        else:
-            print(f"Exiting {func.__name__}")
-        
-        return result
-    return wrapper
+    return traced(func, level="debug")
 
 '''
+Copies the keys in the YAML config file (e.g. API keys) into environment variables. A missing file is not an
+error, so the keys can also be set in the environment directly (e.g. by the offline benchmarks).
 '''
 def load_config(file_path):
+    if not os.path.exists(file_path):
+        return
+
     with open(file_path, 'r') as file:
         config =yaml.safe_load(file)
 
@@ -0,0 +1,223 @@
+import asyncio
+from contextlib import asynccontextmanager
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+from typing import AsyncIterator, Dict
+import weakref
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from config.settings import http_settings
+from utils.helper_functions import log_function_call
+from utils.metrics import record_io
+from utils.rate_limiter import get_limiter_for_url
+
+# Process-wide registry of pooled sessions. Every tool and agent borrows its session from here so that
+# keep-alive connections and TLS sessions are reused between calls instead of being set up every time.
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+# httpx async clients are tied to the event loop they are first used on, so there is one set of clients per loop.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+def _host_key(url: str) -> str:
+    """
+        Gets the registry key for a URL. Hosts with their own entry in http_settings["hosts"] get a
+        dedicated session; every other host shares the "default" one.
+    """
+    netloc = urlsplit(url).netloc.lower()
+    return netloc if netloc in http_settings["hosts"] else "default"
+
+def get_host_settings(url: str) -> dict:
+    """
+        Gets the pool, timeout and retry settings for the host of a URL.
+
+        Args:
+            url (str): URL that is about to be requested.
+
+        Returns:
+            dict: The default settings overridden by any host specific ones.
+    """
+    key = _host_key(url)
+    return {**http_settings["default"], **http_settings["hosts"].get(key, {})}
+
+def _create_session(settings: dict) -> requests.Session:
+    retry = Retry(total=settings["retries"],
+                  backoff_factor=settings["backoff_factor"],
+                  status_forcelist=(502, 503, 504),
+                  allowed_methods=None, # Serper searches and LLM completions are safe to send again
+                  respect_retry_after_header=False, # Rate limited responses are retried by utils/rate_limiter.py
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=settings["pool_connections"],
+                          pool_maxsize=settings["pool_maxsize"],
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@log_function_call
+def get_session(url: str) -> requests.Session:
+    """
+        Gets the shared, pooled session for the host of a URL, creating it on first use.
+
+        Args:
+            url (str): URL that is about to be requested.
+
+        Returns:
+            requests.Session: Session that can be used from any thread.
+    """
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _create_session(get_host_settings(url))
+    return session
+
+@log_function_call
+def http_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+        Sends a request through the shared session for the URL's host. The host's connect and
+        read timeouts are used unless a timeout is given.
+
+        Args:
+            method (str): HTTP method e.g. "GET" or "POST".
+            url (str): The URL to request.
+            **kwargs: Passed on to requests.Session.request.
+
+        Returns:
+            requests.Response: The response.
+    """
+    if "timeout" not in kwargs:
+        settings = get_host_settings(url)
+        kwargs["timeout"] = (settings["connect_timeout"], settings["read_timeout"])
+    # Providers with a quota (rate_limit_settings) are sent requests through their token bucket, and rate limited
+    # responses are retried after a backoff instead of being returned
+    limiter = get_limiter_for_url(url)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        started = time.perf_counter()
+        response = get_session(url).request(method, url, **kwargs)
+        _record_response(response, time.perf_counter() - started, streamed=kwargs.get("stream", False))
+        delay = limiter.response_received(response.status_code, response.headers, attempt) if limiter is not None else None
+        if delay is None:
+            return response
+        response.close()
+        time.sleep(delay)
+        attempt += 1
+
+def _record_response(response, seconds: float, streamed: bool = False):
+    # Adds the time spent waiting and the bytes moved to the metrics of the node making the request.
+    # The body of a streamed response has not been read yet, so its Content-Length is used instead.
+    body = getattr(response.request, "body", None) if isinstance(response, requests.Response) else response.request.content
+    bytes_sent = len(body) if body else 0
+    if streamed:
+        bytes_received = int(response.headers.get("Content-Length", 0))
+    else:
+        bytes_received = len(response.content)
+    record_io(seconds, bytes_received=bytes_received, bytes_sent=bytes_sent)
+
+def _create_async_client(settings: dict) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=settings["pool_connections"] * settings["pool_maxsize"],
+                          max_keepalive_connections=settings["pool_maxsize"])
+    # httpx only retries failed connections, 502/503/504 responses are returned to the caller
+    transport = httpx.AsyncHTTPTransport(limits=limits, retries=settings["retries"])
+    return httpx.AsyncClient(transport=transport, follow_redirects=True)
+
+def get_async_client(url: str) -> httpx.AsyncClient:
+    """
+        Gets the shared async client for the host of a URL on the running event loop, creating it on first use.
+
+        Args:
+            url (str): URL that is about to be requested.
+
+        Returns:
+            httpx.AsyncClient: Client that can be used by any coroutine on the running loop.
+    """
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    key = _host_key(url)
+    client = clients.get(key)
+    if client is None:
+        client = clients[key] = _create_async_client(get_host_settings(url))
+    return client
+
+async def async_http_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+        Async version of http_request. Sends a request through the shared async client for the URL's host.
+
+        Args:
+            method (str): HTTP method e.g. "GET" or "POST".
+            url (str): The URL to request.
+            **kwargs: Passed on to httpx.AsyncClient.request.
+
+        Returns:
+            httpx.Response: The response.
+    """
+    if "timeout" not in kwargs:
+        settings = get_host_settings(url)
+        kwargs["timeout"] = httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"])
+    limiter = get_limiter_for_url(url)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.aacquire()
+        started = time.perf_counter()
+        response = await get_async_client(url).request(method, url, **kwargs)
+        _record_response(response, time.perf_counter() - started)
+        delay = limiter.response_received(response.status_code, response.headers, attempt) if limiter is not None else None
+        if delay is None:
+            return response
+        await asyncio.sleep(delay)
+        attempt += 1
+
+@asynccontextmanager
+async def async_http_stream(method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+    """
+        Like async_http_request, but the body is not read up front so it can be consumed as it arrives
+        e.g. with response.aiter_lines(). Use as "async with async_http_stream(...) as response:".
+    """
+    if "timeout" not in kwargs:
+        settings = get_host_settings(url)
+        kwargs["timeout"] = httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"])
+    client = get_async_client(url)
+    limiter = get_limiter_for_url(url)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.aacquire()
+        started = time.perf_counter()
+        response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+        _record_response(response, time.perf_counter() - started, streamed=True)
+        delay = limiter.response_received(response.status_code, response.headers, attempt) if limiter is not None else None
+        if delay is None:
+            break
+        await response.aclose()
+        await asyncio.sleep(delay)
+        attempt += 1
+    try:
+        yield response
+    finally:
+        await response.aclose()
+
+async def aclose_async_clients():
+    """
+        Closes the async clients that belong to the running event loop.
+    """
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+def close_sessions():
+    """
+        Closes every pooled session e.g. when the app is shutting down.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,211 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import inspect
+import json
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from config.settings import llm_pricing
+from utils.tracing import current_run_id
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+class Histogram():
+    """
+        Cumulative histogram in the Prometheus style.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+class NodeMetrics():
+    """
+        What one execution of a graph node cost. The HTTP clients and agents add to it while the node runs.
+    """
+    FIELDS = ("wall_seconds", "io_seconds", "prompt_tokens", "completion_tokens",
+              "http_bytes_received", "http_bytes_sent", "cost_usd", "coalesced_requests")
+
+    def __init__(self):
+        self.values: Dict[str, float] = dict.fromkeys(self.FIELDS, 0)
+        # Scraper threads can add to the same node at once
+        self._lock = threading.Lock()
+
+    def add(self, **values: float):
+        with self._lock:
+            for key, value in values.items():
+                self.values[key] += value
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """
+        Estimates the cost of an LLM call in US dollars from llm_pricing. Unknown models are free.
+    """
+    pricing = llm_pricing.get(model or "")
+    if pricing is None:
+        return 0.0
+    return (prompt_tokens * pricing["prompt"] + completion_tokens * pricing["completion"]) / 1_000_000
+
+class MetricsCollector():
+    """
+        In-process store of per-node latency histograms and token, byte and cost counters, with a
+        per-run breakdown. Can be dumped as Prometheus text or JSON at the end of a run or batch.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.wall_seconds: Dict[str, Histogram] = {}
+            self.io_seconds: Dict[str, Histogram] = {}
+            self.totals: Dict[str, Dict[str, float]] = {}
+            self.runs: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    def observe_node(self, node: str, node_metrics: NodeMetrics, run_id: Optional[str] = None):
+        """
+            Adds one execution of a node to the histograms, the totals and the run's breakdown.
+        """
+        values = node_metrics.values
+        with self._lock:
+            self.wall_seconds.setdefault(node, Histogram()).observe(values["wall_seconds"])
+            self.io_seconds.setdefault(node, Histogram()).observe(values["io_seconds"])
+            for target in (self.totals.setdefault(node, {}),
+                           self.runs.setdefault(run_id or "default", {}).setdefault(node, {})):
+                for key, value in values.items():
+                    target[key] = target.get(key, 0) + value
+                target["executions"] = target.get("executions", 0) + 1
+
+    def to_json(self) -> str:
+        """
+            Returns the totals and mean latencies per node and the per-run breakdown as JSON.
+        """
+        with self._lock:
+            report = {
+                "nodes": {node: {**totals,
+                                 "wall_seconds_mean": totals["wall_seconds"] / totals["executions"],
+                                 "io_seconds_mean": totals["io_seconds"] / totals["executions"]}
+                          for node, totals in self.totals.items()},
+                "runs": self.runs,
+            }
+        return json.dumps(report, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+            Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, histograms, description in (("agent_node_wall_seconds", self.wall_seconds, "Wall-clock time of each graph node execution"),
+                                                  ("agent_node_io_seconds", self.io_seconds, "Time each graph node execution spent waiting on HTTP and LLM calls, summed over concurrent requests")):
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+                for node, histogram in histograms.items():
+                    for upper_bound, count in zip(histogram.buckets, histogram.counts):
+                        le = "+Inf" if upper_bound == math.inf else str(upper_bound)
+                        lines.append(f'{name}_bucket{{node="{node}",le="{le}"}} {count}')
+                    lines.append(f'{name}_sum{{node="{node}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{node="{node}"}} {histogram.count}')
+
+            for field, description in (("prompt_tokens", "Prompt tokens sent to LLMs"),
+                                        ("completion_tokens", "Completion tokens returned by LLMs"),
+                                        ("http_bytes_received", "HTTP response bytes received"),
+                                        ("http_bytes_sent", "HTTP request bytes sent"),
+                                        ("cost_usd", "Estimated LLM cost in US dollars"),
+                                        ("coalesced_requests", "Requests served by an identical request that was already in flight")):
+                name = f"agent_node_{field}_total"
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+                for node, totals in self.totals.items():
+                    lines.append(f'{name}{{node="{node}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str, metrics_format: str = "json"):
+        """
+            Writes the metrics to a file as "json" or "prometheus" text.
+        """
+        with open(path, "w") as file:
+            file.write(self.to_prometheus() if metrics_format == "prometheus" else self.to_json())
+
+metrics = MetricsCollector()
+
+# The node execution the current code is running in
+_current_node: ContextVar[Optional[NodeMetrics]] = ContextVar("current_node", default=None)
+
+def record_io(seconds: float, bytes_received: int = 0, bytes_sent: int = 0):
+    """
+        Adds time spent waiting on an HTTP or LLM call (and the bytes moved) to the current node, if any.
+    """
+    node_metrics = _current_node.get()
+    if node_metrics is not None:
+        node_metrics.add(io_seconds=seconds, http_bytes_received=bytes_received, http_bytes_sent=bytes_sent)
+
+def record_tokens(model: Optional[str], prompt_tokens: int, completion_tokens: int):
+    """
+        Adds the token usage of an LLM call, and its estimated cost, to the current node, if any.
+    """
+    node_metrics = _current_node.get()
+    if node_metrics is not None:
+        node_metrics.add(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                         cost_usd=estimate_cost(model, prompt_tokens, completion_tokens))
+
+def record_coalesced():
+    """
+        Counts a search, page or LLM request that shared another caller's in-flight request (see utils/single_flight.py).
+    """
+    node_metrics = _current_node.get()
+    if node_metrics is not None:
+        node_metrics.add(coalesced_requests=1)
+
+@contextmanager
+def collect_io() -> Iterator[NodeMetrics]:
+    """
+        Collects the I/O of the code inside the block (including tasks and threads started from it with a copy of its
+        context) in a NodeMetrics of its own rather than the current node's e.g. for background work that outlives the node.
+    """
+    node_metrics = NodeMetrics()
+    token = _current_node.set(node_metrics)
+    try:
+        yield node_metrics
+    finally:
+        _current_node.reset(token)
+
+def instrument_node(name: str, func: Callable) -> Callable:
+    """
+        Wraps a graph node function (sync or async) so that each execution is added to the metrics collector.
+    """
+    def start():
+        node_metrics = NodeMetrics()
+        return node_metrics, _current_node.set(node_metrics), time.perf_counter()
+
+    def finish(node_metrics: NodeMetrics, token, started: float):
+        _current_node.reset(token)
+        node_metrics.add(wall_seconds=time.perf_counter() - started)
+        metrics.observe_node(name, node_metrics, current_run_id())
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            node_metrics, token, started = start()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                finish(node_metrics, token, started)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        node_metrics, token, started = start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            finish(node_metrics, token, started)
+    return wrapper
@@ -0,0 +1,330 @@
+import asyncio
+from email.utils import parsedate_to_datetime
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+from urllib.parse import urlsplit
+from config.settings import rate_limit_settings
+from utils.tracing import trace_event
+
+try:
+    from openai import APIConnectionError
+except ImportError: # openai is installed with langchain_openai - without it only the built in connection errors are transient
+    APIConnectionError = None
+
+'''
+Client side rate limiting for the APIs with quotas (Serper, OpenAI and the local LLM server). Every provider has
+one token bucket shared by all threads and event loops in the process, so a batch of runs stays inside the quota
+together instead of each run finding out about it with a 429.
+
+The bucket adapts to what the provider says:
+ - a 429 halves the rate (rate_limit_settings["decrease_factor"]) and, if the response has a Retry-After header,
+   holds back every request to that provider until then. The request is retried after a jittered exponential backoff.
+ - a 5xx, 408 or 409 response or a connection error (rate_limit_settings["transient_statuses"]) is retried up to
+   transient_retries times with the same backoff, without slowing the provider down. This stands in for the SDK's own
+   retries, which are turned off so that 429s reach the limiter.
+ - rate limit headers (x-ratelimit-remaining-requests / x-ratelimit-reset-requests and the like) set the rate to
+   what is left of the quota over the time until it resets.
+ - every other successful response adds a little back to the rate, up to the configured requests_per_second.
+   Error responses never do, so a provider that is failing is not sped up.
+'''
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def _header(headers: Mapping[str, str], *names: str) -> Optional[str]:
+    # requests and httpx headers are case-insensitive, plain dicts are not
+    lowered = {key.lower(): value for key, value in headers.items()} if isinstance(headers, dict) else headers
+    for name in names:
+        value = lowered.get(name)
+        if value is not None:
+            return value
+    return None
+
+def parse_seconds(value: Optional[str]) -> Optional[float]:
+    """
+        Parses a delay header into seconds. Accepts seconds ("2", "0.5"), durations ("1s", "6m0s", "250ms"),
+        Unix timestamps and HTTP dates. Returns None if the value cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+        # Large numbers are a time to wait until rather than a number of seconds to wait
+        return max(0.0, seconds - time.time()) if seconds > 1_000_000_000 else max(0.0, seconds)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """
+        Gets how long the server asked us to wait from the Retry-After (or OpenAI's retry-after-ms) header.
+    """
+    milliseconds = parse_seconds(_header(headers, "retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000
+    return parse_seconds(_header(headers, "retry-after"))
+
+class RateLimiter():
+    """
+        Adaptive token bucket for one provider.
+
+        Args:
+            name (str): The provider's key in rate_limit_settings["providers"].
+            requests_per_second (float): The most requests per second the provider is sent.
+            burst (int): How many requests can be sent at once after a quiet period.
+            settings (dict, optional): Defaults to rate_limit_settings.
+
+        Attributes:
+            rate (float): The current rate in requests per second.
+            throttled (int): Responses that were rate limited.
+            retries (int): Requests that were sent again after being rate limited or failing transiently.
+    """
+    def __init__(self, name: str, requests_per_second: float, burst: int, settings: dict = None):
+        self.name = name
+        self.settings = settings or rate_limit_settings
+        self.max_rate = float(requests_per_second)
+        self.rate = self.max_rate
+        self.capacity = float(burst)
+        self.tokens = self.capacity
+        self.throttled = 0
+        self.retries = 0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        # Takes a token and returns how long the caller has to wait for it. Tokens can go negative, so callers
+        # queue up behind each other in the order they arrived instead of all waking up at once.
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self):
+        """
+            Waits until a request can be sent.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """
+            Async version of acquire.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _set_rate(self, rate: float):
+        self.rate = min(self.max_rate, max(self.settings["min_requests_per_second"], rate))
+
+    def response_received(self, status: int, headers: Mapping[str, str], attempt: int) -> Optional[float]:
+        """
+            Adjusts the rate from a response.
+
+            Args:
+                status (int): The response status code.
+                headers (Mapping[str, str]): The response headers.
+                attempt (int): How many times the request has been retried already.
+
+            Returns:
+                float | None: Seconds to wait before sending the request again, or None if it should not be retried.
+        """
+        retry_after = retry_after_seconds(headers)
+        remaining = _header(headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining", "ratelimit-remaining")
+        reset = parse_seconds(_header(headers, "x-ratelimit-reset-requests", "x-ratelimit-reset", "ratelimit-reset"))
+        limited = status in self.settings["retry_statuses"]
+
+        with self._lock:
+            now = time.monotonic()
+            if remaining is not None and reset is not None:
+                try:
+                    remaining_requests = float(remaining)
+                except ValueError:
+                    remaining_requests = None
+                if remaining_requests is not None and remaining_requests <= 0:
+                    self._paused_until = max(self._paused_until, now + reset)
+                elif remaining_requests is not None and reset > 0:
+                    # Spread what is left of the quota over the time until it resets
+                    self._set_rate(remaining_requests / reset)
+            if limited:
+                self.throttled += 1
+                self._set_rate(self.rate * self.settings["decrease_factor"])
+                if retry_after is not None:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            elif remaining is None and status < 400:
+                self._set_rate(self.rate + self.settings["increase_step"])
+
+        if not limited:
+            return None
+        trace_event("rate_limited", provider=self.name, status=status, attempt=attempt, rate=round(self.rate, 3),
+                    retry_after=retry_after)
+        if attempt >= self.settings["max_retries"]:
+            return None
+        self.retries += 1
+        return self.backoff(attempt, retry_after)
+
+    def transient_delay(self, error: Exception, status: Optional[int], attempt: int) -> Optional[float]:
+        """
+            Decides whether a call that failed with something other than a rate limit is retried.
+
+            Args:
+                error (Exception): What the call raised.
+                status (int, optional): The response status code, if there was a response.
+                attempt (int): How many times the request has been retried after a transient failure already.
+
+            Returns:
+                float | None: Seconds to wait before sending the request again, or None if it should not be retried.
+        """
+        if status is not None:
+            transient = status in self.settings["transient_statuses"]
+        else:
+            transient = isinstance(error, (ConnectionError, TimeoutError)) or (APIConnectionError is not None and isinstance(error, APIConnectionError))
+        if not transient or attempt >= self.settings["transient_retries"]:
+            return None
+        trace_event("transient_failure", provider=self.name, status=status, attempt=attempt, error=type(error).__name__)
+        with self._lock:
+            self.retries += 1
+        return self.backoff(attempt)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+            Exponential backoff with full jitter, but never less than the server's Retry-After.
+        """
+        ceiling = min(self.settings["max_delay"], self.settings["base_delay"] * 2 ** attempt)
+        return max(retry_after or 0.0, random.uniform(0, ceiling))
+
+    def stats(self) -> Dict[str, float]:
+        return {"rate": round(self.rate, 3), "throttled": self.throttled, "retries": self.retries}
+
+def _error_response(error: Exception):
+    # The status code and headers of an API error raised by an SDK e.g. openai.RateLimitError
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    return status, getattr(response, "headers", None) or {}
+
+def _rate_limit_delay(limiter: "RateLimiter", status: Optional[int], headers: Mapping[str, str], attempt: int) -> Optional[float]:
+    # Only rate limited responses and responses that report the quota are passed to the limiter. Other errors
+    # (e.g. a 503) are left to transient_delay.
+    if status in limiter.settings["retry_statuses"] or _header(headers, "x-ratelimit-remaining-requests",
+                                                                "x-ratelimit-remaining", "ratelimit-remaining") is not None:
+        return limiter.response_received(status, headers, attempt)
+    return None
+
+def call_with_rate_limit(limiter: Optional["RateLimiter"], fn: Callable[[], Any], can_retry: Callable[[], bool] = None) -> Any:
+    """
+        Calls an SDK that raises on a rate limited response (e.g. ChatOpenAI) through a limiter, retrying
+        rate limited calls and transient failures (see RateLimiter.transient_delay). fn is called directly if there
+        is no limiter.
+
+        Args:
+            limiter (RateLimiter | None): The provider's limiter.
+            fn (Callable[[], Any]): Makes the call.
+            can_retry (Callable[[], bool], optional): Asked before a failed call is sent again. e.g. a stream that has
+                already passed tokens on cannot be sent again without repeating them.
+    """
+    if limiter is None:
+        return fn()
+    attempt = transient_attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            if can_retry is not None and not can_retry():
+                raise
+            status, headers = _error_response(e)
+            delay = _rate_limit_delay(limiter, status, headers, attempt)
+            if delay is not None:
+                attempt += 1
+            else:
+                delay = limiter.transient_delay(e, status, transient_attempt)
+                if delay is None:
+                    raise
+                transient_attempt += 1
+            time.sleep(delay)
+            continue
+        limiter.response_received(200, {}, attempt)
+        return result
+
+async def acall_with_rate_limit(limiter: Optional["RateLimiter"], fn: Callable[[], Awaitable[Any]],
+                               can_retry: Callable[[], bool] = None) -> Any:
+    """
+        Async version of call_with_rate_limit.
+    """
+    if limiter is None:
+        return await fn()
+    attempt = transient_attempt = 0
+    while True:
+        await limiter.aacquire()
+        try:
+            result = await fn()
+        except Exception as e:
+            if can_retry is not None and not can_retry():
+                raise
+            status, headers = _error_response(e)
+            delay = _rate_limit_delay(limiter, status, headers, attempt)
+            if delay is not None:
+                attempt += 1
+            else:
+                delay = limiter.transient_delay(e, status, transient_attempt)
+                if delay is None:
+                    raise
+                transient_attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        limiter.response_received(200, {}, attempt)
+        return result
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(name: str) -> Optional[RateLimiter]:
+    """
+        Gets the process-wide limiter for a provider in rate_limit_settings["providers"], or None if it is not listed
+        or rate limiting is disabled.
+    """
+    if not rate_limit_settings["enabled"]:
+        return None
+    limiter = _limiters.get(name)
+    if limiter is None:
+        provider = rate_limit_settings["providers"].get(name)
+        if provider is None:
+            return None
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = RateLimiter(name, provider["requests_per_second"], provider["burst"])
+    return limiter
+
+def get_limiter_for_url(url: str) -> Optional[RateLimiter]:
+    """
+        Gets the limiter of the provider whose hosts include the host of a URL, if any.
+    """
+    netloc = urlsplit(url).netloc.lower()
+    for name, provider in rate_limit_settings["providers"].items():
+        if netloc in provider.get("hosts", ()):
+            return get_rate_limiter(name)
+    return None
+
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    """
+        Returns the current rate and the throttled and retried counts of every limiter that has been used.
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+from config.settings import single_flight_settings
+from utils.metrics import record_coalesced
+from utils.tracing import trace_event
+
+'''
+Single-flight request coalescing. When several runs ask for exactly the same thing at the same moment (the same
+Serper search, the same page, the same temperature 0 LLM prompt) only the first caller - the leader - makes the
+request. Everyone else with the same key waits for it and gets its result, or its exception. Once the request has
+finished the key is forgotten, so nothing is cached here (that is the job of the search, page and LLM caches) and
+a failed request is tried again by the next caller.
+'''
+
+class _Call():
+    # A request made by a leader in a thread, waited on by the threads that arrive while it is in flight
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+class _Flight():
+    # A request made as a task on an event loop, awaited by every coroutine with the same key
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight():
+    """
+        Coalesces identical in-flight requests. Works from threads (do) and from coroutines (ado). Threads and
+        coroutines are coalesced separately, and coroutines only with others on the same event loop.
+
+        Args:
+            name (str): Name of the group, used in the counters and the trace e.g. "serper".
+
+        Attributes:
+            calls (int): Requests actually made.
+            coalesced (int): Requests that were served by another caller's in-flight request.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._flights: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], _Flight] = {}
+
+    def _joined(self):
+        # Called with the lock held by a caller that is sharing another caller's request
+        self.coalesced += 1
+        record_coalesced()
+        trace_event("request_coalesced", group=self.name)
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+            Calls fn(*args, **kwargs), unless a call with the same key is already running in another thread,
+            in which case its outcome is shared.
+
+            Args:
+                key (Hashable): Identifies the request e.g. a URL or a cache key.
+                fn (Callable[..., Any]): Makes the request.
+
+            Returns:
+                Tuple[Any, bool]: The result and whether it was shared with another caller. If the request raised,
+                    every caller waiting on it gets the same exception.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self._joined()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+            Async version of do. The request runs as its own task (in the leader's context, so its metrics and trace
+            spans belong to the leader's node) and is only cancelled if every caller waiting on it has been cancelled,
+            so one run timing out does not take the result away from the others.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            shared = flight is not None
+            if shared:
+                self._joined()
+            else:
+                flight = self._flights[flight_key] = _Flight(loop.create_task(fn(*args, **kwargs)))
+                flight.task.add_done_callback(lambda task: self._finished(flight_key, flight))
+                self.calls += 1
+            flight.waiters += 1
+
+        try:
+            return await asyncio.shield(flight.task), shared
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                # This caller was cancelled, not the request. Stop the request if nobody else is waiting for it.
+                with self._lock:
+                    flight.waiters -= 1
+                    if flight.waiters == 0:
+                        self._forget(flight_key, flight)
+                        flight.task.cancel()
+            raise
+
+    def _finished(self, flight_key: Tuple[asyncio.AbstractEventLoop, Hashable], flight: _Flight):
+        with self._lock:
+            self._forget(flight_key, flight)
+
+    def _forget(self, flight_key: Tuple[asyncio.AbstractEventLoop, Hashable], flight: _Flight):
+        # A cancelled request may already have been replaced by a new one with the same key
+        if self._flights.get(flight_key) is flight:
+            del self._flights[flight_key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+class _Passthrough(SingleFlight):
+    # Used for groups switched off in single_flight_settings - every caller makes its own request
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        self.calls += 1
+        return fn(*args, **kwargs), False
+
+    async def ado(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Tuple[Any, bool]:
+        self.calls += 1
+        return await fn(*args, **kwargs), False
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+def get_single_flight(name: str) -> SingleFlight:
+    """
+        Gets the process-wide single-flight group for a kind of request ("serper", "scraper" or "llm"), creating it on
+        first use. Groups switched off in single_flight_settings pass every request straight through.
+    """
+    group = _groups.get(name)
+    if group is None:
+        with _groups_lock:
+            group = _groups.get(name)
+            if group is None:
+                group_class = SingleFlight if single_flight_settings.get(name, True) else _Passthrough
+                group = _groups[name] = group_class(name)
+    return group
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """
+        Returns the request and coalesced counters of every group.
+    """
+    with _groups_lock:
+        groups: List[SingleFlight] = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
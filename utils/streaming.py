@@ -0,0 +1,77 @@
+import json
+import sys
+from typing import Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler, adispatch_custom_event, dispatch_custom_event
+from termcolor import colored
+
+# Name of the custom callback event that carries tokens streamed from local (OpenAI-compatible) LLM servers.
+# Tokens from ChatOpenAI.stream arrive through the normal on_llm_new_token callback instead.
+LLM_TOKEN_EVENT = "llm_token"
+
+def parse_stream_chunk(line: str | bytes) -> Optional[dict]:
+    """
+        Parses one line of a streamed chat completion. OpenAI-compatible servers send server-sent events
+        ("data: {...}") and Ollama sends one JSON object per line, so both are accepted.
+
+        Args:
+            line (str | bytes): A line of the response body.
+
+        Returns:
+            dict | None: The chunk, or None if the line does not carry one (e.g. blank lines and "data: [DONE]").
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.strip()
+    if line.startswith("data:"):
+        line = line[len("data:"):].strip()
+    if not line or line == "[DONE]" or not line.startswith("{"):
+        return None
+    return json.loads(line)
+
+def stream_chunk_token(chunk: dict) -> Optional[str]:
+    """
+        Gets the content token from a streamed chunk, or None if it has none (e.g. the final usage chunk).
+    """
+    if chunk.get("choices"):
+        return chunk["choices"][0].get("delta", {}).get("content") or None
+    return chunk.get("message", {}).get("content") or None
+
+def emit_token(agent: str, token: str):
+    """
+        Pushes a streamed token to the callbacks of the graph run the caller is part of. Does nothing when
+        the agent is being used outside of a graph run.
+    """
+    try:
+        dispatch_custom_event(LLM_TOKEN_EVENT, {"agent": agent, "token": token})
+    except RuntimeError:
+        # Raised when there is no parent run to send the event to
+        pass
+
+async def aemit_token(agent: str, token: str):
+    """
+        Async version of emit_token.
+    """
+    try:
+        await adispatch_custom_event(LLM_TOKEN_EVENT, {"agent": agent, "token": token})
+    except RuntimeError:
+        pass
+
+class TokenPrinter(BaseCallbackHandler):
+    """
+        Callback handler that prints LLM tokens to the console as they arrive. Pass it in the run config
+        e.g. workflow.stream(input, {"callbacks": [TokenPrinter()]}) to see the agents' output straight away
+        rather than when each node has finished.
+    """
+    def __init__(self, colour: str = "yellow"):
+        self.colour = colour
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._print(token)
+
+    def on_custom_event(self, name: str, data: Any, **kwargs: Any) -> None:
+        if name == LLM_TOKEN_EVENT:
+            self._print(data["token"])
+
+    def _print(self, token: str):
+        sys.stdout.write(colored(token, self.colour))
+        sys.stdout.flush()
@@ -0,0 +1,164 @@
+import atexit
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+from config.settings import tracing_settings
+
+LEVELS = {"off": 0, "info": 1, "debug": 2}
+
+# Spans are timed with the monotonic perf_counter clock and written as Chrome trace events
+# (https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU) or as JSON lines.
+_level = LEVELS.get(str(tracing_settings["level"]).lower(), 0)
+_events: List[Dict[str, Any]] = []
+_events_lock = threading.Lock()
+# Chrome trace files this process has written, which later flushes add to. Any other file at the path is from an
+# earlier run and is replaced.
+_chrome_paths: Set[str] = set()
+_flush_lock = threading.Lock()
+_span_ids = itertools.count(1)
+_pid = os.getpid()
+
+# The span the current code is running in, and the graph run it belongs to
+_current_span: ContextVar[Optional[int]] = ContextVar("current_span", default=None)
+_current_run: ContextVar[Optional[str]] = ContextVar("current_run", default=None)
+
+def is_enabled(level: str = "info") -> bool:
+    """
+        Returns True if spans at the given level are being recorded.
+    """
+    return _level >= LEVELS[level]
+
+def _record(event: Dict[str, Any]):
+    with _events_lock:
+        _events.append(event)
+
+@contextmanager
+def _span(name: str, category: str, args: Dict[str, Any]):
+    span_id = next(_span_ids)
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.perf_counter_ns()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter_ns()
+        _current_span.reset(token)
+        _record({"name": name, "cat": category, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000,
+                 "pid": _pid, "tid": threading.get_ident(),
+                 "args": {**args, "span_id": span_id, "parent_id": parent_id, "run_id": _current_run.get()}})
+
+def span(name: str, level: str = "info", category: str = "span", **args):
+    """
+        Times a block of code as a span nested under the span it is called from. Returns a no-op context
+        manager when the level is not being traced. Extra keyword arguments are stored with the span and can be
+        added to inside the block through the dictionary the context manager returns.
+
+        Example:
+            with span("scrape", url=url) as span_args:
+                ...
+                span_args["bytes"] = len(body)
+    """
+    if _level < LEVELS[level]:
+        return nullcontext({})
+    return _span(name, category, args)
+
+@contextmanager
+def trace_run(run_id: str, **args):
+    """
+        Marks the code inside the block as one graph run. Every span recorded inside it (including in threads
+        and tasks started from it) is tagged with the run id.
+    """
+    token = _current_run.set(run_id)
+    try:
+        with span("graph_run", category="run", **args):
+            yield
+    finally:
+        _current_run.reset(token)
+
+def current_run_id() -> Optional[str]:
+    """
+        Gets the id of the graph run (see trace_run) the caller is part of. Available even when tracing is off.
+    """
+    return _current_run.get()
+
+def trace_event(name: str, level: str = "info", **args):
+    """
+        Records an instant event (e.g. a routing decision) in the current span.
+    """
+    if _level < LEVELS[level]:
+        return
+    _record({"name": name, "cat": "event", "ph": "i", "s": "t", "ts": time.perf_counter_ns() / 1000,
+             "pid": _pid, "tid": threading.get_ident(),
+             "args": {**args, "parent_id": _current_span.get(), "run_id": _current_run.get()}})
+
+def traced(func=None, *, level: str = "debug", name: Optional[str] = None):
+    """
+        Decorator that records a span for every call of a function. When the level is not being traced the
+        original function is returned unwrapped, so the decorator costs nothing at all. Works with both normal
+        functions and coroutine functions.
+    """
+    if func is None:
+        return functools.partial(traced, level=level, name=name)
+    if _level < LEVELS[level]:
+        return func
+
+    span_name = name or func.__qualname__
+    category = func.__module__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with _span(span_name, category, {}):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _span(span_name, category, {}):
+            return func(*args, **kwargs)
+    return wrapper
+
+def flush_trace(path: Optional[str] = None, trace_format: Optional[str] = None) -> Optional[str]:
+    """
+        Writes the recorded spans to the trace file and clears them from memory. A Chrome trace holds one process:
+        its first flush replaces whatever file is at the path and later flushes add to it. Log files are appended to.
+
+        Args:
+            path (str, optional): The output file. Defaults to tracing_settings["path"].
+            trace_format (str, optional): "chrome" or "log". Defaults to tracing_settings["format"].
+
+        Returns:
+            str | None: The file written to, or None if there was nothing to write.
+    """
+    path = path or tracing_settings["path"]
+    trace_format = trace_format or tracing_settings["format"]
+    with _events_lock:
+        events = list(_events)
+        _events.clear()
+    if not events:
+        return None
+
+    with _flush_lock:
+        if trace_format == "chrome":
+            # A Chrome trace is a single JSON document, so events from this process's earlier flushes are merged in
+            existing = []
+            if path in _chrome_paths and os.path.exists(path):
+                with open(path, "r") as file:
+                    existing = json.load(file).get("traceEvents", [])
+            with open(path, "w") as file:
+                json.dump({"traceEvents": existing + events, "displayTimeUnit": "ms"}, file, default=str)
+            _chrome_paths.add(path)
+        else:
+            with open(path, "a") as file:
+                file.writelines(json.dumps(event, default=str) + "\n" for event in events)
+    return path
+
+if _level > 0:
+    atexit.register(flush_trace)